@@ -0,0 +1,339 @@
+import csv
+import sys
+import json
+import argparse
+import itertools
+from datetime import datetime, timezone
+
+import numpy as np
+
+from mq_driver import LatencyHistogram
+
+# =========================
+# Settings
+# =========================
+ID_COLUMNS = ("messageId", "uniqueMessageId")  # JMeter sample_variables / mq_driver.py JTL
+DIMENSIONS = ("size", "count", "baseXml")
+UNMATCHED = "(no match)"
+DEFAULT_SIZE_EDGES_MB = "0.5,1,2,5,10"
+PERCENTILES = (50, 90, 95, 99)
+
+
+# =========================
+# Generator metadata
+# =========================
+def _size_bucket_names(edges):
+    # Buckets include their upper edge: a 2 MB record is in "1-2MB"
+    names = [f"<={edges[0]:g}MB"]
+    names += [f"{lo:g}-{hi:g}MB" for lo, hi in zip(edges, edges[1:])]
+    names.append(f">{edges[-1]:g}MB")
+    return ["none"] + names
+
+
+class RecordMetadata:
+    """
+    messageId -> (size bucket, attachment count, base XML) codes for every
+    row of the generator CSV(s), with the codes held in NumPy arrays so a
+    JTL chunk is mapped to its groups with a few fancy-indexing operations.
+    """
+
+    def __init__(self, csv_paths, size_edges_mb):
+        self.size_edges = np.asarray(size_edges_mb, dtype=np.float64)
+        self.index = {}
+        self.groups = {"size": _size_bucket_names(size_edges_mb), "count": [], "baseXml": []}
+        lookup = {"count": {}, "baseXml": {}}
+        codes = {dim: [] for dim in DIMENSIONS}
+        for path in csv_paths:
+            with open(path, newline="") as f:
+                for row in csv.DictReader(f):
+                    if row["messageId"] in self.index:
+                        continue
+                    self.index[row["messageId"]] = len(self.index)
+                    if row["hasAttachments"] != "true":
+                        codes["size"].append(0)
+                    else:
+                        total_mb = float(row["attachmentsTotalMB"] or 0)
+                        codes["size"].append(1 + int(np.searchsorted(self.size_edges, total_mb, side="left")))
+                    for dim, column in (("count", "attachmentCount"), ("baseXml", "baseXml")):
+                        value = row[column]
+                        if value not in lookup[dim]:
+                            lookup[dim][value] = len(self.groups[dim])
+                            self.groups[dim].append(value)
+                        codes[dim].append(lookup[dim][value])
+        for dim in DIMENSIONS:
+            # Last code is "no match" for samples whose messageId is not in the CSV
+            self.groups[dim].append(UNMATCHED)
+            codes[dim].append(len(self.groups[dim]) - 1)
+        self.codes = {dim: np.asarray(codes[dim], dtype=np.int64) for dim in DIMENSIONS}
+
+    def rows_for(self, message_ids):
+        """
+        Metadata row per messageId; unknown ids map to the trailing "no match" row.
+        """
+        unmatched = len(self.index)
+        return np.fromiter((self.index.get(m, unmatched) for m in message_ids), dtype=np.int64,
+                           count=len(message_ids))
+
+    def __len__(self):
+        return len(self.index)
+
+
+# =========================
+# Streaming aggregation
+# =========================
+class GroupStats:
+    """
+    Running count, errors, bytes, first/last timestamp and latency histogram
+    for one (label, group) pair.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.first_ms = None
+        self.last_ms = None
+        self.histogram = LatencyHistogram()
+
+    def add(self, timestamps, latencies_ms, success, nbytes):
+        self.count += int(timestamps.size)
+        self.errors += int(np.count_nonzero(~success))
+        self.bytes += int(nbytes.sum())
+        first, last = int(timestamps.min()), int(timestamps.max())
+        self.first_ms = first if self.first_ms is None else min(self.first_ms, first)
+        self.last_ms = last if self.last_ms is None else max(self.last_ms, last)
+        valid = latencies_ms[~np.isnan(latencies_ms)]
+        self.histogram.record_array(valid * 1000)
+
+    def summary(self):
+        seconds = max((self.last_ms or 0) - (self.first_ms or 0), 1) / 1000
+        latency = self.histogram.summary_ms(PERCENTILES)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "error_percent": 100.0 * self.errors / self.count if self.count else 0.0,
+            "throughput_per_s": self.count / seconds,
+            "mb": self.bytes / (1024 * 1024),
+            "latency_ms": latency,
+        }
+
+
+def _float_column(values):
+    """
+    Strings -> float64, with empty cells as NaN (e.g. an unset sample variable).
+    """
+    column = np.asarray(values, dtype=object)
+    column[column == ""] = "nan"
+    return column.astype(np.float64)
+
+
+def _split_by(keys, *arrays):
+    """
+    Group the arrays by integer key: yields (key, sliced arrays...) once per
+    distinct key, using one stable sort instead of a mask per group.
+    """
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    unique, starts = np.unique(sorted_keys, return_index=True)
+    bounds = list(starts[1:]) + [len(keys)]
+    for key, start, end in zip(unique, starts, bounds):
+        picked = order[start:end]
+        yield int(key), [a[picked] for a in arrays]
+
+
+class ResultsAnalyzer:
+    """
+    Reads a JMeter CSV JTL in fixed-size chunks, joins every sample to the
+    generator metadata on messageId and folds it into per-label and
+    per-group histograms plus a per-interval timeline. State depends on the
+    number of labels, groups and intervals, never on the number of samples.
+    """
+
+    def __init__(self, metadata, metric="elapsed", interval_s=10, id_column=None):
+        self.metadata = metadata
+        self.metric = metric
+        self.interval_ms = max(int(interval_s * 1000), 1)
+        self.id_column = id_column
+        self.labels = []
+        self._label_codes = {}
+        self.overall = {}  # label -> GroupStats
+        self.by_group = {dim: {} for dim in DIMENSIONS}  # dim -> (label, group) -> GroupStats
+        self.timeline = {}  # (interval, label) -> [count, errors, latency_sum, latency_n, latency_max]
+        self.samples = 0
+        self.matched = 0
+        self.skipped = 0  # rows whose field count does not match the header
+
+    def _label_ids(self, labels):
+        unique, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+        # Register new labels in order of appearance so the report order does not depend on chunking
+        for position in np.argsort(first):
+            label = str(unique[position])
+            if label not in self._label_codes:
+                self._label_codes[label] = len(self.labels)
+                self.labels.append(label)
+        ids = [self._label_codes[str(label)] for label in unique]
+        return np.asarray(ids, dtype=np.int64)[inverse]
+
+    def add_chunk(self, header, rows):
+        if not rows:
+            return
+        columns = dict(zip(header, zip(*rows)))
+        timestamps = np.asarray(columns["timeStamp"], dtype=np.int64)
+        latencies = _float_column(columns[self.metric])
+        success = np.asarray(columns["success"]) == "true"
+        nbytes = np.asarray(columns.get("bytes", ("0",) * len(rows)), dtype=np.int64)
+        label_ids = self._label_ids(np.asarray(columns["label"]))
+        meta_rows = self.metadata.rows_for(columns[self.id_column]) if self.id_column else \
+            np.full(len(rows), len(self.metadata), dtype=np.int64)
+        self.samples += len(rows)
+        self.matched += int(np.count_nonzero(meta_rows < len(self.metadata)))
+
+        arrays = (timestamps, latencies, success, nbytes)
+        for label_id, sliced in _split_by(label_ids, *arrays):
+            self.overall.setdefault(self.labels[label_id], GroupStats()).add(*sliced)
+        for dim in DIMENSIONS:
+            group_codes = self.metadata.codes[dim][meta_rows]
+            width = len(self.metadata.groups[dim])
+            for key, sliced in _split_by(label_ids * width + group_codes, *arrays):
+                label, group = self.labels[key // width], self.metadata.groups[dim][key % width]
+                self.by_group[dim].setdefault((label, group), GroupStats()).add(*sliced)
+
+        valid = ~np.isnan(latencies)
+        intervals = timestamps // self.interval_ms
+        start = int(intervals.min())
+        width = len(self.labels)
+        keys = (intervals - start) * width + label_ids
+        for key, (lat, ok, mask) in _split_by(keys, latencies, success, valid):
+            entry = self.timeline.setdefault((start + key // width, self.labels[key % width]), [0, 0, 0.0, 0, 0.0])
+            entry[0] += int(lat.size)
+            entry[1] += int(np.count_nonzero(~ok))
+            if mask.any():
+                entry[2] += float(lat[mask].sum())
+                entry[3] += int(np.count_nonzero(mask))
+                entry[4] = max(entry[4], float(lat[mask].max()))
+
+    def analyze(self, jtl_path, chunk_rows=50000):
+        with open(jtl_path, newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            for column in ("timeStamp", "label", "success", self.metric):
+                if column not in header:
+                    raise ValueError(f"{jtl_path}: missing column '{column}' (save it in the JTL config)")
+            if self.id_column is None:
+                self.id_column = next((c for c in ID_COLUMNS if c in header), None)
+            elif self.id_column not in header:
+                raise ValueError(f"{jtl_path}: missing id column '{self.id_column}'")
+            if self.id_column is None:
+                print("WARNING: No messageId column in the JTL (add sample_variables=uniqueMessageId to "
+                      "user.properties); reporting without the metadata join", file=sys.stderr)
+            skipped = 0
+            while True:
+                chunk = list(itertools.islice(reader, chunk_rows))
+                if not chunk:
+                    break
+                rows = [row for row in chunk if len(row) == len(header)]
+                skipped += len(chunk) - len(rows)
+                self.add_chunk(header, rows)
+        if skipped:
+            print(f"WARNING: Skipped {skipped} row(s) of {jtl_path} whose field count does not match the header",
+                  file=sys.stderr)
+        self.skipped += skipped
+        return self
+
+    def report(self):
+        return {
+            "samples": self.samples,
+            "matched": self.matched,
+            "skipped_rows": self.skipped,
+            "metric": self.metric,
+            "overall": {label: self.overall[label].summary() for label in self.labels},
+            "groups": {
+                dim: [dict(label=label, group=group, **stats.summary())
+                      for (label, group), stats in sorted(groups.items(), key=lambda kv: self._group_order(dim, kv[0]))]
+                for dim, groups in self.by_group.items()
+            },
+        }
+
+    def _group_order(self, dim, key):
+        label, group = key
+        if dim == "count":
+            return self._label_codes[label], int(group) if group.isdigit() else float("inf")
+        return self._label_codes[label], self.metadata.groups[dim].index(group)
+
+    def write_timeline(self, path):
+        interval_s = self.interval_ms / 1000
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["start", "label", "samples", "errors", "throughput_per_s", "mean_ms", "max_ms"])
+            for (interval, label), (count, errors, total, n, peak) in sorted(self.timeline.items()):
+                start = datetime.fromtimestamp(interval * interval_s, tz=timezone.utc).isoformat(timespec="milliseconds")
+                writer.writerow([start, label, count, errors, f"{count / interval_s:.2f}",
+                                 f"{total / n:.1f}" if n else "", f"{peak:.0f}" if n else ""])
+
+
+# =========================
+# Output
+# =========================
+def _print_table(title, rows):
+    print(f"\n{title}")
+    print(f"{'label':<34} {'group':<14} {'samples':>8} {'err%':>6} {'/s':>8} {'mean':>8} "
+          + " ".join(f"{'p' + str(p):>8}" for p in PERCENTILES) + f" {'max':>8}")
+    for row in rows:
+        latency = row["latency_ms"]
+        print(f"{row['label'][:34]:<34} {row.get('group', '')[:14]:<14} {row['count']:>8} "
+              f"{row['error_percent']:>6.2f} {row['throughput_per_s']:>8.1f} {latency['mean']:>8.1f} "
+              + " ".join(f"{latency['p' + str(p)]:>8.1f}" for p in PERCENTILES) + f" {latency['max']:>8.1f}")
+
+
+def print_report(report):
+    print(f"Samples: {report['samples']}, joined to generator metadata: {report['matched']}, "
+          f"malformed rows skipped: {report['skipped_rows']} (latency column: {report['metric']}, ms)")
+    _print_table("Overall", [dict(label=label, **stats) for label, stats in report["overall"].items()])
+    titles = {"size": "By attachment size (each bucket includes its upper edge)", "count": "By attachment count", "baseXml": "By base XML"}
+    if report["matched"]:
+        for dim in DIMENSIONS:
+            _print_table(titles[dim], report["groups"][dim])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Join a JMeter JTL with generator CSV metadata on messageId and report latency by group.")
+    parser.add_argument("jtl", type=str, help="JMeter CSV results (e.g. results_summary.csv or mq_driver.py --jtl)")
+    parser.add_argument("--data", type=str, nargs="+", default=[],
+                        help="Generator CSV(s) with messageId/hasAttachments/attachmentCount/attachmentsTotalMB/baseXml")
+    parser.add_argument("--id-column", type=str, default=None,
+                        help=f"JTL column holding the messageId (default: first of {', '.join(ID_COLUMNS)})")
+    parser.add_argument("--metric", type=str, default="elapsed",
+                        help="Latency column in ms (e.g. elapsed, Latency, or e2e_latency via sample_variables)")
+    parser.add_argument("--size-buckets", type=str, default=DEFAULT_SIZE_EDGES_MB,
+                        help="Attachment size bucket edges in MB; each bucket includes its upper edge")
+    parser.add_argument("--interval", type=float, default=10.0, help="Timeline bucket width in seconds")
+    parser.add_argument("--chunk-rows", type=int, default=50000, help="JTL rows processed per chunk")
+    parser.add_argument("--output-json", type=str, default=None, help="Write the full report as JSON")
+    parser.add_argument("--timeline-csv", type=str, default=None,
+                        help="Write per-interval throughput and latency per label as CSV")
+    args = parser.parse_args()
+
+    edges = sorted(float(x) for x in args.size_buckets.split(",") if x.strip())
+    if not edges or args.interval <= 0 or args.chunk_rows < 1:
+        raise ValueError("--size-buckets needs at least one edge; --interval and --chunk-rows must be positive")
+
+    metadata = RecordMetadata(args.data, edges)
+    if args.data:
+        print(f"Loaded metadata for {len(metadata)} records from {len(args.data)} CSV file(s)")
+    analyzer = ResultsAnalyzer(metadata, args.metric, args.interval, args.id_column).analyze(args.jtl, args.chunk_rows)
+    report = analyzer.report()
+    print_report(report)
+
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved: {args.output_json}")
+    if args.timeline_csv:
+        analyzer.write_timeline(args.timeline_csv)
+        print(f"Timeline saved: {args.timeline_csv}")
+    return 0 if report["samples"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
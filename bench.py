@@ -0,0 +1,330 @@
+import os
+import io
+import sys
+import csv
+import json
+import time
+import socket
+import logging
+import argparse
+import importlib.util
+import platform
+import statistics
+import subprocess
+import contextlib
+from datetime import datetime, timezone
+import xml.etree.ElementTree as ET
+
+import generator
+
+# =========================
+# Benchmark settings
+# =========================
+BENCH_SEED = 1
+BENCH_BUCKET = "bench-bucket"
+DEFAULT_SIZES_MB = "0.1,0.5,1,2"
+DEFAULT_COUNTS = "1,3,5"
+DEFAULT_WORKERS = "1,2,4"
+BENCH_POOL_SIZE = 16
+
+
+# =========================
+# Timing helpers
+# =========================
+def _parse_list(text, cast=float):
+    return [cast(x) for x in text.split(",") if x.strip()]
+
+
+def _time_call(fn, repeat=3, warmup=1):
+    """
+    Run fn() warmup + repeat times with generator output silenced and return
+    the timings of the measured runs in seconds.
+    """
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for run in range(warmup + repeat):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            if run >= warmup:
+                timings.append(elapsed)
+    return timings
+
+
+def _result(name, params, timings, mb=0.0, records=0):
+    """
+    Summarise timings for one benchmark case; throughput uses the median.
+    """
+    median = statistics.median(timings)
+    result = {
+        "name": name,
+        "params": params,
+        "runs": len(timings),
+        "median_s": median,
+        "min_s": min(timings),
+        "max_s": max(timings),
+    }
+    if mb:
+        result["mb"] = mb
+        result["mb_s"] = mb / median if median else 0.0
+    if records:
+        result["records"] = records
+        result["records_s"] = records / median if median else 0.0
+    print(f"{name:<60} median {median * 1000:9.1f} ms"
+          + (f"  {result['mb_s']:8.1f} MB/s" if mb else "")
+          + (f"  {result['records_s']:8.1f} rec/s" if records else ""))
+    return result
+
+
+def _case_name(stage, **params):
+    return f"{stage}[" + ",".join(f"{k}={v}" for k, v in params.items()) + "]"
+
+
+# =========================
+# Stage benchmarks
+# =========================
+def bench_image(repeat):
+    return [_result("generate_large_image", {}, _time_call(generator.generate_large_image, repeat))]
+
+
+def bench_pdf(sizes_mb, backends, repeat, pool_size=BENCH_POOL_SIZE):
+    """
+    Every image backend is measured with the same pool of `pool_size` pages
+    and with fresh pages (pool=0), so backends are compared like for like.
+    """
+    results = []
+    pool = generator.JpegPool.build(pool_size) if pool_size else None
+    for backend in backends:
+        pools = [0] if backend == "raw" else sorted({pool_size, 0}, reverse=True)
+        for size in pools:
+            for size_mb in sizes_mb:
+                timings = _time_call(lambda: generator.generate_pdf_of_size(
+                    size_mb, backend=backend, image_pool=pool if size else None), repeat)
+                params = {"backend": backend, "pool": size, "size_mb": size_mb}
+                results.append(_result(_case_name("generate_pdf_of_size", **params), params, timings, mb=size_mb))
+    return results
+
+
+def bench_inject(base_xml, sizes_mb, counts, repeat):
+    """
+    inject_attachments_multiple on a freshly parsed base XML, with already
+    encoded payloads so only the XML work is measured.
+    """
+    results = []
+    for size_mb in sizes_mb:
+        b64 = "A" * (generator._bytes_from_mb(size_mb) * 4 // 3)
+        for count in counts:
+            pairs = [(f"bench_{idx}.pdf", b64) for idx in range(count)]
+
+            def run():
+                tree = ET.parse(base_xml)
+                ns = generator._infer_namespace_from_tree(tree)
+                generator.inject_attachments_multiple(tree.getroot(), ns, pairs)
+                tree.write(io.BytesIO(), encoding="utf-8", xml_declaration=True)
+
+            params = {"size_mb": size_mb, "count": count}
+            results.append(_result(_case_name("inject_attachments_multiple", **params), params,
+                                   _time_call(run, repeat), mb=size_mb * count))
+    return results
+
+
+def bench_record(base_xml, sizes_mb, counts, repeat, pdf_backend, xml_backend):
+    """
+    One full generate_and_update record (in memory) per size and count.
+    """
+    results = []
+    for size_mb in sizes_mb:
+        for count in counts:
+            total_mb = min(size_mb * count, generator.MAX_TOTAL_ATTACHMENTS_MB)
+
+            def run():
+                generator.generate_and_update(
+                    0, base_xml, None, 0,
+                    attachments_total_mb=total_mb,
+                    attachment_max_mb=size_mb,
+                    pdf_backend=pdf_backend,
+                    image_pool_size=16,
+                    xml_backend=xml_backend,
+                    seed=BENCH_SEED,
+                    fixed_time=generator.SEED_EPOCH,
+                )
+
+            params = {"size_mb": size_mb, "count": count, "pdf_backend": pdf_backend, "xml_backend": xml_backend}
+            results.append(_result(_case_name("generate_and_update", **params), params,
+                                   _time_call(run, repeat), mb=total_mb, records=1))
+    return results
+
+
+# =========================
+# End-to-end benchmarks
+# =========================
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def local_s3():
+    """
+    Run a moto S3 server on a free local port with the benchmark bucket
+    created; yields its endpoint URL.
+    """
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    port = _free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    endpoint_url = f"http://127.0.0.1:{port}"
+    try:
+        import boto3
+        boto3.client("s3", endpoint_url=endpoint_url, region_name="us-east-1", aws_access_key_id="bench",
+                     aws_secret_access_key="bench").create_bucket(Bucket=BENCH_BUCKET)
+        yield endpoint_url
+    finally:
+        server.stop()
+
+
+def _run_main(num, workers, base_xml, total_mb, max_mb, extra_args, env):
+    """
+    Run generator.py as a subprocess and return (seconds, output MB).
+    Generated XMLs and the CSV are removed afterwards.
+    """
+    csv_name = os.path.join(generator.OUTPUT_DIR, f"bench_{os.getpid()}_{time.time_ns()}.csv")
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "generator.py"),
+           "--num", str(num), "--workers", str(workers), "--seed", str(BENCH_SEED),
+           "--base-xml", base_xml, "--csv-name", csv_name,
+           "--attachments-total-mb", str(total_mb), "--attachment-max-mb", str(max_mb)] + extra_args
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, env=env, stdout=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+
+    total_bytes = 0
+    with open(csv_name, newline="") as f:
+        for row in csv.DictReader(f):
+            path = os.path.join(generator.OUTPUT_DIR, row["filename"])
+            if os.path.exists(path):
+                total_bytes += os.path.getsize(path)
+                os.remove(path)
+    os.remove(csv_name)
+    return elapsed, total_bytes / (1024 * 1024)
+
+
+def bench_end_to_end(base_xml, workers_list, num, total_mb, max_mb, repeat, with_s3):
+    results = []
+    targets = ["local"]
+    if with_s3:
+        if importlib.util.find_spec("moto") is None:
+            print("moto is not installed; skipping the S3 end-to-end benchmark")
+        else:
+            targets.append("s3")
+    for target in targets:
+        env = dict(os.environ)
+        extra_args = []
+        with (local_s3() if target == "s3" else contextlib.nullcontext()) as endpoint_url:
+            if endpoint_url:
+                env.update(AWS_ACCESS_KEY_ID="bench", AWS_SECRET_ACCESS_KEY="bench", AWS_DEFAULT_REGION="us-east-1")
+                extra_args = ["--upload-s3", "--s3-bucket", BENCH_BUCKET, "--s3-endpoint-url", endpoint_url,
+                              "--keep-local"]
+            for workers in workers_list:
+                runs = [_run_main(num, workers, base_xml, total_mb, max_mb, extra_args, env) for _ in range(repeat)]
+                params = {"target": target, "workers": workers, "num": num, "total_mb": total_mb}
+                results.append(_result(_case_name("main", **params), params, [t for t, _ in runs],
+                                       mb=runs[0][1], records=num))
+    return results
+
+
+# =========================
+# Baseline comparison
+# =========================
+def compare(baseline_path, current, threshold):
+    """
+    Print median time ratios (current / baseline) for cases present in both
+    runs; returns the names of cases slower than 1 + threshold.
+    """
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = []
+    print(f"\nComparison against {baseline_path}:")
+    for result in current["results"]:
+        base = baseline.get(result["name"])
+        if base is None:
+            continue
+        ratio = result["median_s"] / base["median_s"] if base["median_s"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(result["name"])
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{result['name']:<60} {base['median_s'] * 1000:9.1f} -> {result['median_s'] * 1000:9.1f} ms"
+              f"  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generator.py stages and end-to-end throughput (no network).")
+    parser.add_argument("--base-xml", type=str, default="IE3F32.xml", help="Base XML used for the XML and record stages")
+    parser.add_argument("--sizes-mb", type=str, default=DEFAULT_SIZES_MB, help="Comma-separated attachment sizes in MB")
+    parser.add_argument("--counts", type=str, default=DEFAULT_COUNTS, help="Comma-separated attachment counts")
+    parser.add_argument("--workers", type=str, default=DEFAULT_WORKERS, help="Comma-separated worker counts for end-to-end runs")
+    parser.add_argument("--stages", type=str, default="image,pdf,inject,record,e2e",
+                        help="Comma-separated stages to run: image,pdf,inject,record,e2e")
+    parser.add_argument("--pdf-backends", type=str, default="direct,reportlab", help="PDF backends to benchmark")
+    parser.add_argument("--pdf-pool-size", type=int, default=BENCH_POOL_SIZE,
+                        help="Image pool shared by every PDF backend; each is also run unpooled (0 = unpooled only)")
+    parser.add_argument("--repeat", type=int, default=3, help="Measured runs per case (median is reported)")
+    parser.add_argument("--e2e-num", type=int, default=20, help="Records per end-to-end run")
+    parser.add_argument("--e2e-total-mb", type=float, default=4.0, help="Attachment MB per record for end-to-end runs")
+    parser.add_argument("--e2e-max-mb", type=float, default=2.0, help="Max MB per attachment for end-to-end runs")
+    parser.add_argument("--no-s3", action="store_true", help="Skip the end-to-end run against a local moto S3 server")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write results JSON here (default: bench_results_<timestamp>.json)")
+    parser.add_argument("--compare", type=str, default=None, metavar="BASELINE",
+                        help="Compare against a baseline results JSON; exits 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative slowdown counted as a regression in --compare (default 0.10)")
+    args = parser.parse_args()
+
+    sizes_mb = _parse_list(args.sizes_mb)
+    counts = _parse_list(args.counts, int)
+    workers = _parse_list(args.workers, int)
+    stages = set(_parse_list(args.stages, str))
+    os.makedirs(generator.OUTPUT_DIR, exist_ok=True)
+
+    results = []
+    if "image" in stages:
+        results += bench_image(args.repeat)
+    if "pdf" in stages:
+        results += bench_pdf(sizes_mb, _parse_list(args.pdf_backends, str), args.repeat, args.pdf_pool_size)
+    if "inject" in stages:
+        results += bench_inject(args.base_xml, sizes_mb, counts, args.repeat)
+    if "record" in stages:
+        for xml_backend in sorted(generator.XML_BACKENDS):
+            results += bench_record(args.base_xml, sizes_mb, counts, args.repeat, "direct", xml_backend)
+    if "e2e" in stages:
+        results += bench_end_to_end(args.base_xml, workers, args.e2e_num, args.e2e_total_mb, args.e2e_max_mb,
+                                    args.repeat, not args.no_s3)
+
+    report = {
+        "created": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    output = args.output or f"bench_results_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results saved: {output}")
+
+    if args.compare:
+        regressions = compare(args.compare, report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
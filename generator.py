@@ -1,4 +1,3 @@
-
 import os
 import base64
 import uuid
@@ -6,20 +5,38 @@ import random
 import csv
 from datetime import datetime, timezone
 import xml.etree.ElementTree as ET
-from concurrent.futures import ProcessPoolExecutor
-from botocore.exceptions import ClientError
+import xml.parsers.expat
+import binascii
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 import argparse
-import boto3
+import threading
+import time
 import shutil
 from functools import partial
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
 import io
-from reportlab.lib.utils import ImageReader
-import numpy as np
-from PIL import Image
-from PyPDF2 import PdfWriter, PdfReader
 import copy
+import re
+import json
+import mmap
+import struct
+import hashlib
+from contextlib import contextmanager, ExitStack
+import tarfile
+import itertools
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import zipfile
+import heapq
+import tempfile
+from multiprocessing import shared_memory, resource_tracker
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# boto3/botocore, numpy, PIL, reportlab and PyPDF2 are imported inside the
+# functions that need them, so cleanup-only runs never load the PDF stack and
+# generation runs never load boto3 in the workers.
 
 # =========================
 # Constants & global config
@@ -39,11 +56,130 @@ IMG_HEIGHT = 800
 JPEG_QUALITY = 60  # balanced size/quality
 
 
+# =========================
+# Logging & stage metrics
+# =========================
+# 0 = quiet (errors and the final summary line), 1 = normal, 2 = verbose
+# (one line per PDF, XML and upload)
+VERBOSITY = 1
+
+
+def log(message, level=1):
+    if VERBOSITY >= level:
+        print(message)
+
+
+def _set_verbosity(level):
+    """
+    Carry the parent's -q/-v level into a worker process (see _init_worker).
+    """
+    global VERBOSITY
+    VERBOSITY = level
+
+
+class StageMetrics:
+    """
+    Per-process timers and byte counters for the generation stages.
+
+    Nested stages are timed exclusively: time spent in an inner stage (image
+    encoding inside PDF assembly, disk writes inside streaming base64) is not
+    counted again in the outer one, so the stage totals add up to busy time.
+    Thread-safe; snapshot() returns plain dicts that pickle back to the parent.
+    """
+
+    STAGES = ("image", "pdf", "base64", "xml", "write", "archive", "upload", "csv", "serve")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.bytes = dict.fromkeys(self.STAGES, 0)
+        self.calls = dict.fromkeys(self.STAGES, 0)
+        self.records = 0
+
+    @contextmanager
+    def stage(self, name):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)  # time spent in nested stages
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.add(name, seconds=elapsed - nested)
+
+    def add(self, name, seconds=0.0, nbytes=0, calls=1):
+        with self._lock:
+            self.seconds[name] += seconds
+            self.bytes[name] += nbytes
+            self.calls[name] += calls
+
+    def add_bytes(self, name, nbytes):
+        self.add(name, nbytes=nbytes, calls=0)
+
+    def add_record(self):
+        with self._lock:
+            self.records += 1
+
+    def snapshot(self):
+        """
+        Cumulative counters for this process, plus its CPU time and peak RSS.
+        """
+        with self._lock:
+            return {
+                "records": self.records,
+                "seconds": dict(self.seconds),
+                "bytes": dict(self.bytes),
+                "calls": dict(self.calls),
+                "cpu_seconds": time.process_time(),
+                "max_rss_bytes": _max_rss_bytes(),
+            }
+
+
+def _max_rss_bytes():
+    if resource is None:
+        return 0
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# One collector per process; workers send snapshots back with each record
+METRICS = StageMetrics()
+
+
 # ================
 # S3 Helper funcs
 # ================
+# Settings for the shared client; main() fills these from the CLI
+S3_CLIENT_SETTINGS = {"endpoint_url": None, "max_pool_connections": 10}
+_S3_CLIENT = None
+
+
+def _get_s3_client():
+    """
+    Return this process's shared S3 client, created on first use. boto3
+    clients are thread-safe, so upload threads all share its connection pool.
+    """
+    global _S3_CLIENT
+    if _S3_CLIENT is None:
+        import boto3
+        from botocore.config import Config
+        _S3_CLIENT = boto3.client(
+            's3',
+            endpoint_url=S3_CLIENT_SETTINGS["endpoint_url"],
+            config=Config(max_pool_connections=S3_CLIENT_SETTINGS["max_pool_connections"]),
+        )
+    return _S3_CLIENT
+
+
 def download_csv_from_s3(bucket_name, s3_key, local_file_path):
-    s3 = boto3.client('s3')
+    from botocore.exceptions import ClientError
+    s3 = _get_s3_client()
     try:
         s3.download_file(bucket_name, s3_key, local_file_path)
         print(f"Downloaded CSV from s3://{bucket_name}/{s3_key} to {local_file_path}")
@@ -56,7 +192,8 @@ def download_csv_from_s3(bucket_name, s3_key, local_file_path):
 
 
 def delete_csv_from_s3(bucket_name, csv_key):
-    s3 = boto3.client('s3')
+    from botocore.exceptions import ClientError
+    s3 = _get_s3_client()
     try:
         s3.delete_object(Bucket=bucket_name, Key=csv_key)
         print(f"Deleted CSV from s3://{bucket_name}/{csv_key}")
@@ -69,38 +206,386 @@ def delete_csv_from_s3(bucket_name, csv_key):
 
 
 def upload_to_s3(file_path, bucket_name, s3_key):
-    s3 = boto3.client('s3')
-    s3.upload_file(file_path, bucket_name, s3_key)
-    print(f"Uploaded {file_path} to s3://{bucket_name}/{s3_key}")
+    s3 = _get_s3_client()
+    with METRICS.stage("upload"):
+        s3.upload_file(file_path, bucket_name, s3_key)
+    METRICS.add_bytes("upload", os.path.getsize(file_path))
+    log(f"Uploaded {file_path} to s3://{bucket_name}/{s3_key}")
 
 
 def upload_to_s3_from_memory(buffer, bucket_name, key):
-    s3 = boto3.client('s3')
-    s3.upload_fileobj(buffer, bucket_name, key)
-    print(f"Uploaded to s3://{bucket_name}/{key}")
+    s3 = _get_s3_client()
+    with METRICS.stage("upload"):
+        s3.upload_fileobj(buffer, bucket_name, key)
+    METRICS.add_bytes("upload", buffer.getbuffer().nbytes)
+    log(f"Uploaded to s3://{bucket_name}/{key}", level=2)
+
+
+S3_DELETE_BATCH = 1000  # delete_objects rejects larger batches
+S3_DELETE_RETRIES = 3
+
+
+def _delete_s3_batch(bucket_name, keys):
+    """
+    Delete up to S3_DELETE_BATCH keys. Per-key errors reported by the API
+    (and failures of the whole call) are retried with backoff.
+    Returns (deleted_count, [error dicts still failing]).
+    """
+    from botocore.exceptions import ClientError
+    s3 = _get_s3_client()
+    remaining = list(keys)
+    errors = []
+    for attempt in range(S3_DELETE_RETRIES + 1):
+        if attempt:
+            time.sleep(0.5 * 2 ** (attempt - 1))
+        try:
+            response = s3.delete_objects(
+                Bucket=bucket_name,
+                Delete={'Objects': [{'Key': key} for key in remaining], 'Quiet': True}
+            )
+        except ClientError as e:
+            errors = [{'Key': key, 'Code': e.response['Error']['Code'], 'Message': str(e)} for key in remaining]
+            continue
+        errors = response.get('Errors', [])
+        if not errors:
+            break
+        remaining = [err['Key'] for err in errors]
+    return len(keys) - len(errors), errors
+
 
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-def cleanup_s3_from_csv(bucket_name, csv_path):
-    s3 = boto3.client('s3')
-    objects_to_delete = []
 
+def delete_s3_keys(bucket_name, keys, concurrency=8):
+    """
+    Delete an iterable of keys in 1,000-key batches issued concurrently.
+    Returns (deleted_count, errors).
+    """
+    deleted = 0
+    errors = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="s3-delete") as executor:
+        delete_batch = partial(_delete_s3_batch, bucket_name)
+        for batch_deleted, batch_errors in _imap_bounded(executor, delete_batch,
+                                                         _batched(keys, S3_DELETE_BATCH), 2 * concurrency):
+            deleted += batch_deleted
+            errors.extend(batch_errors)
+    for err in errors[:10]:
+        print(f"Error: could not delete s3://{bucket_name}/{err['Key']}: {err.get('Code')} {err.get('Message', '')}")
+    if len(errors) > 10:
+        print(f"... and {len(errors) - 10} more delete errors")
+    return deleted, errors
+
+
+def _s3_keys_from_csv(rows):
+    """
+    Object keys referenced by CSV rows: the record itself, or for archive
+    output its shard and the shard's index (once per shard).
+    """
+    shards = set()
+    for row in rows:
+        shard = row.get("shard")
+        if not shard:
+            yield f"test_xmls/{row['filename']}"
+        elif shard not in shards:
+            shards.add(shard)
+            yield f"test_xmls/{shard}"
+            yield f"test_xmls/{shard}.index.json"
+
+
+def cleanup_s3_from_csv(bucket_name, csv_path, concurrency=8):
     if not os.path.exists(csv_path):
         print(f"CSV file not found locally: {csv_path}")
         return
 
     with open(csv_path, newline='') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            key = f"test_xmls/{row['filename']}"
-            objects_to_delete.append({'Key': key})
-
-    if objects_to_delete:
-        s3.delete_objects(Bucket=bucket_name, Delete={'Objects': objects_to_delete})
-        print(f"Deleted {len(objects_to_delete)} objects from s3://{bucket_name}")
+        deleted, errors = delete_s3_keys(bucket_name, _s3_keys_from_csv(csv.DictReader(f)), concurrency)
+
+    if deleted or errors:
+        print(f"Deleted {deleted} objects from s3://{bucket_name} ({len(errors)} failed)")
     else:
         print("No objects found to delete.")
 
 
+def cleanup_s3_by_prefix(bucket_name, prefix, concurrency=8):
+    """
+    Delete every object under `prefix`, for when the run's CSV is lost.
+    Listing pages (≤ 1,000 keys each) are deleted while listing continues.
+    """
+    s3 = _get_s3_client()
+    paginator = s3.get_paginator('list_objects_v2')
+    keys = (obj['Key']
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+            for obj in page.get('Contents', []))
+    deleted, errors = delete_s3_keys(bucket_name, keys, concurrency)
+    print(f"Deleted {deleted} objects under s3://{bucket_name}/{prefix} ({len(errors)} failed)")
+
+
+class S3UploadStage:
+    """
+    Concurrent upload stage fed while generation is still running. All
+    uploads share one client whose connection pool is sized to the stage, and
+    large files go up as parallel multipart uploads per `TransferConfig`.
+
+    submit() blocks once `max_pending` uploads are queued, which applies
+    backpressure to generation instead of piling up staged files.
+    """
+
+    def __init__(self, bucket_name, concurrency=8, multipart_threshold_mb=8, multipart_chunksize_mb=8,
+                 multipart_concurrency=4, delete_after_upload=False, max_pending=None, sync=None):
+        from boto3.s3.transfer import TransferConfig
+        self.bucket_name = bucket_name
+        self.delete_after_upload = delete_after_upload
+        self.sync = sync
+        self.transfer_config = TransferConfig(
+            multipart_threshold=_bytes_from_mb(multipart_threshold_mb),
+            multipart_chunksize=_bytes_from_mb(multipart_chunksize_mb),
+            max_concurrency=multipart_concurrency,
+        )
+        self.client = _get_s3_client()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="s3-upload")
+        self._slots = threading.BoundedSemaphore(max_pending or 4 * concurrency)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self.files_uploaded = 0
+        self.bytes_uploaded = 0
+        self.started = time.monotonic()
+
+    def _upload(self, file_path, key, result):
+        try:
+            size = os.path.getsize(file_path)
+            # With --s3-sync, a loose record the bucket already holds is not PUT again
+            entry = result[0][1] if self.sync is not None and result else None
+            if entry is not None and self.sync.unchanged(file_path, key, entry):
+                log(f"Unchanged, skipped s3://{self.bucket_name}/{key}", level=2)
+            else:
+                with METRICS.stage("upload"):
+                    self.client.upload_file(file_path, self.bucket_name, key, Config=self.transfer_config)
+                METRICS.add_bytes("upload", size)
+                if entry is not None:
+                    self.sync.uploaded(file_path, key, entry)
+                with self._lock:
+                    self.files_uploaded += 1
+                    self.bytes_uploaded += size
+                log(f"Uploaded {file_path} to s3://{self.bucket_name}/{key}", level=2)
+            if self.delete_after_upload:
+                os.remove(file_path)
+            return result
+        finally:
+            self._slots.release()
+
+    def submit(self, file_path, key, result=None):
+        """
+        Queue an upload; the future resolves to `result` once it succeeded.
+        """
+        self._slots.acquire()
+        future = self.executor.submit(self._upload, file_path, key, result)
+        self._pending.add(future)
+        return future
+
+    def completed(self, block=False):
+        """
+        Yield results of finished uploads (all of them, waiting, if `block`).
+        """
+        if not self._pending:
+            return
+        if block:
+            done = wait(self._pending).done
+            self._pending = set()
+        else:
+            done = {f for f in self._pending if f.done()}
+            self._pending -= done
+        for future in done:
+            yield future.result()
+
+    @property
+    def throughput_mb_s(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return self.bytes_uploaded / (1024 * 1024) / elapsed
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        log(f"Uploaded {self.files_uploaded} files ({self.bytes_uploaded / (1024 * 1024):.1f} MB) "
+            f"at {self.throughput_mb_s:.1f} MB/s")
+
+
+def _s3_etag(file_path, multipart_threshold, multipart_chunksize):
+    """
+    The ETag S3 gives `file_path` when uploaded with these multipart
+    settings: the MD5 for a single PUT, otherwise the MD5 of the parts'
+    MD5s suffixed with the part count. Objects encrypted with SSE-KMS get
+    other ETags; S3SyncIndex falls back to its manifest for those.
+    """
+    size = os.path.getsize(file_path)
+    parts = []
+    with open(file_path, "rb") as f:
+        if size < multipart_threshold:
+            return hashlib.md5(f.read()).hexdigest()
+        while True:
+            chunk = f.read(multipart_chunksize)
+            if not chunk:
+                break
+            parts.append(hashlib.md5(chunk).digest())
+    return f"{hashlib.md5(b''.join(parts)).hexdigest()}-{len(parts)}"
+
+
+# Generation settings that do not change a record's bytes
+_FINGERPRINT_IGNORED = {"s3_bucket", "stream_output", "stream_chunk_bytes", "attachment_threads"}
+
+
+def _content_fingerprint(gen_kwargs):
+    """
+    Hash of everything that determines a seeded record's bytes: the
+    generation settings and the base XML files. None for unseeded runs,
+    whose records differ every time.
+    """
+    if gen_kwargs.get("seed") is None:
+        return None
+    settings = {k: v for k, v in gen_kwargs.items() if k not in _FINGERPRINT_IGNORED}
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode())
+    for path in (gen_kwargs.get("base_xml"), gen_kwargs.get("alt_base_xml")):
+        if path and os.path.isfile(path):
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+class S3SyncIndex:
+    """
+    What the bucket holds under `prefix`, for --s3-sync. Combines a paginated
+    listing (key -> ETag, size) with a local JSON-lines manifest of the
+    objects earlier syncs uploaded or verified: key, size, ETag, SHA-256 and,
+    for seeded runs, the record's recipe (content fingerprint and index) and
+    CSV row.
+
+    A generated file is not uploaded when the bucket already has the same
+    bytes under its key. That is the case when the listed ETag matches the
+    file's computed one, or when the manifest recorded the same SHA-256 with
+    the ETag the bucket still lists. A seeded record whose recipe is in the
+    manifest, with its object still listed unchanged, is not even generated.
+    """
+
+    def __init__(self, path, bucket_name, prefix, multipart_threshold, multipart_chunksize, fingerprint=None):
+        self.path = path
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.fingerprint = fingerprint
+        self.entries = {}  # key -> manifest entry
+        self.remote = {}   # key -> (etag, size)
+        self.synced = {}   # key -> size, for objects this run relies on
+        self.skipped = self.skipped_bytes = 0
+        self._lock = threading.Lock()
+        self._file = None
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    self.entries[item["key"]] = item
+        self._by_recipe = {e["recipe"]: e for e in self.entries.values() if e.get("recipe")}
+
+    def list_remote(self):
+        """
+        List the prefix page by page (1,000 keys each) into self.remote.
+        """
+        paginator = _get_s3_client().get_paginator('list_objects_v2')
+        self.remote = {
+            obj['Key']: (obj['ETag'].strip('"'), obj['Size'])
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=self.prefix)
+            for obj in page.get('Contents', [])
+        }
+        return self.remote
+
+    def _current(self, entry):
+        return entry is not None and self.remote.get(entry["key"]) == (entry["etag"], entry["size"])
+
+    def recipe(self, index):
+        return f"{self.fingerprint}:{index}" if self.fingerprint else None
+
+    def reusable(self, indices):
+        """
+        Manifest entries, by record index, of seeded records whose object the
+        bucket still holds unchanged; those records need no generation.
+        """
+        reused = {}
+        if self.fingerprint:
+            for i in indices:
+                entry = self._by_recipe.get(self.recipe(i))
+                if self._current(entry):
+                    reused[i] = entry
+                    self.synced[entry["key"]] = entry["size"]
+        return reused
+
+    def unchanged(self, file_path, key, record):
+        """
+        True (and recorded) if the bucket already has `file_path`'s bytes at `key`.
+        """
+        remote = self.remote.get(key)
+        size = os.path.getsize(file_path)
+        if remote is None or remote[1] != size:
+            return False
+        entry = self.entries.get(key)
+        if not (entry is not None and entry["sha256"] == record["sha256"] and self._current(entry)) and \
+                remote[0] != _s3_etag(file_path, self.multipart_threshold, self.multipart_chunksize):
+            return False
+        self._record(key, size, remote[0], record)
+        with self._lock:
+            self.skipped += 1
+            self.skipped_bytes += size
+        return True
+
+    def uploaded(self, file_path, key, record):
+        etag = _s3_etag(file_path, self.multipart_threshold, self.multipart_chunksize)
+        self._record(key, os.path.getsize(file_path), etag, record)
+
+    def _record(self, key, size, etag, record):
+        entry = {"key": key, "size": size, "etag": etag, "sha256": record["sha256"],
+                 "recipe": self.recipe(record["index"]), "row": record["row"]}
+        with self._lock:
+            self.entries[key] = entry
+            self.synced[key] = size
+            if self._file is None:
+                self._file = open(self.path, "a")
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def confirm(self):
+        """
+        List the prefix again and check that every object this run uploaded
+        or reused is there at its size, then store the ETags the bucket
+        reports (so SSE-KMS objects are recognized next time) and compact the
+        manifest. Returns the keys that are missing.
+        """
+        self.close()
+        self.list_remote()
+        missing = [key for key, size in self.synced.items() if self.remote.get(key, (None, None))[1] != size]
+        for key in self.synced.keys() - set(missing):
+            self.entries[key]["etag"] = self.remote[key][0]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            for key, entry in self.entries.items():
+                if key in self.remote:
+                    f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+        return missing
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
 # =================
 # PDF/Image helpers
 # =================
@@ -151,30 +636,164 @@ def _target_bytes_with_safety(mb: float) -> int:
     return max(1, _bytes_from_mb(mb) - PDF_SAFETY_BYTES)
 
 
-def generate_large_image(width=IMG_WIDTH, height=IMG_HEIGHT, quality=JPEG_QUALITY):
+def generate_large_image(width=IMG_WIDTH, height=IMG_HEIGHT, quality=JPEG_QUALITY, rng=None):
     """
     Generate a random RGB image and return it as a JPEG BytesIO object.
+    Pixels come from the NumPy Generator `rng` when given (reproducible),
+    otherwise from the process-global np.random state.
     """
-    array = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
-    img = Image.fromarray(array, 'RGB')
-    buffer = io.BytesIO()
-    img.save(buffer, format='JPEG', quality=quality, optimize=True)
-    buffer.seek(0)
+    import numpy as np
+    from PIL import Image
+    with METRICS.stage("image"):
+        if rng is not None:
+            array = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        else:
+            array = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+        img = Image.fromarray(array, 'RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality, optimize=True)
+        buffer.seek(0)
+    METRICS.add_bytes("image", buffer.getbuffer().nbytes)
     return buffer
 
 
-def generate_pdf_of_size(size_mb: float) -> io.BytesIO:
+class JpegPool:
     """
-    Generate a PDF as close as possible to the target size WITHOUT overshooting.
+    Pool of pre-encoded JPEG pages reused across PDFs so that page images are
+    encoded once per worker instead of once per page.
+
+    Entries are (jpeg_bytes, width, height). With `refresh` > 0 the pool
+    moves to a new epoch every `refresh` records and a slot is re-encoded the
+    first time it is drawn in a new epoch; 0 keeps the pool fixed for the run.
+    With a `seed`, slot contents depend only on (seed, slot, epoch), so every
+    worker holds the same pool.
+    """
+
+    def __init__(self, entries, refresh=0, seed=None):
+        if not entries:
+            raise ValueError("JpegPool needs at least one image")
+        self.entries = list(entries)
+        self.refresh = refresh
+        self.seed = seed
+        self._epochs = [0] * len(self.entries)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _encode(seed, slot, epoch):
+        import numpy as np
+        rng = np.random.default_rng([seed, slot, epoch]) if seed is not None else None
+        return generate_large_image(rng=rng).getvalue(), IMG_WIDTH, IMG_HEIGHT
+
+    @classmethod
+    def build(cls, size, refresh=0, seed=None):
+        return cls([cls._encode(seed, slot, 0) for slot in range(size)], refresh, seed)
+
+    @classmethod
+    def load(cls, directory, refresh=0, seed=None):
+        """
+        Load every *.jpg / *.jpeg file in `directory` as a pool entry.
+        """
+        from PIL import Image
+        entries = []
+        for name in sorted(os.listdir(directory)):
+            if not name.lower().endswith((".jpg", ".jpeg")):
+                continue
+            with open(os.path.join(directory, name), "rb") as f:
+                data = f.read()
+            with Image.open(io.BytesIO(data)) as img:
+                width, height = img.size
+            entries.append((data, width, height))
+        return cls(entries, refresh, seed)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for idx, (data, _, _) in enumerate(self.entries):
+            with open(os.path.join(directory, f"page_{idx:04d}.jpg"), "wb") as f:
+                f.write(data)
+
+    @property
+    def total_bytes(self):
+        return sum(len(data) for data, _, _ in self.entries)
+
+    def next(self, rng=None, record_index=0):
+        """
+        Return a random (jpeg_bytes, width, height) entry, picked with the
+        NumPy Generator `rng` when given.
+        """
+        if rng is not None:
+            slot = int(rng.integers(len(self.entries)))
+        else:
+            slot = random.randrange(len(self.entries))
+        if self.refresh:
+            # Thread workers share the pool: check and re-encode under the
+            # lock so a record always gets its own epoch's image
+            epoch = record_index // self.refresh
+            with self._lock:
+                if self._epochs[slot] != epoch:
+                    self.entries[slot] = self._encode(self.seed, slot, epoch)
+                    self._epochs[slot] = epoch
+                return self.entries[slot]
+        return self.entries[slot]
+
+
+# One pool per worker process, created on first use
+_IMAGE_POOL = None
+_IMAGE_POOL_KEY = None
+
+
+def _get_image_pool(size=0, refresh=0, directory=None, seed=None):
+    """
+    Return this process's JpegPool for the given settings, or None when pooling
+    is disabled (size 0 and no directory) and every page is encoded fresh.
+    """
+    global _IMAGE_POOL, _IMAGE_POOL_KEY
+    if not size and not directory:
+        return None
+    key = (size, refresh, directory, seed)
+    if _IMAGE_POOL is None or _IMAGE_POOL_KEY != key:
+        if directory and os.path.isdir(directory) and os.listdir(directory):
+            _IMAGE_POOL = JpegPool.load(directory, refresh, seed)
+        else:
+            _IMAGE_POOL = JpegPool.build(size, refresh, seed)
+        _IMAGE_POOL_KEY = key
+    return _IMAGE_POOL
+
+
+def _next_page_image(image_pool=None, rng=None, record_index=0):
     """
+    Return (jpeg_bytes, width, height) for the next PDF page, from the pool
+    when one is configured, otherwise freshly encoded.
+    """
+    if image_pool is not None:
+        return image_pool.next(rng, record_index)
+    return generate_large_image(rng=rng).getvalue(), IMG_WIDTH, IMG_HEIGHT
+
+
+def _pdf_generated(size, target_size_bytes):
+    METRICS.add_bytes("pdf", size)
+    log(f"PDF generated: {size/1024:.2f} KB (target ≤ {target_size_bytes/1024:.2f} KB)", level=2)
+
+
+def _generate_pdf_of_size_reportlab(size_mb: float, image_pool=None, sink=None, rng=None,
+                                    record_index=0) -> io.BytesIO:
+    """
+    Legacy backend: grow a reportlab/PyPDF2 document one page at a time and
+    re-serialize it after every page. Kept for comparison with the direct writer.
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.utils import ImageReader
+    from PyPDF2 import PdfWriter, PdfReader
     target_size_bytes = _target_bytes_with_safety(size_mb)
 
     pages = []
     while True:
         # Build a 1-page PDF with an image
-        img_buf = generate_large_image()
+        jpeg, _, _ = _next_page_image(image_pool, rng, record_index)
+        img_buf = io.BytesIO(jpeg)
         single_page_pdf = io.BytesIO()
-        c = canvas.Canvas(single_page_pdf, pagesize=letter)
+        # invariant=1 drops reportlab's timestamps/IDs so seeded runs reproduce
+        c = canvas.Canvas(single_page_pdf, pagesize=letter, invariant=int(rng is not None))
         img = ImageReader(img_buf)
         c.drawImage(img, 50, 50, width=500, height=500, preserveAspectRatio=True, anchor='c')
         c.showPage()
@@ -202,7 +821,7 @@ def generate_pdf_of_size(size_mb: float) -> io.BytesIO:
     if not pages:
         # Minimal fallback (if even one page would exceed target safety)
         minimal_buf = io.BytesIO()
-        c = canvas.Canvas(minimal_buf, pagesize=letter)
+        c = canvas.Canvas(minimal_buf, pagesize=letter, invariant=int(rng is not None))
         c.drawString(72, 720, "Auto-generated placeholder page")
         c.showPage()
         c.save()
@@ -223,11 +842,384 @@ def generate_pdf_of_size(size_mb: float) -> io.BytesIO:
         payload = max(pad_len - overhead, 0)
         pdf_data += b"\n%PADDING\n" + (b"0" * payload)
 
-    result = io.BytesIO(pdf_data)
-    print(f"PDF generated: {len(pdf_data)/1024:.2f} KB (target ≤ {target_size_bytes/1024:.2f} KB)")
+    if sink is not None:
+        sink.write(pdf_data)
+        result = sink
+    else:
+        result = io.BytesIO(pdf_data)
+    _pdf_generated(len(pdf_data), target_size_bytes)
+    return result
+
+
+# =================
+# Direct PDF writer
+# =================
+# PDF colour space per JPEG component count. Like reportlab, CMYK JPEGs
+# get an inverting /Decode, since Adobe writes their channels inverted
+JPEG_COLOR_SPACES = {
+    1: b"/DeviceGray",
+    3: b"/DeviceRGB",
+    4: b"/DeviceCMYK /Decode [1 0 1 0 1 0 1 0]",
+}
+
+
+def _jpeg_components(jpeg):
+    """
+    Number of colour components of a JPEG, read from its SOF marker.
+    """
+    pos = 2  # after SOI
+    while pos + 9 < len(jpeg):
+        if jpeg[pos] != 0xFF:
+            break
+        marker = jpeg[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+        elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            return jpeg[pos + 9]
+        elif 0xD0 <= marker <= 0xD8 or marker == 0x01:  # markers without a length
+            pos += 2
+        else:
+            pos += 2 + int.from_bytes(jpeg[pos + 2:pos + 4], "big")
+    raise ValueError("JPEG has no frame (SOF) header")
+
+
+class DirectPdfWriter:
+    """
+    Minimal PDF writer that streams objects straight to a sink and tracks the
+    xref offsets itself. Because every object is written exactly once, the
+    final document size is known at every step without re-serializing.
+
+    Object 1 is the catalog and object 2 the page tree; both are written last
+    by finish(), once the list of pages is known.
+    """
+
+    PAGE_BOX = (612, 792)           # US letter, same as the reportlab backend
+    IMAGE_BOX = (50, 50, 500, 500)  # x, y, width, height of the drawn image
+    PAD_HEAD = b"%d 0 obj\n<< /Length %d >>\nstream\n"
+    PAD_FOOT = b"\nendstream\nendobj\n"
+
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else io.BytesIO()
+        self.offset = 0
+        self.offsets = [None, None]  # byte offset of object n at index n-1
+        self.page_nums = []
+        self.trailer_spaces = 0
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self.sink.write(data)
+        self.offset += len(data)
+
+    def _next_num(self):
+        return len(self.offsets) + 1
+
+    def _begin_object(self):
+        self.offsets.append(self.offset)
+        return len(self.offsets)
+
+    # ---- size bookkeeping ----
+    def _pages_object(self, page_nums):
+        kids = b" ".join(b"%d 0 R" % n for n in page_nums)
+        return (b"2 0 obj\n<< /Type /Pages /Kids [%s] /Count %d >>\nendobj\n"
+                % (kids, len(page_nums)))
+
+    @staticmethod
+    def _catalog_object():
+        return b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n"
+
+    @staticmethod
+    def _trailer(size, xref_offset, spaces=0):
+        return (b"trailer\n<< /Size %d /Root 1 0 R%s >>\nstartxref\n%d\n%%%%EOF\n"
+                % (size, b" " * spaces, xref_offset))
+
+    def _final_size(self, offset, num_objects, page_nums):
+        """
+        Size of the finished document if the body ended at `offset` with
+        `num_objects` objects and the given pages.
+        """
+        xref_offset = offset + len(self._pages_object(page_nums)) + len(self._catalog_object())
+        size = num_objects + 1
+        return (xref_offset + len(b"xref\n0 %d\n" % size) + 20 * size +
+                len(self._trailer(size, xref_offset)))
+
+    def _image_page_objects(self, jpeg, width, height, first_num):
+        components = _jpeg_components(jpeg)
+        if components not in JPEG_COLOR_SPACES:
+            raise ValueError(f"unsupported JPEG with {components} colour components")
+        img_num, content_num, page_num = first_num, first_num + 1, first_num + 2
+        bx, by, bw, bh = self.IMAGE_BOX
+        scale = min(bw / width, bh / height)
+        dw, dh = width * scale, height * scale
+        draw = b"q %.2f 0 0 %.2f %.2f %.2f cm /Im0 Do Q" % (dw, dh, bx + (bw - dw) / 2, by + (bh - dh) / 2)
+        img_head = (b"%d 0 obj\n<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+                    b"/ColorSpace %s /BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n"
+                    % (img_num, width, height, JPEG_COLOR_SPACES[components], len(jpeg)))
+        img_foot = b"\nendstream\nendobj\n"
+        content = (b"%d 0 obj\n<< /Length %d >>\nstream\n%s\nendstream\nendobj\n"
+                   % (content_num, len(draw), draw))
+        page = (b"%d 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>\nendobj\n"
+                % ((page_num,) + self.PAGE_BOX + (img_num, content_num)))
+        return img_head, img_foot, content, page
+
+    def size_with_image_page(self, jpeg, width, height):
+        """
+        Final document size if one more image page showing `jpeg` were added.
+        """
+        first = self._next_num()
+        img_head, img_foot, content, page = self._image_page_objects(jpeg, width, height, first)
+        offset = self.offset + len(img_head) + len(jpeg) + len(img_foot) + len(content) + len(page)
+        return self._final_size(offset, first + 2, self.page_nums + [first + 2])
+
+    def min_pad_size(self):
+        """
+        Smallest number of bytes a padding object adds to the final document.
+        """
+        # 20 bytes of xref entry plus slack for the /Size and startxref digits
+        return len(self.PAD_HEAD % (self._next_num(), 0)) + len(self.PAD_FOOT) + 20 + 4
+
+    # ---- writing ----
+    def add_image_page(self, jpeg, width, height):
+        """
+        Embed raw JPEG bytes as a DCTDecode image XObject on its own page.
+        """
+        first = self._next_num()
+        img_head, img_foot, content, page = self._image_page_objects(jpeg, width, height, first)
+        self._begin_object()
+        self._write(img_head)
+        self._write(jpeg)
+        self._write(img_foot)
+        self._begin_object()
+        self._write(content)
+        self._begin_object()
+        self._write(page)
+        self.page_nums.append(first + 2)
+
+    def add_text_page(self, text):
+        """
+        A page showing one line of Helvetica text.
+        """
+        draw = b"BT /F1 24 Tf 100 700 Td (%s) Tj ET" % text
+        content_num = self._begin_object()
+        self._write(b"%d 0 obj\n<< /Length %d >>\nstream\n%s\nendstream\nendobj\n" % (content_num, len(draw), draw))
+        page_num = self._begin_object()
+        self._write(b"%d 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                    b"/Resources << /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> >> "
+                    b"/Contents %d 0 R >>\nendobj\n" % ((page_num,) + self.PAGE_BOX + (content_num,)))
+        self.page_nums.append(page_num)
+
+    def add_blank_page(self):
+        num = self._begin_object()
+        self._write(b"%d 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] >>\nendobj\n"
+                    % ((num,) + self.PAGE_BOX))
+        self.page_nums.append(num)
+
+    def _write_padding(self, target, fill=None):
+        """
+        Append one unreferenced stream object sized so the finished document
+        is exactly `target` bytes, its data repeating `fill` (zeros by
+        default). Returns False if that cannot be done.
+        """
+        num = self._next_num()
+        base = self.offset
+
+        def total_for(length):
+            head = self.PAD_HEAD % (num, length)
+            return self._final_size(base + len(head) + length + len(self.PAD_FOOT), num, self.page_nums)
+
+        # The /Length and startxref digit counts grow with the padding, so walk
+        # the guess down until it fits and absorb the rest with trailer spaces
+        # (which sit after the xref and therefore move no offsets).
+        length = max(target - total_for(0), 0)
+        while length > 0 and total_for(length) > target:
+            length = max(length - (total_for(length) - target), 0)
+        if total_for(length) > target:
+            return False
+
+        self._begin_object()
+        self._write(self.PAD_HEAD % (num, length))
+        chunk = memoryview(fill or b"0" * min(length, 65536))
+        remaining = length
+        while remaining > 0:
+            part = chunk[:remaining]
+            self._write(part)
+            remaining -= len(part)
+        self._write(self.PAD_FOOT)
+        self.trailer_spaces = target - self._final_size(self.offset, num, self.page_nums)
+        return True
+
+    def finish(self, target_size=None, fill=None):
+        """
+        Write the page tree, catalog, xref and trailer. If `target_size` is
+        given, a padding object (filled with `fill`) is added first so the
+        output lands on it exactly; ValueError if the document cannot be
+        brought to that size. Returns the total number of bytes written.
+        """
+        if not self.page_nums:
+            self.add_blank_page()
+        if target_size is not None:
+            size = self._final_size(self.offset, len(self.offsets), self.page_nums)
+            if size > target_size or (size < target_size and not self._write_padding(target_size, fill)):
+                raise ValueError(f"cannot bring the PDF to exactly {target_size} bytes "
+                                 f"({size} bytes before padding)")
+
+        self.offsets[1] = self.offset
+        self._write(self._pages_object(self.page_nums))
+        self.offsets[0] = self.offset
+        self._write(self._catalog_object())
+
+        xref_offset = self.offset
+        size = len(self.offsets) + 1
+        xref = [b"xref\n0 %d\n" % size, b"0000000000 65535 f \n"]
+        xref.extend(b"%010d 00000 n \n" % off for off in self.offsets)
+        self._write(b"".join(xref))
+        self._write(self._trailer(size, xref_offset, self.trailer_spaces))
+        return self.offset
+
+
+def _generate_pdf_of_size_direct(size_mb: float, image_pool=None, sink=None, rng=None,
+                                 record_index=0) -> io.BytesIO:
+    """
+    Direct backend: embed JPEG bytes as image XObjects, adding pages while the
+    known final size stays under the target, then pad to the target exactly.
+    """
+    target_size_bytes = _target_bytes_with_safety(size_mb)
+
+    writer = DirectPdfWriter(sink)
+    while True:
+        jpeg, width, height = _next_page_image(image_pool, rng, record_index)
+        projected = writer.size_with_image_page(jpeg, width, height)
+        # Only accept a page if the target is still reachable afterwards,
+        # either exactly or with room left for the padding object.
+        if projected != target_size_bytes and projected + writer.min_pad_size() > target_size_bytes:
+            break
+        writer.add_image_page(jpeg, width, height)
+        if projected == target_size_bytes:
+            break
+
+    size = writer.finish(target_size_bytes)
+    result = writer.sink
+    if sink is None:
+        result.seek(0)
+    _pdf_generated(size, target_size_bytes)
+    return result
+
+
+# Random block repeated as raw-PDF padding: larger than gzip's 32 KB window,
+# so the padding stays incompressible for transfer-level compression. A
+# multiple of 3 bytes, so its base64 encoding can be reused block by block.
+RAW_FILL_BYTES = 255 * 1024
+_RAW_FILL = None
+_RAW_FILL_B64 = {}  # rotation -> base64 of the process-wide block rotated by it
+
+
+def _raw_fill(rng=None, target_size_bytes=RAW_FILL_BYTES):
+    global _RAW_FILL
+    if rng is not None:
+        return rng.bytes(max(3, min(RAW_FILL_BYTES, target_size_bytes) // 3 * 3))
+    if _RAW_FILL is None:
+        _RAW_FILL = os.urandom(RAW_FILL_BYTES)
+    return _RAW_FILL
+
+
+def _write_raw_pdf(target_size_bytes, fill, sink=None):
+    writer = DirectPdfWriter(sink)
+    writer.add_text_page(b"Dummy PDF")
+    return writer, writer.finish(target_size_bytes, fill)
+
+
+def _generate_pdf_of_size_raw(size_mb: float, image_pool=None, sink=None, rng=None,
+                              record_index=0) -> io.BytesIO:
+    """
+    Raw backend: test.py's one-page text skeleton with a correct xref, padded
+    to the target exactly with a stream of random bytes. No images are
+    encoded, so it runs at memory bandwidth. The padding repeats a random
+    block drawn from `rng` when given (reproducible) or once per process.
+    """
+    target_size_bytes = _target_bytes_with_safety(size_mb)
+    writer, size = _write_raw_pdf(target_size_bytes, _raw_fill(rng, target_size_bytes), sink)
+    result = writer.sink
+    if sink is None:
+        result.seek(0)
+    _pdf_generated(size, target_size_bytes)
     return result
 
 
+class _PaddingSplitSink:
+    """
+    Sink that keeps the bytes before and after a raw PDF's padding and only
+    counts the padding itself (slices of `fill`).
+    """
+
+    def __init__(self, fill):
+        self.fill = fill
+        self.head = io.BytesIO()
+        self.tail = io.BytesIO()
+        self.padding = 0
+
+    def write(self, data):
+        if isinstance(data, memoryview) and data.obj is self.fill:
+            self.padding += len(data)
+        else:
+            (self.tail if self.padding else self.head).write(data)
+        return len(data)
+
+
+def _raw_pdf_base64(size_mb, rng=None):
+    """
+    Base64 of the raw-backend PDF, identical to b64encode(PDF) but without
+    encoding the padding byte by byte: the padding is `fill` repeated, and
+    since len(fill) is a multiple of 3, each repetition (rotated to the
+    base64 group boundary) encodes to the same text, encoded once and copied.
+    """
+    target_size_bytes = _target_bytes_with_safety(size_mb)
+    fill = _raw_fill(rng, target_size_bytes)
+    with METRICS.stage("pdf"):
+        parts = _PaddingSplitSink(fill)
+        _, size = _write_raw_pdf(target_size_bytes, fill, parts)
+    _pdf_generated(size, target_size_bytes)
+
+    with METRICS.stage("base64"):
+        head, tail, padding = parts.head.getvalue(), parts.tail.getvalue(), parts.padding
+        # Complete the head's last base64 group with the first padding bytes
+        k = min((3 - len(head) % 3) % 3, padding)
+        out = [base64.b64encode(head + fill[:k])]
+        padding -= k
+        rotated = fill[k:] + fill[:k]
+        blocks, rest = divmod(padding, len(fill))
+        if blocks:
+            encoded = _RAW_FILL_B64.get(k) if fill is _RAW_FILL else None
+            if encoded is None:
+                encoded = base64.b64encode(rotated)
+                if fill is _RAW_FILL:
+                    _RAW_FILL_B64[k] = encoded
+            out.append(encoded * blocks)
+        out.append(base64.b64encode(rotated[:rest] + tail))
+        blob = b"".join(out)
+    METRICS.add_bytes("base64", size)
+    return blob
+
+
+PDF_BACKENDS = {
+    "direct": _generate_pdf_of_size_direct,
+    "reportlab": _generate_pdf_of_size_reportlab,
+    "raw": _generate_pdf_of_size_raw,
+}
+
+
+def generate_pdf_of_size(size_mb: float, backend: str = "direct", image_pool=None, sink=None, rng=None,
+                         record_index=0) -> io.BytesIO:
+    """
+    Generate a PDF as close as possible to the target size WITHOUT overshooting.
+    Page images come from `image_pool` when given, otherwise they are encoded fresh.
+    If `sink` is given the PDF is written to it (and returned) instead of a new BytesIO.
+    `rng` (a NumPy Generator) makes the page images reproducible.
+    """
+    with METRICS.stage("pdf"):
+        return PDF_BACKENDS[backend](size_mb, image_pool=image_pool, sink=sink, rng=rng,
+                                     record_index=record_index)
+
+
 # ========================
 # XML helpers (attachments)
 # ========================
@@ -332,6 +1324,409 @@ def inject_attachments_multiple(root: ET.Element, ns: dict, filenames_and_b64):
         container.append(clone)
 
 
+# =========================
+# Streaming XML output
+# =========================
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class Base64StreamWriter:
+    """
+    File-like sink that base64-encodes whatever is written to it and forwards
+    the text to `out` in chunks of at most `chunk_size` input bytes, so only
+    one chunk (plus up to 2 leftover bytes) is ever held in memory.
+    """
+
+    def __init__(self, out, chunk_size=STREAM_CHUNK_BYTES):
+        self.out = out
+        self.chunk_size = max(3, chunk_size - chunk_size % 3)
+        self._pending = b""
+        self.raw_bytes = 0
+
+    def _emit(self, encoded):
+        with METRICS.stage("write"):
+            self.out.write(encoded)
+
+    def write(self, data):
+        self.raw_bytes += len(data)
+        METRICS.add_bytes("base64", len(data))
+        with METRICS.stage("base64"):
+            view = memoryview(data)
+            if self._pending:
+                need = 3 - len(self._pending)
+                self._pending += bytes(view[:need])
+                view = view[need:]
+                if len(self._pending) < 3:
+                    return len(data)
+                self._emit(base64.b64encode(self._pending))
+                self._pending = b""
+            while len(view) >= 3:
+                take = min(self.chunk_size, len(view) - len(view) % 3)
+                self._emit(base64.b64encode(view[:take]))
+                view = view[take:]
+            self._pending = bytes(view)
+        return len(data)
+
+    def close(self):
+        if self._pending:
+            self._emit(base64.b64encode(self._pending))
+            self._pending = b""
+
+
+class _DigestSink:
+    """
+    Write-only sink that feeds a hashlib object.
+    """
+
+    def __init__(self, digest):
+        self.digest = digest
+
+    def write(self, data):
+        self.digest.update(data)
+        return len(data)
+
+
+class _TeeSink:
+    """
+    Write the same bytes to several sinks (e.g. the XML encoder and a PDF file).
+    """
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, data):
+        for sink in self.sinks:
+            sink.write(data)
+        return len(data)
+
+
+def _content_marker(idx):
+    return f"@@ATTACHMENT-CONTENT-{idx}-{uuid.uuid4().hex}@@"
+
+
+def _split_on_markers(data: bytes, markers):
+    """
+    Split serialized XML on the given placeholder markers, in order.
+    Returns len(markers) + 1 byte fragments.
+    """
+    fragments = []
+    rest = data
+    for marker in markers:
+        head, sep, rest = rest.partition(marker.encode("utf-8"))
+        if not sep:
+            raise RuntimeError(f"Placeholder {marker} not found in serialized XML")
+        fragments.append(head)
+    fragments.append(rest)
+    return fragments
+
+
+def stream_xml_with_attachments(out, fragments, attachment_writers, chunk_size=STREAM_CHUNK_BYTES):
+    """
+    Write fragments[0], then for each attachment let its writer push raw PDF
+    bytes through a Base64StreamWriter, followed by the next fragment.
+    An attachment given as bytes/memoryview is already base64 and is copied
+    through as-is in `chunk_size` slices.
+    """
+    out.write(fragments[0])
+    for write_attachment, fragment in zip(attachment_writers, fragments[1:]):
+        if isinstance(write_attachment, (bytes, memoryview)):
+            view = memoryview(write_attachment)
+            for start in range(0, len(view), chunk_size):
+                out.write(view[start:start + chunk_size])
+        else:
+            encoder = Base64StreamWriter(out, chunk_size)
+            write_attachment(encoder)
+            encoder.close()
+        out.write(fragment)
+
+
+# =========================
+# Attachment library
+# =========================
+class AttachmentLibrary:
+    """
+    A file of pre-built PDFs, stored already base64-encoded, memory-mapped
+    read-only so records can splice blobs by reference instead of building
+    and encoding a new PDF per attachment.
+
+    Layout: MAGIC, the base64 blobs back to back, a JSON index of
+    {"size_mb", "offset", "length", "pdf_bytes"} entries, then the index
+    offset as a little-endian uint64 and MAGIC again.
+    """
+
+    MAGIC = b"ATTLIB01"
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        footer = self._mmap[-16:]
+        if self._mmap[:8] != self.MAGIC or footer[8:] != self.MAGIC:
+            raise ValueError(f"{path} is not an attachment library")
+        (index_offset,) = struct.unpack("<Q", footer[:8])
+        self.entries = json.loads(self._mmap[index_offset:len(self._mmap) - 16])
+        self._view = memoryview(self._mmap)
+        self.by_size = {}
+        for entry in self.entries:
+            self.by_size.setdefault(round(entry["size_mb"], 3), []).append(entry)
+        self._missed_sizes = set()
+
+    def pick(self, size_mb, rng=random):
+        """
+        Return a base64 blob (a memoryview into the mapping) for an attachment
+        of `size_mb`, or None if the library has no PDFs of that size.
+        A miss is reported once per size so an ill-fitting library is visible.
+        """
+        size_mb = round(size_mb, 3)
+        candidates = self.by_size.get(size_mb)
+        if not candidates:
+            if size_mb not in self._missed_sizes:
+                self._missed_sizes.add(size_mb)
+                sizes = ", ".join(f"{sz:g}" for sz in sorted(self.by_size))
+                print(f"WARNING: attachment library {self.path} has no {size_mb:g} MB PDFs "
+                      f"(has: {sizes}); building those attachments instead")
+            return None
+        entry = candidates[rng.randrange(len(candidates))]
+        return self._view[entry["offset"]:entry["offset"] + entry["length"]]
+
+    @classmethod
+    def write(cls, path, blobs):
+        """
+        Write an iterable of (size_mb, pdf_bytes, base64_blob) to `path`.
+        """
+        entries = []
+        with open(path, "wb") as f:
+            f.write(cls.MAGIC)
+            for size_mb, pdf_bytes, blob in blobs:
+                entries.append({"size_mb": size_mb, "offset": f.tell(), "length": len(blob),
+                                "pdf_bytes": pdf_bytes})
+                f.write(blob)
+            index_offset = f.tell()
+            f.write(json.dumps(entries).encode("utf-8"))
+            f.write(struct.pack("<Q", index_offset) + cls.MAGIC)
+        return entries
+
+
+def _build_library_blob(job, pdf_backend="direct", image_pool_size=0, image_pool_refresh=0,
+                        image_pool_dir=None, seed=None):
+    """
+    Worker side of the library build: one PDF, returned base64-encoded.
+    """
+    import numpy as np
+    k, size_mb = job
+    image_pool = _get_image_pool(image_pool_size, image_pool_refresh, image_pool_dir, seed)
+    rng = np.random.default_rng([seed, k]) if seed is not None else None
+    pdf = generate_pdf_of_size(size_mb, backend=pdf_backend, image_pool=image_pool, rng=rng).getvalue()
+    return size_mb, len(pdf), base64.b64encode(pdf)
+
+
+def build_attachment_library(path, sizes_mb, per_size, executor, **pdf_kwargs):
+    """
+    Build `per_size` PDFs for each size in `sizes_mb` on `executor` and write
+    them to an attachment library at `path`.
+    """
+    per_cap_mb, _ = _effective_caps(max(sizes_mb), MAX_TOTAL_ATTACHMENTS_MB)
+    jobs = [(k, round(min(sz, per_cap_mb), 3)) for k, sz in enumerate(
+        sz for sz in sizes_mb for _ in range(per_size))]
+    entries = AttachmentLibrary.write(path, executor.map(partial(_build_library_blob, **pdf_kwargs), jobs))
+    total = sum(entry["length"] for entry in entries)
+    print(f"Attachment library saved: {path} ({len(entries)} PDFs, {total / (1024 * 1024):.1f} MB base64)")
+
+
+# One mapping per library path per process
+_ATTACHMENT_LIBRARIES = {}
+
+
+def _get_attachment_library(path) -> AttachmentLibrary:
+    library = _ATTACHMENT_LIBRARIES.get(path)
+    if library is None:
+        library = _ATTACHMENT_LIBRARIES[path] = AttachmentLibrary(path)
+    return library
+
+
+# =========================
+# Compiled XML templates
+# =========================
+# Text slots filled per record: (slot name, XPath relative to the root)
+XML_TEXT_SLOTS = (
+    ("descriptionOfGoods", ".//ns:descriptionOfGoods"),
+    ("MessageId", ".//ns:MessageId"),
+    ("LRN", ".//ns:LRN"),
+    ("Timestamp", ".//ns:Timestamp"),
+    ("documentIssueDate", ".//ns:documentIssueDate/ns:DateTime"),
+)
+SEQUENCE_XPATHS = ("./ns:sequenceNumber", "./ns:sequenceNo", "./ns:id", "./ns:documentSequenceId")
+
+
+def _escape_text(text: str) -> bytes:
+    """
+    Escape element text exactly like ElementTree does when serializing.
+    """
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text.encode("utf-8")
+
+
+class CompiledXmlTemplate:
+    """
+    A base XML parsed and serialized once, then stored as byte fragments with
+    named slots. Rendering a record is a join of fragments and escaped values,
+    and produces the same bytes as the ElementTree path (set_text +
+    inject_attachments_multiple + tree.write).
+
+    Two variants are kept: one with every attachment removed, and one where a
+    single attachment block (filename, content and sequence slots) can be
+    repeated once per attachment.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        token = uuid.uuid4().hex
+        self._slot_re = re.compile(rb"@@SLOT-(\w+)-" + token.encode() + rb"@@")
+
+        def marker(name):
+            return f"@@SLOT-{name}-{token}@@"
+
+        tree = ET.parse(path)
+        ns = _infer_namespace_from_tree(tree)
+        root = tree.getroot()
+        for name, xpath in XML_TEXT_SLOTS:
+            elem = root.find(xpath, ns)
+            if elem is not None:
+                elem.text = marker(name)
+
+        bare = copy.deepcopy(root)
+        remove_all_attachments(bare, ns)
+        self._bare = self._parse(self._serialize(bare))
+
+        # Inject one attachment carrying slot markers and fence it with
+        # begin/end markers so the repeatable block can be cut out.
+        self._head = self._block = self._tail = None
+        self._error = None
+        try:
+            inject_attachments_multiple(root, ns, [(marker("filename"), marker("content"))])
+        except RuntimeError as e:
+            self._error = str(e)
+            return
+        clone = next(elem for elem in _find_all_attachment_nodes(root, ns)
+                     if elem.findtext("./ns:filename", None, ns) == marker("filename"))
+        for cand in SEQUENCE_XPATHS:
+            node = clone.find(cand, ns)
+            if node is not None:
+                node.text = marker("sequence")
+        container = _find_parent(root, clone)
+        children = list(container)
+        pos = children.index(clone)
+        if pos > 0:
+            children[pos - 1].tail = (children[pos - 1].tail or "") + marker("begin")
+        else:
+            container.text = (container.text or "") + marker("begin")
+        clone.tail = (clone.tail or "") + marker("end")
+
+        data = self._serialize(root)
+        head, rest = data.split(marker("begin").encode(), 1)
+        block, tail = rest.split(marker("end").encode(), 1)
+        self._head, self._block, self._tail = self._parse(head), self._parse(block), self._parse(tail)
+
+    @staticmethod
+    def _serialize(root):
+        buffer = io.BytesIO()
+        ET.ElementTree(root).write(buffer, encoding="utf-8", xml_declaration=True)
+        return buffer.getvalue()
+
+    def _parse(self, data):
+        """
+        Split serialized bytes into a list of literal bytes and slot names.
+        """
+        parts = []
+        pieces = self._slot_re.split(data)
+        for idx, piece in enumerate(pieces):
+            if idx % 2:
+                parts.append(piece.decode())
+            elif piece:
+                parts.append(piece)
+        return parts
+
+    def render_fragments(self, fields: dict, filenames):
+        """
+        Fill the slots for one record. Attachment content is left out: the
+        result has len(filenames) + 1 byte fragments, and the base64 of
+        attachment k goes between fragment k and k+1.
+        """
+        fragments = []
+        current = []
+
+        def emit(parts, values):
+            for part in parts:
+                if isinstance(part, bytes):
+                    current.append(part)
+                elif part == "content":
+                    fragments.append(b"".join(current))
+                    current.clear()
+                else:
+                    current.append(_escape_text(values[part]))
+
+        if not filenames:
+            emit(self._bare, fields)
+        else:
+            if self._error:
+                raise RuntimeError(self._error)
+            emit(self._head, fields)
+            for idx, fname in enumerate(filenames, start=1):
+                emit(self._block, dict(fields, filename=fname, sequence=str(idx)))
+            emit(self._tail, fields)
+        fragments.append(b"".join(current))
+        return fragments
+
+
+# Compiled templates, one per base XML path per process
+_XML_TEMPLATES = {}
+
+
+def _get_xml_template(path) -> CompiledXmlTemplate:
+    template = _XML_TEMPLATES.get(path)
+    if template is None:
+        template = _XML_TEMPLATES[path] = CompiledXmlTemplate(path)
+    return template
+
+
+def _render_fragments_etree(path, fields: dict, filenames):
+    """
+    Reference path: parse the base XML, set the text slots, inject attachments
+    with placeholder content and serialize; then split on the placeholders.
+    Returns fragments in the same shape as CompiledXmlTemplate.render_fragments.
+    """
+    tree = ET.parse(path)
+    ns = _infer_namespace_from_tree(tree)
+    root = tree.getroot()
+
+    for name, xpath in XML_TEXT_SLOTS:
+        tag = root.find(xpath, ns)
+        if tag is not None:
+            tag.text = fields[name]
+
+    markers = [_content_marker(idx) for idx in range(len(filenames))]
+    inject_attachments_multiple(root, ns, list(zip(filenames, markers)))
+
+    buffer = io.BytesIO()
+    tree.write(buffer, encoding="utf-8", xml_declaration=True)
+    return _split_on_markers(buffer.getvalue(), markers)
+
+
+def _render_fragments_template(path, fields: dict, filenames):
+    return _get_xml_template(path).render_fragments(fields, filenames)
+
+
+XML_BACKENDS = {
+    "template": _render_fragments_template,
+    "etree": _render_fragments_etree,
+}
+
+
 # ===========================
 # Generation & Orchestration
 # ===========================
@@ -351,11 +1746,119 @@ def _infer_namespace_from_tree(tree: ET.ElementTree) -> dict:
     return {'ns': uri}
 
 
-def save_xml_locally(xml_buffer, xml_filename):
+# Clock used for names and timestamps of seeded runs without --timestamp
+SEED_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _record_rng(seed, i):
+    """
+    Record-level random stream. Seeded runs get an independent
+    `random.Random` per (seed, index); otherwise the process-global
+    `random` module is used as before.
+    """
+    if seed is None:
+        return random
+    return random.Random(f"{seed}:{i}")
+
+
+def _attachment_rng(seed, i, idx):
+    """
+    NumPy Generator for the images of attachment `idx` of record `i`, or None
+    (process-global np.random) when unseeded.
+    """
+    if seed is None:
+        return None
+    import numpy as np
+    return np.random.default_rng([seed, i, idx])
+
+
+def _record_uuid(rng, seed):
+    if seed is None:
+        return uuid.uuid4()
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def _record_choices(rng, alt_base_xml, alt_base_percent, no_attachments_percent):
+    """
+    The first draws of a record's random stream: (use_alt_base, no_attachments).
+    """
+    # Decide which base XML to use for this record
+    use_alt = False
+    if alt_base_xml and alt_base_percent > 0:
+        use_alt = (rng.random() < (float(alt_base_percent) / 100.0))
+    # Decide if this record should have no attachments
+    no_attach = rng.random() < (float(no_attachments_percent) / 100.0)
+    return use_alt, no_attach
+
+
+def _planned_attachment_sizes(i, seed=None, alt_base_xml=None, alt_base_percent=0, no_attachments_percent=0,
+                              attachments_total_mb=2.0, attachment_max_mb=2.0, **_):
+    """
+    Attachment sizes record `i` will be generated with, known before the
+    record itself runs. Seeded runs replay the record's first draws; unseeded
+    runs cannot, so the full plan is returned as an upper bound.
+    """
+    if seed is not None:
+        _, no_attach = _record_choices(_record_rng(seed, i), alt_base_xml, alt_base_percent, no_attachments_percent)
+        if no_attach:
+            return []
+    elif no_attachments_percent >= 100:
+        return []
+    per_cap_mb, total_mb = _effective_caps(attachment_max_mb, attachments_total_mb)
+    return _plan_attachments(total_mb, per_cap_mb)
+
+
+def _split_attachment_sizes(i, seed=None, no_attachments_percent=0, attachment_library=None,
+                            library_reuse_percent=100, **gen_kwargs):
+    """
+    Attachments of record `i` worth pre-building as split tasks: its plan
+    when the record is certain to build every one of them itself, else [] so
+    it runs as one task. An unseeded record cannot know in advance whether
+    it rolls no attachments, and library reuse is decided per attachment
+    inside the record, so in both cases pre-built blobs could be thrown away.
+    """
+    if (attachment_library and library_reuse_percent > 0) or (seed is None and 0 < no_attachments_percent < 100):
+        return []
+    return _planned_attachment_sizes(i, seed=seed, no_attachments_percent=no_attachments_percent, **gen_kwargs)
+
+
+# Per-process thread pool for building a record's attachments concurrently
+_ATTACHMENT_THREADS = None
+_ATTACHMENT_THREADS_LOCK = threading.Lock()
+
+
+def _get_attachment_threads(size):
+    global _ATTACHMENT_THREADS
+    with _ATTACHMENT_THREADS_LOCK:
+        if _ATTACHMENT_THREADS is None or _ATTACHMENT_THREADS._max_workers != size:
+            _ATTACHMENT_THREADS = ThreadPoolExecutor(max_workers=size, thread_name_prefix="attachment")
+        return _ATTACHMENT_THREADS
+
+
+def _encode_attachment(i, idx, size_mb, backend="direct", image_pool=None, seed=None):
+    """
+    Attachment `idx` of record `i` as a base64 blob, the same bytes the
+    record's own loop would produce.
+    """
+    if backend == "raw":
+        return _raw_pdf_base64(size_mb, _attachment_rng(seed, i, idx))
+    pdf_buffer = generate_pdf_of_size(size_mb, backend=backend, image_pool=image_pool,
+                                      rng=_attachment_rng(seed, i, idx), record_index=i)
+    with METRICS.stage("base64"):
+        blob = base64.b64encode(pdf_buffer.getvalue())
+    METRICS.add_bytes("base64", pdf_buffer.getbuffer().nbytes)
+    return blob
+
+
+def save_xml_locally(xml_buffer, xml_filename, digest=None):
     xml_path = os.path.join(OUTPUT_DIR, xml_filename)
-    with open(xml_path, "wb") as f:
-        f.write(xml_buffer.getvalue())
-    print(f"Saved XML to {xml_path}")
+    with METRICS.stage("write"):
+        with open(xml_path, "wb") as f:
+            f.write(xml_buffer.getvalue())
+        if digest is not None:
+            digest.update(xml_buffer.getbuffer())
+    METRICS.add_bytes("write", xml_buffer.getbuffer().nbytes)
+    log(f"Saved XML to {xml_path}", level=2)
 
 
 def generate_and_update(
@@ -367,84 +1870,148 @@ def generate_and_update(
     goods_percent=0,
     attachments_total_mb=2.0,
     attachment_max_mb=2.0,
-    no_attachments_percent=0
+    no_attachments_percent=0,
+    pdf_backend="direct",
+    image_pool_size=0,
+    image_pool_refresh=0,
+    image_pool_dir=None,
+    stream_output=False,
+    stream_chunk_bytes=STREAM_CHUNK_BYTES,
+    xml_backend="template",
+    seed=None,
+    fixed_time=None,
+    attachment_library=None,
+    library_reuse_percent=100,
+    attachment_threads=1,
+    prebuilt_blobs=None,
+    digest=None
 ):
     """
     Generate XML possibly with NO attachments (based on percentage) or with
     MULTIPLE attachments (total ≤ 10 MB, each ≤ 2 MB), using either the default
     base XML or an alternate base XML based on the given percentage.
 
+    The XML is rendered from the base XML compiled once per process
+    (`xml_backend="template"`) or re-parsed per record (`"etree"`).
+    With `stream_output`, the XML is written straight to OUTPUT_DIR while each
+    PDF is base64-encoded in `stream_chunk_bytes` chunks; xml_buffer is then None.
+
+    With a `seed`, every random choice, ID and image is drawn from streams
+    derived from (seed, i), and `fixed_time` (a datetime) replaces the clock,
+    so the same seed and index give byte-identical output on any worker.
+
+    With `attachment_library`, `library_reuse_percent` of the attachments are
+    spliced in from the memory-mapped library (when it has PDFs of the planned
+    size) instead of being built and encoded for this record.
+
+    Attachments are built one after another unless `attachment_threads` > 1,
+    in which case they are built concurrently on a per-process thread pool
+    (JPEG encoding releases the GIL). `prebuilt_blobs` holds base64 blobs built
+    elsewhere (e.g. as separate pool tasks), by attachment position, for
+    attachments not taken from the library; output is identical either way.
+
+    In stream mode, a hashlib `digest` is fed the XML bytes as they are written.
+
     Returns:
       (xml_filename, xml_buffer, message_id, lrn, timestamp,
        has_attachments, attachment_count, attachments_total_mb_used, base_xml_used)
     """
-    # Decide which base XML to use for this record
-    use_alt = False
-    if alt_base_xml and alt_base_percent > 0:
-        use_alt = (random.random() < (float(alt_base_percent) / 100.0))
+    if prebuilt_blobs:
+        # Free shared memory handles up front: blobs a record ends up not
+        # using (no attachments, library picks) must not leak their segment
+        prebuilt_blobs = _unshared_all(prebuilt_blobs)
+    rng = _record_rng(seed, i)
+    use_alt, no_attach = _record_choices(rng, alt_base_xml, alt_base_percent, no_attachments_percent)
     base_xml_used = alt_base_xml if use_alt else base_xml
 
-    # Decide if this record should have no attachments
-    no_attach = random.random() < (float(no_attachments_percent) / 100.0)
-
-    now = datetime.now(timezone.utc)
+    now = fixed_time or datetime.now(timezone.utc)
     timestamp = now.strftime("%Y-%m-%dT%H:%M:%SZ")
     compact = now.strftime("%Y%m%d%H%M%S")
 
-    filenames_and_b64 = []
     has_attachments = not no_attach
-    attachment_count = 0
     total_mb_used = 0.0
+    attachment_plan = []  # (pdf_filename, size_mb)
 
     if not no_attach:
         # Determine the plan for attachments
         per_cap_mb, total_mb = _effective_caps(attachment_max_mb, attachments_total_mb)
         sizes_mb = _plan_attachments(total_mb, per_cap_mb)
         total_mb_used = float(round(sum(sizes_mb), 3))
-
-        # Build PDFs and collect (filename, base64) pairs
-        for idx, sz in enumerate(sizes_mb, start=1):
-            pdf_filename = f"IE3FXX_{sz:.1f}MB_{compact}_{i}_{idx}.pdf"
-            pdf_buffer = generate_pdf_of_size(sz)
-
-            if save_pdf:
-                os.makedirs(OUTPUT_DIR, exist_ok=True)
-                pdf_path = os.path.join(OUTPUT_DIR, pdf_filename)
-                with open(pdf_path, "wb") as f:
-                    f.write(pdf_buffer.getvalue())
-                print(f"Saved PDF to {pdf_path}")
-
-            b64 = base64.b64encode(pdf_buffer.getvalue()).decode("utf-8")
-            filenames_and_b64.append((pdf_filename, b64))
-
-        attachment_count = len(filenames_and_b64)
-
-    # Load chosen base XML and infer namespace
-    tree = ET.parse(base_xml_used)
-    ns = _infer_namespace_from_tree(tree)
-    root = tree.getroot()
+        attachment_plan = [(f"IE3FXX_{sz:.1f}MB_{compact}_{i}_{idx}.pdf", sz)
+                           for idx, sz in enumerate(sizes_mb, start=1)]
+    attachment_count = len(attachment_plan)
+
+    # Pre-encoded base64 blobs (library or prebuilt), by attachment position
+    ready_blobs = [None] * attachment_count
+    if attachment_library and attachment_plan:
+        library = _get_attachment_library(attachment_library)
+        for pos, (_, sz) in enumerate(attachment_plan):
+            if rng.random() * 100 < library_reuse_percent:
+                ready_blobs[pos] = library.pick(sz, rng)
+
+    if prebuilt_blobs and attachment_plan:
+        for pos, blob in enumerate(prebuilt_blobs[:attachment_count]):
+            if ready_blobs[pos] is None:
+                ready_blobs[pos] = blob
+
+    image_pool = (_get_image_pool(image_pool_size, image_pool_refresh, image_pool_dir, seed)
+                  if attachment_plan else None)
+
+    to_build = [pos for pos, blob in enumerate(ready_blobs) if blob is None]
+    if pdf_backend == "raw" and not save_pdf and not stream_output:
+        # Raw PDFs are encoded straight to base64, far cheaper than build + encode.
+        # Streamed records instead push the raw PDF through the chunked encoder.
+        for pos in to_build:
+            ready_blobs[pos] = _encode_attachment(i, pos + 1, attachment_plan[pos][1], pdf_backend, seed=seed)
+    elif attachment_threads > 1 and len(to_build) > 1:
+        encode = partial(_encode_attachment, i, backend=pdf_backend, image_pool=image_pool, seed=seed)
+        blobs = _get_attachment_threads(attachment_threads).map(
+            lambda pos: encode(pos + 1, attachment_plan[pos][1]), to_build)
+        for pos, blob in zip(to_build, blobs):
+            ready_blobs[pos] = blob
+
+    def save_blob_pdf(pdf_filename, blob):
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        pdf_path = os.path.join(OUTPUT_DIR, pdf_filename)
+        with open(pdf_path, "wb") as f:
+            f.write(base64.b64decode(blob))
+        log(f"Saved PDF to {pdf_path}", level=2)
+
+    def build_pdf(idx, pdf_filename, sz, sink=None):
+        make_pdf = partial(generate_pdf_of_size, sz, backend=pdf_backend, image_pool=image_pool,
+                           rng=_attachment_rng(seed, i, idx), record_index=i)
+        if not save_pdf:
+            return make_pdf(sink=sink)
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        pdf_path = os.path.join(OUTPUT_DIR, pdf_filename)
+        with open(pdf_path, "wb") as f:
+            if sink is None:
+                pdf_buffer = make_pdf()
+                f.write(pdf_buffer.getvalue())
+            else:
+                pdf_buffer = make_pdf(sink=_TeeSink(sink, f))
+        log(f"Saved PDF to {pdf_path}", level=2)
+        return pdf_buffer
 
     GOODS_DESCRIPTIONS = ["FLOWERS", "chocolate", "cheese", "Make-up", "pasta", "Lemonade"]
-    use_custom_goods = random.random() < (goods_percent / 100)
-    goods_desc = random.choice(GOODS_DESCRIPTIONS) if use_custom_goods else "AERONAUTICAL INFO"
+    use_custom_goods = rng.random() < (goods_percent / 100)
+    goods_desc = rng.choice(GOODS_DESCRIPTIONS) if use_custom_goods else "AERONAUTICAL INFO"
 
     # Generate IDs
-    message_id = f"TEST-MSG-ID{uuid.uuid4()}"
+    message_id = f"TEST-MSG-ID{_record_uuid(rng, seed)}"
     lrn = f"{compact}_001LRN"
 
-    def set_text(tag_path, text):
-        tag = root.find(tag_path, ns)
-        if tag is not None:
-            tag.text = text
-
-    set_text(".//ns:descriptionOfGoods", goods_desc)
-    set_text(".//ns:MessageId", message_id)
-    set_text(".//ns:LRN", lrn)
-    set_text(".//ns:Timestamp", timestamp)
-    set_text(".//ns:documentIssueDate/ns:DateTime", timestamp)
-
-    # Inject attachments or remove them all
-    inject_attachments_multiple(root, ns, filenames_and_b64)
+    fields = {
+        "descriptionOfGoods": goods_desc,
+        "MessageId": message_id,
+        "LRN": lrn,
+        "Timestamp": timestamp,
+        "documentIssueDate": timestamp,
+    }
+    # XML around the attachment contents; base64 goes between fragments
+    with METRICS.stage("xml"):
+        fragments = XML_BACKENDS[xml_backend](base_xml_used, fields, [fname for fname, _ in attachment_plan])
+    METRICS.add_bytes("xml", sum(len(fragment) for fragment in fragments))
 
     # Decide filename AFTER we know whether we attached files
     suffix = "no_attachments" if not has_attachments else f"{total_mb_used:.1f}MB_total"
@@ -452,10 +2019,39 @@ def generate_and_update(
     base_hint = os.path.splitext(os.path.basename(base_xml_used))[0]
     xml_filename = f"{base_hint}_updated_{suffix}_{compact}_{i}.xml"
 
-    # Write XML to memory
-    xml_buffer = io.BytesIO()
-    tree.write(xml_buffer, encoding="utf-8", xml_declaration=True)
-    xml_buffer.seek(0)
+    if stream_output:
+        writers = []
+        for idx, ((fname, sz), blob) in enumerate(zip(attachment_plan, ready_blobs), start=1):
+            if blob is None:
+                writers.append(partial(build_pdf, idx, fname, sz))
+            else:
+                if save_pdf:
+                    save_blob_pdf(fname, blob)
+                writers.append(blob)
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        xml_path = os.path.join(OUTPUT_DIR, xml_filename)
+        with METRICS.stage("write"):
+            with open(xml_path, "wb") as f:
+                out = f if digest is None else _TeeSink(f, _DigestSink(digest))
+                stream_xml_with_attachments(out, fragments, writers, stream_chunk_bytes)
+                METRICS.add_bytes("write", f.tell())
+        log(f"Saved XML to {xml_path}", level=2)
+        xml_buffer = None
+    else:
+        # Build PDFs and splice their base64 between the fragments in memory
+        parts = [fragments[0]]
+        for idx, ((pdf_filename, sz), blob, fragment) in enumerate(
+                zip(attachment_plan, ready_blobs, fragments[1:]), start=1):
+            if blob is None:
+                pdf_buffer = build_pdf(idx, pdf_filename, sz)
+                with METRICS.stage("base64"):
+                    blob = base64.b64encode(pdf_buffer.getvalue())
+                METRICS.add_bytes("base64", pdf_buffer.getbuffer().nbytes)
+            elif save_pdf:
+                save_blob_pdf(pdf_filename, blob)
+            parts.append(blob)
+            parts.append(fragment)
+        xml_buffer = io.BytesIO(b"".join(parts))
 
     # Return data for CSV
     return (
@@ -465,16 +2061,1616 @@ def generate_and_update(
     )
 
 
+CSV_HEADER = [
+    "filename", "filepath", "messageId", "lrn", "timestamp",
+    "hasAttachments", "attachmentCount", "attachmentsTotalMB", "baseXml"
+]
+
+
+def _generate_record(i, s3_bucket=None, **gen_kwargs):
+    """
+    Worker entry point: generate one record, write it to OUTPUT_DIR from
+    inside the worker and return only the CSV row, so no XML payload is
+    pickled back to the parent. With `s3_bucket` the row points at the S3
+    object the parent's upload stage will create from the local file.
+
+    Returns (row, manifest_entry, (worker_pid, metrics_snapshot)).
+    """
+    digest = hashlib.sha256()
+    (xml_filename, xml_buffer, message_id, lrn, timestamp,
+     has_attachments, attachment_count, total_mb_used, base_xml_used) = generate_and_update(i, digest=digest,
+                                                                                           **gen_kwargs)
+
+    if xml_buffer is not None:
+        save_xml_locally(xml_buffer, xml_filename, digest)
+    if s3_bucket:
+        filepath = f"s3://{s3_bucket}/test_xmls/{xml_filename}"
+    else:
+        filepath = os.path.join(OUTPUT_DIR.lstrip('/'), xml_filename)
+
+    METRICS.add_record()
+    row = (
+        xml_filename, filepath, message_id, lrn, timestamp,
+        "true" if has_attachments else "false",
+        attachment_count,
+        total_mb_used,
+        base_xml_used
+    )
+    entry = {
+        "index": i,
+        "filename": xml_filename,
+        "bytes": os.path.getsize(os.path.join(OUTPUT_DIR, xml_filename)),
+        "sha256": digest.hexdigest(),
+        "row": list(row),
+    }
+    return row, entry, (os.getpid(), METRICS.snapshot())
+
+
+def _warm_imports(pdf_backend="direct"):
+    """
+    Import the generation stack: numpy, PIL unless PDFs are raw, plus
+    reportlab and PyPDF2 for the reportlab backend.
+    """
+    import numpy  # noqa: F401
+    if pdf_backend != "raw":
+        import PIL.Image  # noqa: F401
+    if pdf_backend == "reportlab":
+        import reportlab.pdfgen.canvas  # noqa: F401
+        import PyPDF2  # noqa: F401
+
+
+def _init_worker(verbosity=1, gen_kwargs=None):
+    """
+    Worker initializer, run once per process: set the log level and load
+    everything records share (imports, reportlab fonts, compiled base XMLs,
+    image pool, attachment library) so the first task does not pay for it.
+    `gen_kwargs` are the keyword arguments the tasks will be called with.
+    """
+    _set_verbosity(verbosity)
+    if not gen_kwargs:
+        return
+    pdf_backend = gen_kwargs.get("pdf_backend", "direct")
+    _warm_imports(pdf_backend)
+    if pdf_backend == "reportlab":
+        from reportlab.pdfgen import canvas
+        c = canvas.Canvas(io.BytesIO())
+        c.drawString(72, 720, "warm-up")
+        c.save()
+
+    paths = [gen_kwargs.get("base_xml")]
+    if gen_kwargs.get("alt_base_percent"):
+        paths.append(gen_kwargs.get("alt_base_xml"))
+    for path in paths:
+        if not path or not os.path.isfile(path):
+            continue
+        if gen_kwargs.get("xml_backend", "template") == "template":
+            _get_xml_template(path)
+        else:
+            _infer_namespace_from_tree(ET.parse(path))
+
+    _get_image_pool(gen_kwargs.get("image_pool_size", 0), gen_kwargs.get("image_pool_refresh", 0),
+                    gen_kwargs.get("image_pool_dir"), gen_kwargs.get("seed"))
+    if gen_kwargs.get("attachment_library"):
+        _get_attachment_library(gen_kwargs["attachment_library"])
+
+
+def _generate_payload(i, s3_bucket=None, share_results=False, **gen_kwargs):
+    """
+    Server-mode worker entry point: generate one record in memory and return
+    (row, xml_bytes, (worker_pid, metrics_snapshot)) without touching disk.
+    The row's filepath is left empty for the parent to fill in. With
+    `share_results` the XML comes back as a SharedBytes handle instead.
+    """
+    gen_kwargs.update(stream_output=False, save_pdf=False)
+    (xml_filename, xml_buffer, message_id, lrn, timestamp,
+     has_attachments, attachment_count, total_mb_used, base_xml_used) = generate_and_update(i, **gen_kwargs)
+    METRICS.add_record()
+    row = (
+        xml_filename, "", message_id, lrn, timestamp,
+        "true" if has_attachments else "false",
+        attachment_count,
+        total_mb_used,
+        base_xml_used
+    )
+    body = xml_buffer.getbuffer()
+    return row, _shared(body) if share_results else bytes(body), (os.getpid(), METRICS.snapshot())
+
+
+def _imap_bounded(executor, fn, items, max_in_flight, budget=None, discard=None):
+    """
+    Like executor.map, but yields results in completion order and keeps at
+    most `max_in_flight` tasks submitted at any time. With a MemoryBudget,
+    an item is only submitted once its estimated cost fits the budget. If the
+    caller stops early, the results of tasks still in flight are passed to
+    `discard` (e.g. to free their shared memory) once they finish.
+    """
+    pending = {}  # future -> estimated cost
+    try:
+        for item in items:
+            cost = budget.cost(item) if budget is not None else 0
+            while pending and (len(pending) >= max_in_flight or (budget is not None and not budget.fits(cost))):
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if budget is not None:
+                        budget.release(pending[future])
+                    del pending[future]
+                    yield future.result()
+            if budget is not None:
+                budget.reserve(cost)
+            pending[executor.submit(fn, item)] = cost
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if budget is not None:
+                    budget.release(pending[future])
+                del pending[future]
+                yield future.result()
+    finally:
+        if discard is not None:
+            for future in pending:
+                if not future.cancel() and future.exception() is None:
+                    discard(future.result())
+
+
+# =========================
+# Memory budget
+# =========================
+def _parse_size(text):
+    """
+    "16G", "512M", "2048" (MB) -> bytes.
+    """
+    text = str(text).strip().upper().rstrip("B")
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text) * (1 << 20))
+
+
+def _current_rss_bytes(pid):
+    """
+    Resident set size of a live process from /proc, or None where unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryBudget:
+    """
+    Admission control for record tasks under a `--max-memory` limit.
+
+    Each record's peak memory is estimated from its attachment plan: the PDF
+    being built plus, in memory mode, every base64 blob, the joined XML and
+    the copy written to disk. Records are admitted while the estimates of the
+    records in flight fit the budget left after the parent and the idle
+    workers. The estimate is scaled by what workers actually reach (their
+    peak RSS, reported with each result), and admission also pauses while
+    the measured RSS of the parent and workers is over the limit.
+
+    With a "thread" executor there are no worker processes: the records share
+    the parent, which is the only baseline, and its peak RSS is set against
+    the most memory ever reserved at once rather than one record's estimate.
+    """
+
+    def __init__(self, limit_bytes, gen_kwargs, worker_baseline_bytes, workers, executor="process"):
+        self.limit = limit_bytes
+        self.gen_kwargs = gen_kwargs
+        self.worker_baseline = worker_baseline_bytes
+        self.workers = workers
+        self.executor = executor
+        self.scale = 1.0
+        self.reserved = 0
+        self.largest_admitted = 0
+        self.peak_reserved = 0
+        self.worker_pids = set()
+
+    def estimate(self, sizes_mb):
+        if not sizes_mb:
+            return 1 << 20
+        pdf_bytes = [_bytes_from_mb(sz) for sz in sizes_mb]
+        total, largest = sum(pdf_bytes), max(pdf_bytes)
+        threaded = self.gen_kwargs.get("attachment_threads", 1) > 1
+        if threaded:
+            largest = total  # every PDF of the record may be in memory at once
+        if self.gen_kwargs.get("stream_output"):
+            chunks = self.gen_kwargs.get("stream_chunk_bytes", STREAM_CHUNK_BYTES) * 2
+            if self.gen_kwargs.get("pdf_backend") == "raw" and not threaded:
+                # Only the raw padding block is held; the PDF goes through the encoder
+                return RAW_FILL_BYTES + chunks
+            return int(largest * 7 / 3) + chunks
+        # PDF + base64 blobs + joined XML + the bytes copy written to disk
+        return largest + int(total * 4)
+
+    def cost(self, i):
+        return self.estimate(_planned_attachment_sizes(i, **self.gen_kwargs))
+
+    def max_cost(self):
+        per_cap_mb, total_mb = _effective_caps(self.gen_kwargs.get("attachment_max_mb", 2.0),
+                                               self.gen_kwargs.get("attachments_total_mb", 2.0))
+        return self.estimate(_plan_attachments(total_mb, per_cap_mb))
+
+    @classmethod
+    def plan_workers(cls, limit_bytes, gen_kwargs, workers, executor="process"):
+        """
+        Size the pool: measure this (warmed) process as the per-worker baseline
+        and cap the worker count so every worker can hold one largest record.
+        Thread workers share this process, so each only needs the record.
+        Returns the MemoryBudget for the chosen worker count.
+        """
+        parent = _current_rss_bytes(os.getpid()) or _max_rss_bytes()
+        # Workers also hold their JPEG page pool (a few hundred KB per image)
+        baseline = parent + gen_kwargs.get("image_pool_size", 0) * (512 << 10)
+        budget = cls(limit_bytes, gen_kwargs, baseline, workers, executor)
+        per_worker = budget.max_cost() if executor == "thread" else baseline + budget.max_cost()
+        fit = max(1, (limit_bytes - baseline) // per_worker)
+        budget.workers = int(min(workers, fit))
+        return budget
+
+    @property
+    def available(self):
+        if self.executor == "thread":
+            return self.limit - self.worker_baseline
+        return self.limit - self.worker_baseline * (self.workers + 1)
+
+    def fits(self, cost):
+        if (self.reserved + cost) * self.scale > self.available:
+            return False
+        measured = self.measured_rss()
+        return measured is None or measured < self.limit
+
+    def reserve(self, cost):
+        self.reserved += cost
+        self.largest_admitted = max(self.largest_admitted, cost)
+        self.peak_reserved = max(self.peak_reserved, self.reserved)
+
+    def release(self, cost):
+        self.reserved -= cost
+
+    def observe(self, worker_pid, snapshot):
+        """
+        Learn from a worker's peak RSS how far the estimate is off.
+        """
+        peak = snapshot.get("max_rss_bytes", 0)
+        if self.executor == "thread":
+            # The peak is this whole process, holding every record in flight
+            admitted = self.peak_reserved
+        else:
+            self.worker_pids.add(worker_pid)
+            admitted = self.largest_admitted
+        if peak and admitted:
+            observed = (peak - self.worker_baseline) / admitted
+            self.scale = min(max(self.scale, observed), 4.0)
+
+    def measured_rss(self):
+        pids = [os.getpid()] + sorted(self.worker_pids - {os.getpid()})
+        values = [_current_rss_bytes(pid) for pid in pids]
+        values = [v for v in values if v is not None]
+        return sum(values) if values else None
+
+
+def _generate_attachment(job, pdf_backend="direct", image_pool_size=0, image_pool_refresh=0,
+                         image_pool_dir=None, seed=None, share_results=False, **_):
+    """
+    Split-scheduling worker entry point: build attachment `idx` of record `i`
+    and return ((i, idx), base64_blob, (worker_pid, metrics_snapshot)). With
+    `share_results` the blob is a SharedBytes handle, which the parent passes
+    on to the record task without ever copying the data.
+    """
+    i, idx, size_mb = job
+    image_pool = _get_image_pool(image_pool_size, image_pool_refresh, image_pool_dir, seed)
+    blob = _encode_attachment(i, idx, size_mb, pdf_backend, image_pool, seed)
+    return (i, idx), _shared(blob) if share_results else blob, (os.getpid(), METRICS.snapshot())
+
+
+def _imap_split(executor, record_fn, attachment_fn, items, sizes_fn, max_in_flight, on_metrics=None,
+                budget=None):
+    """
+    Like _imap_bounded over `record_fn`, but a record with several attachments
+    is first fanned out as one `attachment_fn((i, idx, size_mb))` task per
+    attachment; once all of them are back, the record is submitted with
+    `prebuilt_blobs` and only assembles the XML. `sizes_fn(i)` gives the
+    attachment sizes to pre-build ([] to run the record whole) and
+    `on_metrics(pid, snapshot)` receives the attachment tasks' metrics. At
+    most `max_in_flight` tasks are submitted, and with a MemoryBudget a
+    record is only started once its cost fits.
+    """
+    items = iter(items)
+    pending = {}  # future -> ("record", i) or ("attachment", i, position)
+    blobs = {}    # record -> base64 blobs by position
+    missing = {}  # record -> attachments still being built
+    costs = {}    # record -> reserved budget
+    waiting = None  # next record, held back until it fits the budget
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < max_in_flight:
+            i = waiting if waiting is not None else next(items, None)
+            if i is None:
+                exhausted = True
+                break
+            sizes = sizes_fn(i)
+            if budget is not None:
+                cost = budget.cost(i)
+                if pending and not budget.fits(cost):
+                    waiting = i
+                    break
+                budget.reserve(cost)
+                costs[i] = cost
+            waiting = None
+            if len(sizes) < 2:
+                pending[executor.submit(record_fn, i)] = ("record", i)
+                continue
+            blobs[i], missing[i] = [None] * len(sizes), len(sizes)
+            for pos, size_mb in enumerate(sizes):
+                pending[executor.submit(attachment_fn, (i, pos + 1, size_mb))] = ("attachment", i, pos)
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            task = pending.pop(future)
+            record = task[1]
+            if task[0] == "record":
+                if budget is not None:
+                    budget.release(costs.pop(record))
+                yield future.result()
+                continue
+            _, blobs[record][task[2]], (worker_pid, snapshot) = future.result()
+            if on_metrics is not None:
+                on_metrics(worker_pid, snapshot)
+            missing[record] -= 1
+            if not missing[record]:
+                del missing[record]
+                pending[executor.submit(record_fn, record, prebuilt_blobs=blobs.pop(record))] = ("record", record)
+
+
+# =========================
+# Executors
+# =========================
+EXECUTORS = ("process", "thread", "auto")
+# Results smaller than this are cheaper to pickle than to map
+SHM_MIN_BYTES = 256 * 1024
+# Records per worker timed on each backend by --executor auto
+CALIBRATION_RECORDS_PER_WORKER = 2
+
+
+class SharedBytes:
+    """
+    Picklable handle to bytes a worker left in a shared memory segment, so
+    multi-MB results cross the process boundary as a name instead of a pickle.
+    take() copies the bytes out and frees the segment; a handle is taken once.
+    """
+
+    __slots__ = ("name", "size")
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    @classmethod
+    def share(cls, data):
+        shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        try:
+            shm.buf[:len(data)] = data
+        finally:
+            shm.close()
+        return cls(shm.name, len(data))
+
+    def take(self):
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            return bytes(shm.buf[:self.size])
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def discard(self):
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+
+
+def _shared(data):
+    """
+    `data` as a SharedBytes handle when it is large enough to be worth it.
+    """
+    if len(data) < SHM_MIN_BYTES:
+        return bytes(data)
+    return SharedBytes.share(data)
+
+
+def _unshared(value):
+    return value.take() if isinstance(value, SharedBytes) else value
+
+
+def _unshared_all(values):
+    """
+    Take every handle in `values`, used later or not. If one fails, the
+    remaining segments are still unlinked, so none outlives the task.
+    """
+    taken = []
+    try:
+        for value in values:
+            taken.append(_unshared(value))
+    finally:
+        for value in values[len(taken) + 1:]:
+            if isinstance(value, SharedBytes):
+                value.discard()
+    return taken
+
+
+def _make_executor(kind, workers, gen_kwargs):
+    """
+    A "process" or "thread" pool for generation tasks. Thread workers share
+    this process's warmed caches (compiled base XMLs, image pool, library,
+    S3 client), so they are loaded here once instead of per worker.
+    """
+    if kind == "thread":
+        _init_worker(VERBOSITY, gen_kwargs)
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="generate")
+    # Started before the fork so workers and parent share one tracker, which
+    # then sees every segment a worker creates unlinked by its consumer
+    resource_tracker.ensure_running()
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(VERBOSITY, gen_kwargs))
+
+
+def _calibrate_executor(workers, gen_kwargs, sample, task=None):
+    """
+    --executor auto: time a few records on a thread pool and on a process
+    pool, keep the faster pool and shut the other down. Each pool gets its own
+    slice of `sample` and first runs one record per worker, so start-up and
+    warm-up are not timed. With `task` (the run's record worker) those are
+    records of the run and their results are returned; without it they are
+    built in memory and dropped.
+    Returns (kind, executor, results).
+    """
+    sample = iter(sample)
+    rates = {}
+    results = []
+    kept = None
+    for kind in ("thread", "process"):
+        executor = _make_executor(kind, workers, gen_kwargs)
+        worker = task or partial(_generate_payload, share_results=kind == "process", **gen_kwargs)
+        warm = list(itertools.islice(sample, workers))
+        timed = list(itertools.islice(sample, CALIBRATION_RECORDS_PER_WORKER * workers))
+        for batch, max_in_flight in ((warm, workers), (timed, 2 * workers)):
+            start = time.perf_counter()
+            for result in _imap_bounded(executor, worker, batch, max_in_flight):
+                if task:
+                    results.append(result)
+                else:
+                    _unshared(result[1])
+        rates[kind] = len(timed) / (time.perf_counter() - start)
+        if kept is None or rates[kind] > rates[kept[0]]:
+            if kept is not None:
+                kept[1].shutdown()
+            kept = (kind, executor)
+        else:
+            executor.shutdown()
+    log(f"Executor calibration: thread {rates['thread']:.1f} records/s, "
+        f"process {rates['process']:.1f} records/s -> {kept[0]}")
+    return kept + (results,)
+
+
+def _open_executor(kind, workers, gen_kwargs, sample, task=None):
+    """
+    The generation pool for --executor `kind`; "auto" calibrates on `sample`
+    record indices, unless there are too few to be worth it, then uses threads.
+    Returns (kind, executor, results), the results of any records `task`
+    already ran during calibration.
+    """
+    if kind == "auto":
+        needed = 2 * (1 + CALIBRATION_RECORDS_PER_WORKER) * workers
+        sample = list(itertools.islice(sample, needed))
+        if len(sample) < needed:
+            kind = "thread"
+        else:
+            return _calibrate_executor(workers, gen_kwargs, sample, task)
+    return kind, _make_executor(kind, workers, gen_kwargs), []
+
+
+# =========================
+# Sharded archive output
+# =========================
+ARCHIVE_FORMATS = {"none", "tar", "zip"}
+ARCHIVE_COMPRESSIONS = {"none", "gzip", "zstd"}
+# Extra CSV columns in archive mode: where the record sits inside its shard
+ARCHIVE_CSV_COLUMNS = ["shard", "offset", "length"]
+
+
+def _zstandard():
+    """
+    The optional `zstandard` module, or None if it is not installed.
+    """
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+class ShardedArchiveWriter:
+    """
+    Packs finished record files into size-capped tar or zip shards in
+    OUTPUT_DIR, so the filesystem and S3 see one object per shard instead of
+    one per record. Every shard gets a `<shard>.index.json` sidecar listing
+    each member's name, byte offset, length, size and SHA-256.
+
+    Compression is optional and per shard: a tar shard is one gzip or zstd
+    stream (offsets then refer to the uncompressed tar), while a zip shard
+    deflates each member (offsets point at the member data in the zip file).
+    """
+
+    def __init__(self, prefix, archive_format="tar", compression="none", shard_size_mb=1024):
+        if archive_format == "zip" and compression == "zstd":
+            raise ValueError("zstd compression is only supported for tar shards")
+        if compression == "zstd" and _zstandard() is None:
+            raise ValueError("zstd compression needs the 'zstandard' package")
+        self.prefix = prefix
+        self.archive_format = archive_format
+        self.compression = compression
+        self.shard_size = _bytes_from_mb(shard_size_mb)
+        self.number = self._next_number()
+        self._archive = None
+        self._raw = None
+        self._members = []
+        self._bytes = 0
+
+    @property
+    def suffix(self):
+        if self.archive_format == "zip":
+            return ".zip"
+        return ".tar" + {"none": "", "gzip": ".gz", "zstd": ".zst"}[self.compression]
+
+    def _next_number(self):
+        """
+        Continue after the highest finished shard of this prefix (one with an
+        index), so resumed runs never overwrite completed shards.
+        """
+        pattern = re.compile(re.escape(self.prefix) + r"-(\d+)\.(tar|zip)[.a-z]*\.index\.json$")
+        numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(OUTPUT_DIR)) if m]
+        return max(numbers) + 1 if numbers else 0
+
+    @property
+    def shard_name(self):
+        return f"{self.prefix}-{self.number:05d}{self.suffix}"
+
+    def _open(self):
+        path = os.path.join(OUTPUT_DIR, self.shard_name)
+        if self.archive_format == "zip":
+            compression = zipfile.ZIP_DEFLATED if self.compression == "gzip" else zipfile.ZIP_STORED
+            self._archive = zipfile.ZipFile(path, "w", compression=compression, allowZip64=True)
+        elif self.compression == "zstd":
+            # tarfile leaves a passed-in stream open; close() ends the zstd frame
+            self._raw = _zstandard().ZstdCompressor().stream_writer(open(path, "wb"))
+            self._archive = tarfile.open(fileobj=self._raw, mode="w|")
+        else:
+            self._archive = tarfile.open(path, "w:gz" if self.compression == "gzip" else "w")
+        self._members = []
+        self._bytes = 0
+
+    def _add_member(self, file_path, arcname):
+        """
+        Append one file and return (offset, length) of its data.
+        """
+        if self.archive_format == "zip":
+            self._archive.write(file_path, arcname)
+            info = self._archive.getinfo(arcname)
+            offset = info.header_offset + 30 + len(info.filename.encode("utf-8")) + len(info.extra)
+            return offset, info.compress_size
+        tarinfo = self._archive.gettarinfo(file_path, arcname)
+        with open(file_path, "rb") as f:
+            self._archive.addfile(tarinfo, f)
+        # The member data ends at the current offset, padded to 512 bytes
+        padded = -(-tarinfo.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        return self._archive.offset - padded, tarinfo.size
+
+    def add(self, file_path, payload=None, sha256=None):
+        """
+        Move a record file into the current shard. Returns the finished shard
+        as (shard_path, index_path, [(payload, member), ...]) when this record
+        filled it, otherwise None.
+        """
+        if self._archive is None:
+            self._open()
+        arcname = os.path.basename(file_path)
+        size = os.path.getsize(file_path)
+        with METRICS.stage("archive"):
+            offset, length = self._add_member(file_path, arcname)
+        METRICS.add_bytes("archive", size)
+        os.remove(file_path)
+        member = {"name": arcname, "shard": self.shard_name, "offset": offset, "length": length,
+                  "size": size, "sha256": sha256}
+        self._members.append((payload, member))
+        self._bytes += size
+        if self._bytes >= self.shard_size:
+            return self.close()
+        return None
+
+    def close(self):
+        """
+        Finish the current shard (if any) and write its index; returns it like add().
+        """
+        if self._archive is None:
+            return None
+        self._archive.close()
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
+        self._archive = None
+        shard_path = os.path.join(OUTPUT_DIR, self.shard_name)
+        index_path = f"{shard_path}.index.json"
+        index = {
+            "shard": self.shard_name,
+            "format": self.archive_format,
+            "compression": self.compression,
+            "offsets": "uncompressed" if self.archive_format == "tar" and self.compression != "none" else "file",
+            "bytes": os.path.getsize(shard_path),
+            "members": [member for _, member in self._members],
+        }
+        with open(index_path, "w") as f:
+            json.dump(index, f, indent=1)
+        log(f"Saved shard {shard_path} ({len(self._members)} records, {index['bytes'] / (1024 * 1024):.1f} MB)")
+        members = self._members
+        self._members = []
+        self.number += 1
+        return shard_path, index_path, members
+
+
+# =========================
+# Resumable manifest
+# =========================
+class RunManifest:
+    """
+    Append-only JSON-lines checkpoint of a generation run. The first line
+    describes the run (CSV path and its size before the run started); every
+    following line is one finished record: index, filename, size, SHA-256 and
+    its CSV row. Lines are flushed as records complete, after their CSV row.
+    """
+
+    def __init__(self, path, header, entries):
+        self.path = path
+        self.header = header
+        self.entries = entries  # index -> entry
+        self._file = None
+
+    @classmethod
+    def create(cls, path, csv_name, num, seed, shard=None):
+        csv_offset = os.path.getsize(csv_name) if os.path.isfile(csv_name) else 0
+        header = {"type": "run", "csv": csv_name, "csv_offset": csv_offset, "num": num, "seed": seed,
+                  "shard": shard}
+        manifest = cls(path, header, {})
+        manifest._rewrite()
+        return manifest
+
+    @classmethod
+    def load(cls, path, check_local_files=True):
+        """
+        Read a manifest, keeping the entries whose XML (or archive shard) is
+        still in OUTPUT_DIR (all of them if `check_local_files` is False),
+        and rewrite it with only those entries. A torn last line is ignored.
+        """
+        header, entries = None, {}
+        with open(path) as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if item.get("type") == "run":
+                    header = item
+                    continue
+                if check_local_files:
+                    if item.get("shard"):
+                        if not os.path.isfile(os.path.join(OUTPUT_DIR, item["shard"])):
+                            continue
+                    else:
+                        xml_path = os.path.join(OUTPUT_DIR, item["filename"])
+                        if not os.path.isfile(xml_path) or os.path.getsize(xml_path) != item["bytes"]:
+                            continue
+                entries[item["index"]] = item
+        if header is None:
+            raise ValueError(f"{path} is not a generation manifest")
+        manifest = cls(path, header, entries)
+        manifest._rewrite()
+        return manifest
+
+    def _rewrite(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(self.header) + "\n")
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def restore_csv(self, csv_name):
+        """
+        Cut the CSV back to where it was before this run, dropping rows (and
+        any torn line) written after the last checkpoint; the caller then
+        re-appends rows() so every finished record appears exactly once.
+        """
+        if os.path.isfile(csv_name):
+            with open(csv_name, "r+b") as f:
+                f.truncate(self.header["csv_offset"])
+
+    def rows(self):
+        return [entry["row"] for entry in self.entries.values()]
+
+    def record(self, entry):
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self.entries[entry["index"]] = entry
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# =========================
+# Multi-node sharding
+# =========================
+MERGE_ORDERS = ("index", "filename", "messageId", "none")
+_RECORD_INDEX_RE = re.compile(r"_(\d+)\.xml$")
+
+
+def _parse_shard(text):
+    """
+    "K/N" -> (K, N), with shards numbered 0..N-1.
+    """
+    try:
+        k, n = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"--shard must look like K/N, got {text!r}") from None
+    if n < 1 or not 0 <= k < n:
+        raise ValueError(f"--shard {text}: need N >= 1 and 0 <= K < N")
+    return k, n
+
+
+def _shard_range(num, k, n):
+    """
+    Contiguous block of global record indices owned by shard k of n. Records
+    keep their global index, so names, message IDs and seeded content are the
+    same as in a single-node run of `num` records.
+    """
+    return range(num * k // n, num * (k + 1) // n)
+
+
+def _merge_key(order, header):
+    if order == "index":
+        column = header.index("filename")
+
+        def key(row):
+            match = _RECORD_INDEX_RE.search(row[column])
+            return int(match.group(1)) if match else -1
+        return key
+    column = header.index(order)
+    return lambda row: row[column]
+
+
+def _csv_rows(path, files):
+    """
+    Rows of a CSV after its header, from a file registered on the ExitStack `files`.
+    """
+    reader = csv.reader(files.enter_context(open(path, newline="")))
+    next(reader, None)
+    return reader
+
+
+def _sorted_runs(path, key, run_rows, tmp_dir, files):
+    """
+    Split one CSV (header skipped) into sorted runs of at most `run_rows`
+    rows: a file that fits in one run stays in memory, larger ones spill each
+    run to a temporary CSV. Yields an iterator per run.
+    """
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        spilled = []
+        while True:
+            run = list(itertools.islice(reader, run_rows))
+            if not run:
+                break
+            run.sort(key=key)
+            if not spilled and len(run) < run_rows:
+                yield iter(run)
+                return
+            run_path = os.path.join(tmp_dir, f"run-{len(os.listdir(tmp_dir)):05d}.csv")
+            with open(run_path, "w", newline="") as out:
+                csv.writer(out).writerows(run)
+            spilled.append(run_path)
+    for run_path in spilled:
+        yield csv.reader(files.enter_context(open(run_path, newline="")))
+
+
+def merge_csvs(inputs, output, order="index", run_rows=200000):
+    """
+    Combine per-shard JMeter CSVs into one. With an `order` the rows are
+    sorted by an external merge sort (sorted runs per input, then one
+    streaming k-way heapq.merge), so memory stays bounded by `run_rows`
+    per input; "none" concatenates. Returns the number of rows written.
+    """
+    header = None
+    for path in inputs:
+        with open(path, newline="") as f:
+            this = next(csv.reader(f), None)
+        if header is None:
+            header = this
+        elif this != header:
+            raise ValueError(f"{path}: header {this} differs from {header}")
+    if header is None:
+        raise ValueError("nothing to merge")
+
+    count = 0
+    out_dir = os.path.dirname(os.path.abspath(output))
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp_dir, ExitStack() as files, \
+            open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        if order == "none":
+            rows = itertools.chain.from_iterable(_csv_rows(path, files) for path in inputs)
+        else:
+            key = _merge_key(order, header)
+            runs = [run for path in inputs for run in _sorted_runs(path, key, run_rows, tmp_dir, files)]
+            rows = heapq.merge(*runs, key=key)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+# =========================
+# Per-thread JMeter data files
+# =========================
+# The columns mq.jmx's CSV Data Set reads, in order
+THREAD_FILE_COLUMNS = CSV_HEADER[:5]
+THREAD_FILE_PROPERTIES = "threads.properties"
+# Marks an inlined record in the filepath column. mq.jmx reads the data
+# files unquoted and split on commas, so the prefix must not contain one
+INLINE_PAYLOAD_PREFIX = "base64:"
+
+
+def _row_size_bytes(row):
+    """
+    Size of the record a CSV row points at: the member length for archived
+    rows, the local file when present, otherwise the planned attachment total.
+    """
+    if row.get("length"):
+        return int(row["length"])
+    path = os.path.join(OUTPUT_DIR, row["filename"])
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return _bytes_from_mb(float(row["attachmentsTotalMB"] or 0))
+
+
+def write_thread_files(csv_name, threads, inline_max_bytes=0):
+    """
+    Split `csv_name` into one headerless data file per JMeter sender thread
+    (thread_1.csv … thread_N.csv, matching __threadNum) plus a property file
+    that points mq.jmx's CSV Data Set at them with shareMode.thread, so every
+    thread reads its own file instead of queueing on one shared reader.
+
+    Rows are ranked by record size and dealt back and forth across the
+    threads, so each file gets the same number of records (±1) and the same
+    size mix; within a file the CSV order is kept. Loose records up to
+    `inline_max_bytes` are inlined in the filepath column as "base64:"
+    followed by the XML's base64, so the thread needs no file read to send them.
+
+    Returns (thread_dir, properties_path, rows_per_thread).
+    """
+    with open(csv_name, newline="") as f:
+        sizes = [_row_size_bytes(row) for row in csv.DictReader(f)]
+    order = sorted(range(len(sizes)), key=lambda r: (-sizes[r], r))
+    assignment = [0] * len(sizes)
+    for rank, r in enumerate(order):
+        lap, pos = divmod(rank, threads)
+        assignment[r] = pos if lap % 2 == 0 else threads - 1 - pos
+
+    thread_dir = os.path.splitext(csv_name)[0] + "_threads"
+    os.makedirs(thread_dir, exist_ok=True)
+    counts = [0] * threads
+    inlined = 0
+    with ExitStack() as stack:
+        writers = [csv.writer(stack.enter_context(open(os.path.join(thread_dir, f"thread_{t + 1}.csv"), "w",
+                                                       newline="")))
+                   for t in range(threads)]
+        with open(csv_name, newline="") as f:
+            for r, row in enumerate(csv.DictReader(f)):
+                path = os.path.join(OUTPUT_DIR, row["filename"])
+                if sizes[r] <= inline_max_bytes and not row.get("shard") and os.path.isfile(path):
+                    with open(path, "rb") as xml_file:
+                        row["filepath"] = INLINE_PAYLOAD_PREFIX + base64.b64encode(xml_file.read()).decode()
+                    inlined += 1
+                t = assignment[r]
+                writers[t].writerow([row[c] for c in THREAD_FILE_COLUMNS])
+                counts[t] += 1
+
+    properties_path = os.path.join(thread_dir, THREAD_FILE_PROPERTIES)
+    with open(properties_path, "w") as f:
+        f.write(f"# Generated from {csv_name}: {len(sizes)} records over {threads} sender threads\n")
+        f.write(f"# Run with: jmeter -n -t mq.jmx -q {properties_path}\n")
+        f.write(f"senderThreads={threads}\n")
+        f.write(f"totalMessages={len(sizes)}\n")
+        f.write(f"dataFile={os.path.abspath(thread_dir)}/thread_${{__threadNum}}.csv\n")
+        f.write("dataShareMode=shareMode.thread\n")
+    log(f"Wrote {threads} per-thread data files to {thread_dir} ({inlined} records inlined); "
+        f"JMeter properties: {properties_path}")
+    return thread_dir, properties_path, counts
+
+
+# =========================
+# Corpus validation
+# =========================
+VALIDATE_CHUNK_BYTES = 1024 * 1024
+VALIDATE_BATCH = 16  # loose files per validation task
+# Numbers, quoted values and attachment names, stripped to group problems by kind
+_PROBLEM_DETAIL_RE = re.compile(r"'[^']*'|^[^:]*\.pdf(?=:)|\b\d+(\.\d+)?\b")
+
+
+class StreamingRecordValidator:
+    """
+    Checks one record XML while it is fed in chunks: expat parses the
+    markup and every <content> is base64-decoded incrementally, so only a
+    chunk and a few bytes of state are held whatever the attachment sizes.
+
+    Collects MessageId, LRN and one (filename, decoded_bytes) entry per
+    attachment, and reports bad base64, attachments that do not start with
+    %PDF- or lack a %%EOF trailer, and attachments over the per-attachment cap.
+    """
+
+    CAPTURE = {"MessageId", "LRN", "filename"}
+
+    def __init__(self, max_attachment_bytes):
+        self.max_attachment_bytes = max_attachment_bytes
+        self.values = {}
+        self.attachments = []
+        self.problems = []
+        self.malformed = False
+        self._stack = []  # [local_name, {"filename": ..., "content": ...}]
+        self._text = []
+        self._parser = xml.parsers.expat.ParserCreate(namespace_separator=" ")
+        self._parser.buffer_text = True
+        self._parser.buffer_size = VALIDATE_CHUNK_BYTES
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._data
+
+    def _start(self, name, attrs):
+        local = name.rsplit(" ", 1)[-1]
+        self._stack.append([local, {}])
+        if local == "content":
+            self._b64 = ""
+            self._decoded = 0
+            self._head = b""
+            self._tail = b""
+            self._b64_error = False
+        elif local in self.CAPTURE:
+            self._text = []
+
+    def _data(self, text):
+        local = self._stack[-1][0] if self._stack else None
+        if local == "content":
+            self._b64 += text
+            if len(self._b64) >= VALIDATE_CHUNK_BYTES:
+                self._decode(final=False)
+        elif local in self.CAPTURE:
+            self._text.append(text)
+
+    def _decode(self, final):
+        data = "".join(self._b64.split())
+        cut = len(data) if final else len(data) - len(data) % 4
+        self._b64 = data[cut:]
+        if not cut or self._b64_error:
+            return
+        try:
+            chunk = binascii.a2b_base64(data[:cut], strict_mode=True)
+        except (binascii.Error, ValueError):
+            self._b64_error = True
+            return
+        if len(self._head) < 5:
+            self._head += chunk[:5 - len(self._head)]
+        self._tail = (self._tail + chunk[-1024:])[-1024:]
+        self._decoded += len(chunk)
+
+    def _end(self, name):
+        local, children = self._stack.pop()
+        parent = self._stack[-1][1] if self._stack else {}
+        if local == "content":
+            self._decode(final=True)
+            parent["content"] = (self._decoded, self._head, self._tail, self._b64_error)
+        elif local in self.CAPTURE:
+            value = "".join(self._text).strip()
+            if local == "filename":
+                parent["filename"] = value
+            else:
+                self.values.setdefault(local, value)
+        if "content" in children and "filename" in children:
+            self._attachment(children["filename"], *children["content"])
+
+    def _attachment(self, filename, decoded, head, tail, b64_error):
+        self.attachments.append((filename, decoded))
+        if b64_error:
+            self.problems.append(f"{filename}: invalid base64")
+            return
+        if not head.startswith(b"%PDF-"):
+            self.problems.append(f"{filename}: not a PDF (no %PDF- header)")
+        elif b"%%EOF" not in tail:
+            self.problems.append(f"{filename}: PDF has no %%EOF trailer")
+        if decoded > self.max_attachment_bytes:
+            self.problems.append(f"{filename}: {decoded} bytes exceeds the {MAX_PER_ATTACHMENT_MB:g} MB cap")
+
+    def feed(self, data, final=False):
+        """
+        Parse the next chunk; returns False once the XML is found to be malformed.
+        """
+        try:
+            self._parser.Parse(data, final)
+        except xml.parsers.expat.ExpatError as e:
+            self.problems.append(f"malformed XML: {e}")
+            self.malformed = final = True
+        if final:
+            # The handlers are bound methods; dropping the parser breaks the
+            # cycle so its buffers are freed now rather than at the next GC
+            self._parser = None
+        return not self.malformed
+
+    def check_row(self, row, max_total_bytes):
+        """
+        Cross-check what was parsed against the record's CSV row and the total cap.
+        """
+        problems = self.problems
+        for field, column in (("MessageId", "messageId"), ("LRN", "lrn")):
+            if self.values.get(field) != row[column]:
+                problems.append(f"{field} {self.values.get(field)!r} does not match CSV {row[column]!r}")
+        count = len(self.attachments)
+        if str(count) != row["attachmentCount"]:
+            problems.append(f"{count} attachments, CSV says {row['attachmentCount']}")
+        if (count > 0) != (row["hasAttachments"] == "true"):
+            problems.append(f"hasAttachments is {row['hasAttachments']} but the XML has {count} attachments")
+        total = sum(size for _, size in self.attachments)
+        if total > max_total_bytes:
+            problems.append(f"attachments total {total} bytes exceeds the {MAX_TOTAL_ATTACHMENTS_MB:g} MB cap")
+        if total > _bytes_from_mb(float(row["attachmentsTotalMB"] or 0)):
+            problems.append(f"attachments total {total} bytes exceeds the CSV's {row['attachmentsTotalMB']} MB")
+        return problems
+
+
+def _validate_stream(f, row):
+    """
+    Validate one record read from the binary file object `f`; returns
+    (filename, problems, bytes_read).
+    """
+    validator = StreamingRecordValidator(_bytes_from_mb(MAX_PER_ATTACHMENT_MB))
+    nbytes = 0
+    while True:
+        chunk = f.read(VALIDATE_CHUNK_BYTES)
+        nbytes += len(chunk)
+        if not validator.feed(chunk, final=not chunk):
+            # A truncated or broken record has nothing reliable to cross-check
+            return row["filename"], validator.problems, nbytes
+        if not chunk:
+            break
+    return row["filename"], validator.check_row(row, _bytes_from_mb(MAX_TOTAL_ATTACHMENTS_MB)), nbytes
+
+
+def _validate_task(task):
+    """
+    Worker entry point: ("files", [rows]) validates loose XMLs in OUTPUT_DIR,
+    ("shard", shard_name, {member: row}) streams every member of one archive
+    shard. Returns a list of (filename, problems, bytes_read).
+    """
+    results = []
+    if task[0] == "files":
+        for row in task[1]:
+            path = os.path.join(OUTPUT_DIR, row["filename"])
+            if not os.path.isfile(path):
+                results.append((row["filename"], ["file missing"], 0))
+                continue
+            with open(path, "rb") as f:
+                results.append(_validate_stream(f, row))
+        return results
+
+    _, shard_name, rows = task
+    path = os.path.join(OUTPUT_DIR, shard_name)
+    if not os.path.isfile(path):
+        return [(name, [f"shard {shard_name} missing"], 0) for name in rows]
+    seen = set()
+    if shard_name.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name in rows:
+                    seen.add(name)
+                    with archive.open(name) as f:
+                        results.append(_validate_stream(f, rows[name]))
+    else:
+        with open(path, "rb") as raw:
+            stream = _zstandard().ZstdDecompressor().stream_reader(raw) if shard_name.endswith(".zst") else raw
+            with tarfile.open(fileobj=stream, mode="r|gz" if shard_name.endswith(".gz") else "r|") as archive:
+                for member in archive:
+                    if member.name in rows:
+                        seen.add(member.name)
+                        results.append(_validate_stream(archive.extractfile(member), rows[member.name]))
+    results.extend((name, [f"not found in shard {shard_name}"], 0) for name in rows if name not in seen)
+    return results
+
+
+def validate_corpus(csv_name, executor, max_in_flight):
+    """
+    Validate every record listed in `csv_name` on `executor`. Records still
+    only on S3 are skipped. Returns (checked, violations, skipped, bytes_read)
+    with violations as (filename, problem) pairs, including duplicate
+    messageIds.
+    """
+    tasks, batch, shards = [], [], {}
+    violations, message_ids = [], set()
+    skipped = 0
+    with open(csv_name, newline="") as f:
+        for row in csv.DictReader(f):
+            if row["messageId"] in message_ids:
+                violations.append((row["filename"], f"duplicate messageId {row['messageId']}"))
+            message_ids.add(row["messageId"])
+            if row.get("shard"):
+                shards.setdefault(row["shard"], {})[row["filename"]] = row
+            elif row["filepath"].startswith("s3://") and not os.path.isfile(os.path.join(OUTPUT_DIR, row["filename"])):
+                skipped += 1
+            else:
+                batch.append(row)
+                if len(batch) >= VALIDATE_BATCH:
+                    tasks.append(("files", batch))
+                    batch = []
+    if batch:
+        tasks.append(("files", batch))
+    tasks.extend(("shard", name, rows) for name, rows in shards.items())
+
+    checked = bytes_read = 0
+    for results in _imap_bounded(executor, _validate_task, tasks, max_in_flight):
+        for filename, problems, nbytes in results:
+            checked += 1
+            bytes_read += nbytes
+            violations.extend((filename, problem) for problem in problems)
+            log(f"{filename}: {'OK' if not problems else '; '.join(problems)}", level=2)
+    return checked, violations, skipped, bytes_read
+
+
+def unlisted_xmls(csv_name):
+    """
+    XMLs in OUTPUT_DIR that `csv_name` does not list. OUTPUT_DIR is shared by
+    runs, so these are only reported as a warning by --validate-orphans.
+    """
+    with open(csv_name, newline="") as f:
+        listed = {row["filename"] for row in csv.DictReader(f)}
+    return [name for name in sorted(os.listdir(OUTPUT_DIR)) if name.endswith(".xml") and name not in listed]
+
+
+# =========================
+# Run metrics
+# =========================
+class RunMonitor:
+    """
+    Parent-side view of a generation run. Merges the workers' cumulative
+    StageMetrics snapshots with the parent's own (uploads, CSV writes), prints
+    live records/s and MB/s every `interval` seconds and builds the summary.
+    """
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self.started = time.monotonic()
+        self._cpu_started = time.process_time()
+        self._last_report = self.started
+        self.workers = {}
+        self.records = 0
+
+    def update(self, worker, snapshot):
+        self.workers[worker] = snapshot
+
+    def record_done(self):
+        self.records += 1
+        if self.interval and VERBOSITY >= 1:
+            now = time.monotonic()
+            if now - self._last_report >= self.interval:
+                self._last_report = now
+                elapsed = now - self.started
+                processes = list(self.workers.values())
+                if os.getpid() not in self.workers:
+                    processes.append(METRICS.snapshot())
+                output_mb = sum(p["bytes"]["write"] + p["bytes"]["serve"] for p in processes) / (1024 * 1024)
+                print(f"[progress] {self.records} records in {elapsed:.0f}s: "
+                      f"{self.records / elapsed:.1f} records/s, {output_mb / elapsed:.1f} MB/s")
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        # Thread workers share the parent's collector; its latest snapshot wins
+        processes = dict(self.workers)
+        processes[os.getpid()] = parent = METRICS.snapshot()
+        parent["cpu_seconds"] -= self._cpu_started
+        stages = {
+            name: {
+                "seconds": sum(p["seconds"][name] for p in processes.values()),
+                "bytes": sum(p["bytes"][name] for p in processes.values()),
+                "calls": sum(p["calls"][name] for p in processes.values()),
+            }
+            for name in StageMetrics.STAGES
+        }
+        output_bytes = stages["write"]["bytes"] + stages["serve"]["bytes"]
+        cpu_seconds = sum(p["cpu_seconds"] for p in processes.values())
+        return {
+            "records": self.records,
+            "elapsed_seconds": elapsed,
+            "records_per_second": self.records / elapsed,
+            "output_bytes": output_bytes,
+            "megabytes_per_second": output_bytes / (1024 * 1024) / elapsed,
+            "cpu_seconds": cpu_seconds,
+            "cpu_cores_used": cpu_seconds / elapsed,
+            "peak_rss_bytes": max(p["max_rss_bytes"] for p in processes.values()),
+            "peak_rss_bytes_total": sum(p["max_rss_bytes"] for p in processes.values()),
+            "stages": stages,
+            "processes": {str(pid): p for pid, p in processes.items()},
+        }
+
+    @staticmethod
+    def print_summary(summary):
+        log(f"Generated {summary['records']} records in {summary['elapsed_seconds']:.1f}s: "
+            f"{summary['records_per_second']:.1f} records/s, {summary['megabytes_per_second']:.1f} MB/s, "
+            f"{summary['cpu_cores_used']:.1f} CPU cores, peak RSS {summary['peak_rss_bytes_total'] / (1024 * 1024):.0f} MB "
+            f"across {len(summary['processes'])} processes", level=0)
+        busy = sum(stage["seconds"] for stage in summary["stages"].values()) or 1e-9
+        log(f"{'stage':<8} {'seconds':>9} {'share':>6} {'MB':>10} {'MB/s':>9}")
+        for name, stage in summary["stages"].items():
+            mb = stage["bytes"] / (1024 * 1024)
+            rate = mb / stage["seconds"] if stage["seconds"] else 0.0
+            log(f"{name:<8} {stage['seconds']:>9.2f} {stage['seconds'] / busy:>6.1%} {mb:>10.1f} {rate:>9.1f}")
+
+    @staticmethod
+    def write_json(summary, path):
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+        log(f"Metrics saved: {path}")
+
+    @staticmethod
+    def write_prometheus(summary, path):
+        """
+        Write the summary in the Prometheus textfile-collector format,
+        replacing the file atomically.
+        """
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP xmlgen_{name} {help_text}")
+            lines.append(f"# TYPE xmlgen_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"xmlgen_{name}{labels} {value}")
+
+        stages = summary["stages"]
+        metric("records_total", "counter", "Records generated.", [("", summary["records"])])
+        metric("run_seconds", "gauge", "Wall time of the run.", [("", f"{summary['elapsed_seconds']:.6f}")])
+        metric("output_bytes_total", "counter", "XML bytes written or served.", [("", summary["output_bytes"])])
+        metric("records_per_second", "gauge", "Average records per second.",
+               [("", f"{summary['records_per_second']:.6f}")])
+        metric("megabytes_per_second", "gauge", "Average output MB per second.",
+               [("", f"{summary['megabytes_per_second']:.6f}")])
+        metric("cpu_seconds_total", "counter", "CPU time of the parent and worker processes.",
+               [("", f"{summary['cpu_seconds']:.6f}")])
+        metric("peak_rss_bytes", "gauge", "Peak resident memory, summed over processes.",
+               [("", summary["peak_rss_bytes_total"])])
+        metric("stage_seconds_total", "counter", "Exclusive time spent per stage.",
+               [(f'{{stage="{name}"}}', f"{stage['seconds']:.6f}") for name, stage in stages.items()])
+        metric("stage_bytes_total", "counter", "Bytes processed per stage.",
+               [(f'{{stage="{name}"}}', stage["bytes"]) for name, stage in stages.items()])
+        metric("stage_calls_total", "counter", "Timed calls per stage.",
+               [(f'{{stage="{name}"}}', stage["calls"]) for name, stage in stages.items()])
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+        log(f"Prometheus metrics saved: {path}")
+
+
+# =========================
+# Payload server
+# =========================
+class PayloadRing:
+    """
+    Bounded FIFO of ready (row, xml_bytes) payloads between the filler thread
+    and the HTTP handler threads. put() blocks while the ring is full; take()
+    waits up to `timeout` seconds while it is empty and returns None if
+    nothing arrived. Each payload is handed out exactly once.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self.closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._items) < self.capacity or self.closed)
+            if self.closed:
+                return False
+            self._items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def take(self, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self.closed, timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+def _fill_payload_ring(ring, executor, worker, max_in_flight, monitor, start_index=0):
+    """
+    Keep the generation workers busy producing payloads for record indices
+    start_index, start_index + 1, ... until the ring is closed.
+    """
+    results = _imap_bounded(executor, worker, itertools.count(start_index), max_in_flight,
+                            discard=lambda result: _unshared(result[1]))
+    for row, body, (worker_pid, snapshot) in results:
+        monitor.update(worker_pid, snapshot)
+        if not ring.put((row, _unshared(body))):
+            break
+    results.close()
+
+
+class PayloadRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /payload returns one freshly generated XML (never the same one twice)
+    with its messageId and LRN in X-Message-Id / X-LRN headers; GET /stats
+    returns ring and throughput counters as JSON. HTTP/1.1, so JMeter keeps
+    its connections alive.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "XmlPayloadServer/1.0"
+
+    def _send(self, status, body, content_type, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/payload":
+            payload = self.server.ring.take(self.server.wait_timeout)
+            if payload is None:
+                self._send(503, b"no payload ready\n", "text/plain", [("Retry-After", "1")])
+                return
+            row, body = payload
+            with METRICS.stage("serve"):
+                self._send(200, body, "application/xml", [
+                    ("X-Message-Id", row[2]),
+                    ("X-LRN", row[3]),
+                    ("X-Timestamp", row[4]),
+                    ("X-Filename", row[0]),
+                    ("X-Attachment-Count", str(row[6])),
+                ])
+            METRICS.add_bytes("serve", len(body))
+            self.server.served(row)
+        elif path == "/stats":
+            stats = {"served": self.server.served_count, "ready": len(self.server.ring),
+                     "capacity": self.server.ring.capacity}
+            self._send(200, json.dumps(stats).encode("utf-8"), "application/json")
+        else:
+            self._send(404, b"not found\n", "text/plain")
+
+    def log_message(self, format, *args):
+        log(f"{self.address_string()} {format % args}", level=2)
+
+
+class PayloadServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server over a PayloadRing. Served rows are appended to the
+    CSV (so results can still be joined on messageId) and, once `limit`
+    payloads are served (0 = unlimited), the server shuts itself down.
+    """
+
+    daemon_threads = True
+    request_queue_size = 256  # room for every JMeter sender thread to connect at once
+
+    def __init__(self, address, ring, csv_writer, csv_file, monitor, wait_timeout=30.0, limit=0):
+        super().__init__(address, PayloadRequestHandler)
+        self.payload_url = f"http://{address[0]}:{self.server_address[1]}/payload"
+        self.ring = ring
+        self.wait_timeout = wait_timeout
+        self.limit = limit
+        self.served_count = 0
+        self._csv_writer = csv_writer
+        self._csv_file = csv_file
+        self._monitor = monitor
+        self._lock = threading.Lock()
+
+    def served(self, row):
+        with self._lock:
+            with METRICS.stage("csv"):
+                self._csv_writer.writerow((row[0], self.payload_url) + tuple(row[2:]))
+                self._csv_file.flush()
+            self.served_count += 1
+            self._monitor.record_done()
+            if self.limit and self.served_count == self.limit:
+                threading.Thread(target=self.shutdown, daemon=True).start()
+
+
+def serve_payloads(host, port, ring_size, executor, worker, max_in_flight, csv_name, monitor,
+                   wait_timeout=30.0, limit=0):
+    """
+    Run the payload server until interrupted (or `limit` payloads are served).
+    """
+    ring = PayloadRing(ring_size)
+    file_exists = os.path.isfile(csv_name) and os.path.getsize(csv_name) > 0
+    with open(csv_name, mode="a", newline="") as f:
+        writer = csv.writer(f)
+        if not file_exists:
+            writer.writerow(CSV_HEADER)
+        server = PayloadServer((host, port), ring, writer, f, monitor, wait_timeout, limit)
+        filler = threading.Thread(target=_fill_payload_ring, name="payload-filler", daemon=True,
+                                  args=(ring, executor, worker, max_in_flight, monitor))
+        filler.start()
+        log(f"Serving payloads on {server.payload_url} "
+            f"(ring of {ring_size}, {limit or 'unlimited'} payloads)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            log("Stopping payload server...")
+        finally:
+            ring.close()
+            server.server_close()
+            # Lets the filler free the records still being generated
+            filler.join()
+    log(f"Served {server.served_count} payloads; rows appended to {csv_name}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Generate XML with multiple ≤2MB attachments; optionally upload to S3")
     parser.add_argument("--num", type=int, default=5, help="Number of XML files to generate")
     parser.add_argument("--upload-s3", action="store_true", help="Upload output XML files to S3")
     parser.add_argument("--s3-bucket", type=str, help="S3 bucket to upload to")
+    parser.add_argument("--s3-endpoint-url", type=str, default=os.getenv("S3_ENDPOINT_URL"),
+                        help="Custom S3 endpoint (e.g. a local MinIO or moto server)")
+    parser.add_argument("--upload-concurrency", type=int, default=8,
+                        help="Number of concurrent S3 uploads")
+    parser.add_argument("--multipart-threshold-mb", type=float, default=8,
+                        help="Files at least this large are uploaded with multipart")
+    parser.add_argument("--multipart-chunksize-mb", type=float, default=8,
+                        help="Part size for multipart uploads")
+    parser.add_argument("--s3-sync", action="store_true",
+                        help="With --upload-s3, list test_xmls/ first and upload only missing or changed XMLs; "
+                             "seeded records already in the bucket are not generated again")
+    parser.add_argument("--sync-manifest", type=str, default=None, metavar="PATH",
+                        help="Local manifest of synced objects (default: .s3sync-<bucket>.jsonl next to the CSV)")
+    parser.add_argument("--keep-local", action="store_true",
+                        help="Keep local XML copies after uploading them to S3")
     parser.add_argument("--cleanup", action="store_true", help="Remove local files after processing")
     parser.add_argument("--cleanup-s3", action="store_true", help="Remove s3 files after processing (using CSV)")
+    # Attachment library controls
+    parser.add_argument("--build-attachment-library", type=str, default=None, metavar="PATH",
+                        help="Build an indexed library of base64-encoded PDFs at PATH and exit")
+    parser.add_argument("--library-sizes", type=str, default="0.5,1,2",
+                        help="Comma-separated PDF sizes in MB for --build-attachment-library")
+    parser.add_argument("--library-per-size", type=int, default=8,
+                        help="PDFs to build per size for --build-attachment-library")
+    parser.add_argument("--attachment-library", type=str, default=None, metavar="PATH",
+                        help="Memory-map this attachment library and splice its PDFs into records")
+    parser.add_argument("--library-reuse-percent", type=int, default=100,
+                        help="Percentage (0-100) of attachments taken from --attachment-library")
+    # Logging & metrics
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Only print errors and the final summary line")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Also print one line per generated PDF, saved XML and upload")
+    parser.add_argument("--progress-interval", type=float, default=5.0,
+                        help="Seconds between live records/s and MB/s lines (0 disables)")
+    parser.add_argument("--metrics-json", type=str, default=None, metavar="PATH",
+                        help="Write the run's per-stage timing and throughput summary as JSON")
+    parser.add_argument("--metrics-prom", type=str, default=None, metavar="PATH",
+                        help="Write the same summary as a Prometheus textfile")
+    # Archive output
+    parser.add_argument("--archive", choices=sorted(ARCHIVE_FORMATS), default="none",
+                        help="Pack records into tar or zip shards instead of one file/object per record")
+    parser.add_argument("--archive-compression", choices=sorted(ARCHIVE_COMPRESSIONS), default="none",
+                        help="Per-shard compression for --archive (zstd needs the zstandard package, tar only)")
+    parser.add_argument("--shard-size-mb", type=float, default=1024,
+                        help="Start a new shard once the current one holds this many MB of records")
+    # Payload server mode
+    parser.add_argument("--serve", type=int, default=None, metavar="PORT",
+                        help="Serve freshly generated XMLs over HTTP on PORT (GET /payload) instead of writing files")
+    parser.add_argument("--serve-host", type=str, default="127.0.0.1", help="Address for --serve to bind")
+    parser.add_argument("--ring-size", type=int, default=32,
+                        help="Generated payloads kept ready in memory for --serve")
+    parser.add_argument("--serve-limit", type=int, default=0,
+                        help="Stop --serve after this many payloads (0 = until interrupted)")
+    parser.add_argument("--serve-wait", type=float, default=30.0,
+                        help="Seconds a GET waits for a payload before answering 503")
+    # Checkpointing
+    parser.add_argument("--manifest", type=str, default=None, metavar="PATH",
+                        help="Checkpoint manifest of finished records (default: <csv-name>.manifest.jsonl)")
+    parser.add_argument("--shard", type=str, default=None, metavar="K/N",
+                        help="Generate only shard K (0-based) of N: a disjoint block of the --num global indices, "
+                             "so nodes produce globally unique names and keys")
+    parser.add_argument("--merge-csvs", type=str, nargs="+", default=None, metavar="CSV",
+                        help="Merge per-shard CSVs into --csv-name and exit")
+    parser.add_argument("--merge-order", choices=MERGE_ORDERS, default="index",
+                        help="Row order of the merged CSV (streaming k-way merge; 'none' concatenates)")
+    parser.add_argument("--thread-files", type=int, default=0, metavar="N",
+                        help="After the run (or --merge-csvs), split the CSV into N per-thread JMeter data files "
+                             "balanced by record size, plus a properties file for mq.jmx (use senderThreads)")
+    parser.add_argument("--inline-max-kb", type=float, default=0,
+                        help="With --thread-files, inline records up to this size as base64:<payload> "
+                             "instead of a file path")
+    parser.add_argument("--validate", action="store_true",
+                        help="Stream-validate every record listed in --csv-name (XML, base64, PDF framing, "
+                             "caps, CSV agreement) on --workers processes and exit; exit status 1 on violations")
+    parser.add_argument("--validate-orphans", action="store_true",
+                        help="With --validate, also warn about XMLs in the output directory the CSV does not list")
+    parser.add_argument("--validate-report", type=str, default=None, metavar="PATH",
+                        help="With --validate, write every violation to PATH as JSON lines")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip records already in the manifest and append the rest to the same CSV")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed for reproducible output: the same seed and index always give the same record")
+    parser.add_argument("--timestamp", type=str, default=None,
+                        help="Fixed UTC timestamp (e.g. 2024-01-01T00:00:00Z) for names and XML dates; "
+                             "defaults to 2024-01-01T00:00:00Z with --seed, otherwise the current time")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of generation worker processes")
+    parser.add_argument("--executor", choices=EXECUTORS, default="process",
+                        help="Generation pool: processes (large results via shared memory), threads sharing "
+                             "one set of caches with no IPC, or auto to time both on a few records and keep the faster")
+    parser.add_argument("--max-in-flight", type=int, default=0,
+                        help="Max records submitted to workers at once (default: 2 x --workers)")
+    parser.add_argument("--max-memory", type=str, default=None,
+                        help="Memory budget for the parent and workers (e.g. 12G, 800M): caps the worker count "
+                             "and admits records only while their estimated peak memory fits")
+    parser.add_argument("--attachment-threads", type=int, default=1,
+                        help="Threads per worker building one record's attachments concurrently")
+    parser.add_argument("--split-attachments", choices=["auto", "on", "off"], default="auto",
+                        help="Schedule attachments as separate pool tasks and assemble each record when its "
+                             "attachments are ready (auto: when there are fewer records than workers)")
+    parser.add_argument("--cleanup-s3-prefix", type=str, default=None,
+                        help="Remove every s3 object under this prefix (e.g. test_xmls/) when the CSV is lost")
+    parser.add_argument("--delete-concurrency", type=int, default=8,
+                        help="Number of concurrent 1,000-key S3 delete batches")
     parser.add_argument("--csv-name", type=str, default=None, help="Custom name for CSV file when uploading to S3")
     parser.add_argument("--goods-percent", type=int, default=0, help="Percentage of files with custom goods descriptions")
     parser.add_argument("--save-pdf", action="store_true", help="Also save generated PDFs locally next to XMLs")
+    parser.add_argument("--pdf-backend", choices=sorted(PDF_BACKENDS), default="direct",
+                        help="PDF engine: 'direct' writes JPEG pages with exact sizing, 'reportlab' is the legacy path, "
+                             "'raw' is a one-page PDF padded to the exact size with random bytes")
+    # Page-image pool controls
+    parser.add_argument("--image-pool-size", type=int, default=16,
+                        help="Pre-encoded JPEG pages kept per worker and reused across PDFs (0 = encode every page)")
+    parser.add_argument("--image-pool-refresh", type=int, default=0,
+                        help="Start a new pool epoch every N records; pooled images are re-encoded when first "
+                             "drawn in a new epoch (0 = never)")
+    parser.add_argument("--image-pool-dir", type=str, default=None,
+                        help="Load the image pool from this directory of JPEGs (built and saved there if empty)")
+    # Streaming output
+    parser.add_argument("--stream-output", action="store_true",
+                        help="Write each XML straight to disk, streaming attachment base64 in chunks")
+    parser.add_argument("--xml-backend", choices=sorted(XML_BACKENDS), default="template",
+                        help="XML engine: 'template' compiles each base XML once, 'etree' re-parses it per record")
+    parser.add_argument("--stream-chunk-kb", type=int, default=STREAM_CHUNK_BYTES // 1024,
+                        help="Chunk size in KB for --stream-output")
     # Multi-attachment controls
     parser.add_argument("--attachments-total-mb", type=float, default=2.0,
                         help="Total MB budget for ALL attachments per XML (≤ 10 MB)")
@@ -493,6 +3689,9 @@ def main():
 
     args = parser.parse_args()
 
+    global VERBOSITY
+    VERBOSITY = 0 if args.quiet else 2 if args.verbose else 1
+
     # Validate percentages
     if args.no_attachments_percent < 0 or args.no_attachments_percent > 100:
         raise ValueError("--no-attachments-percent must be between 0 and 100")
@@ -500,80 +3699,344 @@ def main():
         raise ValueError("--alt-base-percent must be between 0 and 100")
     if args.alt_base_percent > 0 and not args.alt_base_xml:
         raise ValueError("--alt-base-percent was set but --alt-base-xml is missing")
+    if args.image_pool_size < 0 or args.image_pool_refresh < 0:
+        raise ValueError("--image-pool-size and --image-pool-refresh must be >= 0")
+    if args.workers < 1 or args.max_in_flight < 0:
+        raise ValueError("--workers must be >= 1 and --max-in-flight >= 0")
+    if args.upload_concurrency < 1:
+        raise ValueError("--upload-concurrency must be >= 1")
+    if args.resume and not (args.csv_name or args.manifest):
+        raise ValueError("--resume needs --csv-name or --manifest to find the previous run")
+    if args.serve is not None and (args.ring_size < 1 or args.upload_s3 or args.archive != "none"):
+        raise ValueError("--serve needs --ring-size >= 1 and cannot be combined with --upload-s3 or --archive")
+    if args.archive == "zip" and args.archive_compression == "zstd":
+        raise ValueError("--archive-compression zstd is only supported with --archive tar")
+    if args.archive_compression == "zstd" and _zstandard() is None:
+        raise ValueError("--archive-compression zstd needs the 'zstandard' package")
+    if args.seed is not None and args.seed < 0:
+        raise ValueError("--seed must be >= 0")
+    if args.library_reuse_percent < 0 or args.library_reuse_percent > 100:
+        raise ValueError("--library-reuse-percent must be between 0 and 100")
+    if args.attachment_threads < 1:
+        raise ValueError("--attachment-threads must be >= 1")
+    if args.max_memory is not None and _parse_size(args.max_memory) <= 0:
+        raise ValueError("--max-memory must be a positive size such as 12G or 800M")
+    if args.thread_files < 0 or args.inline_max_kb < 0:
+        raise ValueError("--thread-files and --inline-max-kb must be >= 0")
+    if args.s3_sync and (not args.upload_s3 or args.archive != "none"):
+        raise ValueError("--s3-sync needs --upload-s3 and loose XMLs (--archive none)")
+    if args.pdf_backend == "raw":
+        # Raw PDFs have no page images, so there is no pool to build
+        args.image_pool_size, args.image_pool_dir = 0, None
+    shard = _parse_shard(args.shard) if args.shard else None
+    if shard and args.serve is not None:
+        raise ValueError("--shard cannot be combined with --serve")
+
+    if args.merge_csvs:
+        if not args.csv_name:
+            raise ValueError("--merge-csvs needs --csv-name for the merged CSV")
+        count = merge_csvs(args.merge_csvs, args.csv_name, args.merge_order)
+        print(f"Merged {len(args.merge_csvs)} CSV(s) into {args.csv_name}: {count} rows")
+        if args.thread_files:
+            write_thread_files(args.csv_name, args.thread_files, int(args.inline_max_kb * 1024))
+        return
+
+    if args.validate:
+        if not args.csv_name:
+            raise ValueError("--validate needs --csv-name for the CSV to check against")
+        start = time.time()
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            checked, violations, skipped, nbytes = validate_corpus(
+                args.csv_name, executor, args.max_in_flight or 2 * args.workers)
+        elapsed = time.time() - start
+        print(f"Validated {checked} records ({nbytes / (1024 * 1024):.1f} MB) in {elapsed:.1f}s, "
+              f"{skipped} skipped (S3 only), {len(violations)} violation(s)")
+        by_kind = collections.Counter(_PROBLEM_DETAIL_RE.sub("…", problem) for _, problem in violations)
+        for kind, count in by_kind.most_common(10):
+            print(f"  {count:>6}  {kind}")
+        for filename, problem in violations[:20]:
+            print(f"  {filename}: {problem}")
+        if args.validate_orphans:
+            orphans = unlisted_xmls(args.csv_name)
+            if orphans:
+                print(f"WARNING: {len(orphans)} XML(s) in {OUTPUT_DIR} are not listed in {args.csv_name} "
+                      f"(e.g. {orphans[0]})")
+        if args.validate_report:
+            with open(args.validate_report, "w") as f:
+                for filename, problem in violations:
+                    f.write(json.dumps({"filename": filename, "problem": problem}) + "\n")
+        if violations:
+            raise SystemExit(1)
+        return
+
+    fixed_time = None
+    if args.timestamp:
+        fixed_time = datetime.strptime(args.timestamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    elif args.seed is not None:
+        fixed_time = SEED_EPOCH
 
     num_files = int(os.getenv("NUM_FILES", args.num))
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     # CSV name default
     csv_name = args.csv_name if args.csv_name else f"/test_xmls/jmeter_data_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
+    if shard and not args.csv_name:
+        # Seeded/timestamped shards get the same CSV name on every (re)run
+        stamp = (fixed_time or datetime.now()).strftime('%Y%m%d%H%M%S')
+        csv_name = f"/test_xmls/jmeter_data_{stamp}_shard{shard[0]}of{shard[1]}.csv"
 
     # Enforce caps for multi-attachment mode
     args.attachment_max_mb, args.attachments_total_mb = _effective_caps(args.attachment_max_mb, args.attachments_total_mb)
 
-    results = []
-
-    if not args.cleanup and not args.cleanup_s3:
-        with ProcessPoolExecutor() as executor:
-            worker = partial(
-                generate_and_update,
-                base_xml=args.base_xml,
-                alt_base_xml=args.alt_base_xml,
-                alt_base_percent=args.alt_base_percent,
-                goods_percent=args.goods_percent,
-                save_pdf=args.save_pdf,
-                attachments_total_mb=args.attachments_total_mb,
-                attachment_max_mb=args.attachment_max_mb,
-                no_attachments_percent=args.no_attachments_percent
-            )
-            results = list(executor.map(worker, range(num_files)))
-
-        file_exists = os.path.isfile(csv_name)
-
-        updated_results = []
-        for (xml_filename, xml_buffer, message_id, lrn, timestamp,
-             has_attachments, attachment_count, total_mb_used, base_xml_used) in results:
-            if args.upload_s3:
-                filepath = f"s3://{args.s3_bucket}/test_xmls/{xml_filename}"
-            else:
-                filepath = os.path.join(OUTPUT_DIR.lstrip('/'), xml_filename)
-                if not args.cleanup and not args.cleanup_s3:
-                    with open(os.path.join(OUTPUT_DIR, xml_filename), "wb") as f:
-                        f.write(xml_buffer.getvalue())
-                    print(f"Saved XML to {os.path.join(OUTPUT_DIR, xml_filename)}")
-
-            updated_results.append((
-                xml_filename, filepath, message_id, lrn, timestamp,
-                "true" if has_attachments else "false",
-                attachment_count,
-                total_mb_used,
-                base_xml_used
-            ))
-
-        with open(csv_name, mode="a", newline="") as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow([
-                    "filename", "filepath", "messageId", "lrn", "timestamp",
-                    "hasAttachments", "attachmentCount", "attachmentsTotalMB", "baseXml"
-                ])
-            writer.writerows(updated_results)
+    if args.upload_s3 and not args.s3_bucket:
+        print("--s3-bucket is required when using --upload-s3")
+        return
 
-        print(f"JMeter CSV saved: {csv_name}")
+    # One shared client per process, pooled for the upload threads
+    S3_CLIENT_SETTINGS["endpoint_url"] = args.s3_endpoint_url
+    S3_CLIENT_SETTINGS["max_pool_connections"] = max(10, args.upload_concurrency * 4)
+
+    if args.build_attachment_library:
+        sizes_mb = [float(sz) for sz in args.library_sizes.split(",") if sz.strip()]
+        if not sizes_mb or args.library_per_size < 1:
+            raise ValueError("--library-sizes must list sizes and --library-per-size must be >= 1")
+        pdf_kwargs = dict(
+            pdf_backend=args.pdf_backend,
+            image_pool_size=args.image_pool_size,
+            image_pool_refresh=args.image_pool_refresh,
+            image_pool_dir=args.image_pool_dir,
+            seed=args.seed,
+        )
+        _warm_imports(args.pdf_backend)
+        # Library blobs are saved by the workers, so there is nothing to calibrate
+        with _make_executor("thread" if args.executor == "thread" else "process", args.workers,
+                            pdf_kwargs) as executor:
+            build_attachment_library(args.build_attachment_library, sizes_mb, args.library_per_size, executor,
+                                     **pdf_kwargs)
+        return
 
-    s3_keys = []
+    # Keyword arguments for every generation task (and the worker warm-up)
+    gen_kwargs = dict(
+        s3_bucket=args.s3_bucket if args.upload_s3 else None,
+        base_xml=args.base_xml,
+        alt_base_xml=args.alt_base_xml,
+        alt_base_percent=args.alt_base_percent,
+        goods_percent=args.goods_percent,
+        save_pdf=args.save_pdf,
+        attachments_total_mb=args.attachments_total_mb,
+        attachment_max_mb=args.attachment_max_mb,
+        no_attachments_percent=args.no_attachments_percent,
+        pdf_backend=args.pdf_backend,
+        image_pool_size=args.image_pool_size,
+        image_pool_refresh=args.image_pool_refresh,
+        image_pool_dir=args.image_pool_dir,
+        stream_output=args.stream_output,
+        stream_chunk_bytes=args.stream_chunk_kb * 1024,
+        xml_backend=args.xml_backend,
+        seed=args.seed,
+        fixed_time=fixed_time,
+        attachment_library=args.attachment_library,
+        library_reuse_percent=args.library_reuse_percent,
+        attachment_threads=args.attachment_threads
+    )
 
-    if args.upload_s3:
-        if not args.s3_bucket:
-            print("--s3-bucket is required when using --upload-s3")
+    if not args.cleanup and not args.cleanup_s3 and not args.cleanup_s3_prefix:
+        # Build a disk-backed image pool once so every worker just loads it
+        if args.image_pool_dir and not (os.path.isdir(args.image_pool_dir) and os.listdir(args.image_pool_dir)):
+            JpegPool.build(args.image_pool_size or 16, seed=args.seed).save(args.image_pool_dir)
+            print(f"Saved image pool to {args.image_pool_dir}")
+
+        if args.serve is not None:
+            _warm_imports(args.pdf_backend)
+            monitor = RunMonitor(args.progress_interval)
+            kind, executor, _ = _open_executor(args.executor, args.workers, gen_kwargs, itertools.count())
+            with executor:
+                serve_payloads(args.serve_host, args.serve, args.ring_size, executor,
+                               partial(_generate_payload, share_results=kind == "process", **gen_kwargs),
+                               args.max_in_flight or 2 * args.workers,
+                               csv_name, monitor, wait_timeout=args.serve_wait, limit=args.serve_limit)
+                executor.shutdown(wait=False, cancel_futures=True)
+            RunMonitor.print_summary(monitor.summary())
             return
 
-        for xml_filename, xml_buffer, *_ in results:
-            key = f"test_xmls/{xml_filename}"
-            s3_keys.append(key)
-            upload_to_s3_from_memory(buffer=xml_buffer, bucket_name=args.s3_bucket, key=key)
+        # Checkpoint manifest: with --resume, keep finished records and cut the
+        # CSV back to exactly their rows before appending the remaining ones
+        manifest_path = args.manifest or f"{csv_name}.manifest.jsonl"
+        if args.resume and os.path.isfile(manifest_path):
+            manifest = RunManifest.load(manifest_path, check_local_files=not args.upload_s3 or args.keep_local)
+            if not args.csv_name:
+                csv_name = manifest.header["csv"]
+            if manifest.header.get("shard") != args.shard:
+                raise ValueError(f"{manifest_path} belongs to --shard {manifest.header.get('shard')}")
+            manifest.restore_csv(csv_name)
+            log(f"Resuming from {manifest_path}: {len(manifest.entries)} of {num_files} records already done")
+        else:
+            manifest = RunManifest.create(manifest_path, csv_name, num_files, args.seed, args.shard)
+        indices = _shard_range(num_files, *shard) if shard else range(num_files)
+        if shard:
+            log(f"Shard {shard[0]}/{shard[1]}: records {indices.start}-{indices.stop - 1} of {num_files}")
+        todo = [i for i in indices if i not in manifest.entries]
+
+        file_exists = os.path.isfile(csv_name) and os.path.getsize(csv_name) > 0
+        stage = None
+        sync = None
+        reused = {}
+        if args.s3_sync:
+            sync = S3SyncIndex(args.sync_manifest or os.path.join(os.path.dirname(csv_name) or ".",
+                                                                  f".s3sync-{args.s3_bucket}.jsonl"),
+                               args.s3_bucket, "test_xmls/", _bytes_from_mb(args.multipart_threshold_mb),
+                               _bytes_from_mb(args.multipart_chunksize_mb), _content_fingerprint(gen_kwargs))
+            log(f"Listed {len(sync.list_remote())} objects under s3://{args.s3_bucket}/test_xmls/")
+            # Seeded records already in the bucket unchanged are not generated again
+            reused = sync.reusable(todo)
+            todo = [i for i in todo if i not in reused]
+            if reused:
+                log(f"Sync: {len(reused)} records already in the bucket, {len(todo)} to generate")
+        if args.upload_s3:
+            stage = S3UploadStage(
+                args.s3_bucket,
+                concurrency=args.upload_concurrency,
+                multipart_threshold_mb=args.multipart_threshold_mb,
+                multipart_chunksize_mb=args.multipart_chunksize_mb,
+                delete_after_upload=not args.keep_local,
+                sync=sync,
+            )
 
-        upload_to_s3(csv_name, args.s3_bucket, csv_name)
-        print(f"Uploaded {csv_name} to s3://{args.s3_bucket}/{csv_name}")
+        archive = None
+        if args.archive != "none":
+            archive = ShardedArchiveWriter(os.path.splitext(os.path.basename(csv_name))[0], args.archive,
+                                           args.archive_compression, args.shard_size_mb)
+
+        worker = partial(_generate_record, **gen_kwargs)
+        # Imported before the pool starts so forked workers inherit the modules
+        _warm_imports(args.pdf_backend)
+
+        workers = args.workers
+        budget = None
+        if args.max_memory:
+            # auto is sized for processes, the costlier case, until calibration picks
+            budget = MemoryBudget.plan_workers(_parse_size(args.max_memory), gen_kwargs, args.workers,
+                                               "thread" if args.executor == "thread" else "process")
+            workers = budget.workers
+            log(f"Memory budget {_parse_size(args.max_memory) / (1 << 30):.1f} GB: {workers} worker(s), "
+                f"~{budget.max_cost() / (1 << 20):.0f} MB per record + "
+                f"{budget.worker_baseline / (1 << 20):.0f} MB per process")
+        max_in_flight = args.max_in_flight or 2 * workers
+        monitor = RunMonitor(args.progress_interval)
+
+        def observe(worker_pid, snapshot):
+            monitor.update(worker_pid, snapshot)
+            if budget is not None:
+                budget.observe(worker_pid, snapshot)
+
+        # Records run while calibrating --executor auto are part of the run
+        kind, executor, calibrated = _open_executor(args.executor, workers, gen_kwargs, todo, worker)
+        done = {entry["index"] for _, entry, _ in calibrated}
+        todo = [i for i in todo if i not in done]
+        if budget is not None:
+            budget.executor = kind
+        log(f"Generating with {workers} {kind} worker(s)")
+        with executor, open(csv_name, mode="a", newline="") as f:
+            writer = csv.writer(f)
+            if not file_exists:
+                writer.writerow(CSV_HEADER + (ARCHIVE_CSV_COLUMNS if archive else []))
+            writer.writerows(manifest.rows())
+            f.flush()
+
+            def write_rows(results):
+                # CSV row first, then its checkpoint, so a resumed run never
+                # trusts a record whose row may be missing
+                with METRICS.stage("csv"):
+                    for row, entry in results:
+                        writer.writerow(row)
+                        f.flush()
+                        manifest.record(entry)
+                        monitor.record_done()
+
+            write_rows((entry["row"], {"index": i, "filename": entry["row"][0], "bytes": entry["size"],
+                                       "sha256": entry["sha256"], "row": entry["row"]})
+                       for i, entry in sorted(reused.items()))
+
+            def write_uploaded(block=False):
+                write_rows(result for batch in stage.completed(block) for result in batch)
+
+            def shard_finished(shard):
+                # Point the shard's rows at the shard and their offset in it,
+                # then write them (with S3, once the shard is uploaded)
+                shard_path, index_path, members = shard
+                shard_name = os.path.basename(shard_path)
+                if stage is None:
+                    filepath = os.path.join(OUTPUT_DIR.lstrip('/'), shard_name)
+                else:
+                    filepath = f"s3://{args.s3_bucket}/test_xmls/{shard_name}"
+                results = []
+                for (row, entry), member in members:
+                    row = (row[0], filepath) + tuple(row[2:]) + (shard_name, member["offset"], member["length"])
+                    results.append((row, dict(entry, row=list(row), shard=shard_name, offset=member["offset"])))
+                if stage is None:
+                    write_rows(results)
+                else:
+                    stage.submit(index_path, f"test_xmls/{os.path.basename(index_path)}", [])
+                    stage.submit(shard_path, f"test_xmls/{shard_name}", results)
+                    write_uploaded()
+
+            # Small runs leave workers idle at one task per record: split them
+            # into attachment tasks so every core has something to build
+            split = args.split_attachments == "on" or (
+                args.split_attachments == "auto" and len(todo) < workers and not args.attachment_library)
+            if split:
+                # Process workers hand attachment blobs over in shared memory
+                attachment_worker = partial(_generate_attachment, share_results=kind == "process", **gen_kwargs)
+                results = _imap_split(executor, worker, attachment_worker, todo,
+                                      partial(_split_attachment_sizes, **gen_kwargs), max_in_flight,
+                                      on_metrics=observe, budget=budget)
+            else:
+                results = _imap_bounded(executor, worker, todo, max_in_flight, budget)
+            results = itertools.chain(calibrated, results)
+
+            # Rows are written as records complete (and, with S3, once uploaded);
+            # uploads run concurrently with the remaining generation.
+            for row, entry, (worker_pid, snapshot) in results:
+                observe(worker_pid, snapshot)
+                if archive is not None:
+                    shard = archive.add(os.path.join(OUTPUT_DIR, row[0]), (row, entry), entry["sha256"])
+                    if shard:
+                        shard_finished(shard)
+                elif stage is None:
+                    write_rows([(row, entry)])
+                else:
+                    stage.submit(os.path.join(OUTPUT_DIR, row[0]), f"test_xmls/{row[0]}", [(row, entry)])
+                    write_uploaded()
+            if archive is not None:
+                shard = archive.close()
+                if shard:
+                    shard_finished(shard)
+            if stage is not None:
+                write_uploaded(block=True)
+                stage.close()
+        manifest.close()
+
+        log(f"JMeter CSV saved: {csv_name}")
+        if args.thread_files:
+            write_thread_files(csv_name, args.thread_files, int(args.inline_max_kb * 1024))
+
+        if sync is not None:
+            missing = sync.confirm()
+            log(f"Sync: {sync.skipped} unchanged files ({sync.skipped_bytes / (1024 * 1024):.1f} MB) not uploaded, "
+                f"{len(reused)} records reused; manifest {sync.path}")
+            if missing:
+                raise RuntimeError(f"{len(missing)} objects are missing from s3://{args.s3_bucket} after the sync "
+                                   f"(e.g. {missing[0]}); the CSV was not uploaded")
+
+        if args.upload_s3:
+            upload_to_s3(csv_name, args.s3_bucket, csv_name)
+
+        summary = monitor.summary()
+        RunMonitor.print_summary(summary)
+        if args.metrics_json:
+            RunMonitor.write_json(summary, args.metrics_json)
+        if args.metrics_prom:
+            RunMonitor.write_prometheus(summary, args.metrics_prom)
 
     if args.cleanup_s3:
         if not args.s3_bucket:
@@ -585,13 +4048,19 @@ def main():
             return
 
         download_csv_from_s3(args.s3_bucket, args.csv_name, f"downloaded_{args.csv_name}.csv")
-        cleanup_s3_from_csv(args.s3_bucket, f"downloaded_{args.csv_name}.csv")
+        cleanup_s3_from_csv(args.s3_bucket, f"downloaded_{args.csv_name}.csv", args.delete_concurrency)
         delete_csv_from_s3(args.s3_bucket, args.csv_name)
 
         if os.path.exists(f"downloaded_{args.csv_name}.csv"):
             os.remove(f"downloaded_{args.csv_name}.csv")
             print(f"Also deleted the downloaded CSV: downloaded_{args.csv_name}.csv")
 
+    if args.cleanup_s3_prefix:
+        if not args.s3_bucket:
+            print("--s3-bucket is required with --cleanup-s3-prefix")
+            return
+        cleanup_s3_by_prefix(args.s3_bucket, args.cleanup_s3_prefix, args.delete_concurrency)
+
     if args.cleanup:
         print("Cleaning up local files...")
         if os.path.exists(OUTPUT_DIR):
@@ -599,6 +4068,10 @@ def main():
         if os.path.exists(csv_name):
             os.remove(csv_name)
             print(f"Deleted local CSV: {csv_name}")
+        manifest_path = args.manifest or f"{csv_name}.manifest.jsonl"
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+            print(f"Deleted manifest: {manifest_path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,729 @@
+import os
+import re
+import csv
+import ssl
+import json
+import time
+import asyncio
+import argparse
+import collections
+from http import HTTPStatus
+from functools import partial
+from urllib.parse import urlsplit
+from concurrent.futures import ProcessPoolExecutor
+
+import generator
+
+# =========================
+# Defaults (mirroring mq.jmx)
+# =========================
+MQ_PATH = "/mq/rest/message"
+INBOUND_QUEUE = "inboundQueue"
+OUTBOUND_QUEUE = "outboundQueue"
+SEND_LABEL = "Send Message to Inbound Queue"
+POLL_LABEL = "Poll Outbound Queue"
+POLL_INTERVAL_S = 0.1  # mq.jmx sleeps 100 ms after a 204
+MESSAGE_ID_RE = re.compile(rb"MessageId:\s*([^\s]+)")
+JTL_HEADER = [
+    "timeStamp", "elapsed", "label", "responseCode", "responseMessage", "threadName", "dataType",
+    "success", "failureMessage", "bytes", "sentBytes", "grpThreads", "allThreads", "URL",
+    "Latency", "IdleTime", "Connect", "messageId",
+]
+
+
+# =========================
+# HDR-style latency histogram
+# =========================
+class LatencyHistogram:
+    """
+    Log-linear histogram in the style of HdrHistogram: values (microseconds)
+    land in power-of-two buckets split into `2 ** (sub_bucket_bits - 1)`
+    linear sub-buckets, so a reported value is within a relative error of
+    2 ** (1 - sub_bucket_bits) (0.8% at the default 8 bits) at any magnitude
+    with a small, sparse count table.
+    """
+
+    def __init__(self, sub_bucket_bits=8):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = collections.Counter()
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.sum = 0
+
+    def _key(self, value):
+        shift = max(value.bit_length() - self.sub_bucket_bits, 0)
+        return shift, value >> shift
+
+    def record(self, value_us, count=1):
+        value = max(int(value_us), 0)
+        self.counts[self._key(value)] += count
+        self.total += count
+        self.sum += value * count
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def record_array(self, values_us):
+        """
+        Vectorized record() for a NumPy array (or sequence) of values.
+        """
+        import numpy as np
+        values = np.maximum(np.asarray(values_us, dtype=np.float64), 0).astype(np.int64)
+        if not values.size:
+            return
+        bit_length = np.frexp(values.astype(np.float64))[1].astype(np.int64)
+        shift = np.maximum(bit_length - self.sub_bucket_bits, 0)
+        keys, counts = np.unique((shift << 32) | (values >> shift), return_counts=True)
+        self.counts.update({(int(k) >> 32, int(k) & 0xFFFFFFFF): int(c) for k, c in zip(keys, counts)})
+        self.total += int(values.size)
+        self.sum += int(values.sum())
+        self.max = max(self.max, int(values.max()))
+        low = int(values.min())
+        self.min = low if self.min is None else min(self.min, low)
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def _buckets(self):
+        """
+        (highest_equivalent_value, count) pairs in increasing value order.
+        """
+        for (shift, sub), count in sorted(self.counts.items(), key=lambda kv: kv[0][1] << kv[0][0]):
+            yield ((sub + 1) << shift) - 1, count
+
+    def percentile(self, pct):
+        if not self.total:
+            return 0
+        target = max(1, int(round(pct / 100.0 * self.total)))
+        seen = 0
+        for value, count in self._buckets():
+            seen += count
+            if seen >= target:
+                return min(value, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+
+    def summary_ms(self, percentiles=(50, 90, 99, 99.9, 99.99)):
+        summary = {"count": self.total, "min": (self.min or 0) / 1000, "mean": self.mean / 1000,
+                   "max": self.max / 1000}
+        for pct in percentiles:
+            summary[f"p{pct:g}"] = self.percentile(pct) / 1000
+        return summary
+
+    def percentile_distribution(self, ticks_per_half=5, scale=1000.0):
+        """
+        Text output in the HdrHistogram .hgrm layout (values in ms by default),
+        loadable by the usual HDR plotters.
+        """
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}", ""]
+        if self.total:
+            # Ticks get denser towards 100%: `ticks_per_half` steps for each halving of the remainder
+            ticks = [0.0]
+            remaining = 100.0
+            while remaining * self.total / 100 >= 1:
+                ticks.extend(100 - remaining + remaining / 2 * k / ticks_per_half for k in range(1, ticks_per_half + 1))
+                remaining /= 2
+            ticks.append(100.0)
+            buckets = list(self._buckets())
+            for pct in ticks:
+                value = self.percentile(pct)
+                count = sum(c for v, c in buckets if v <= value)
+                inverse = f"{1 / (1 - pct / 100):14.2f}" if pct < 100 else f"{'inf':>14}"
+                lines.append(f"{min(value, self.max) / scale:12.3f} {pct / 100:14.12f} {count:10d} {inverse}")
+        lines.append(f"#[Mean    = {self.mean / scale:12.3f}, StdDeviation   = n/a]")
+        lines.append(f"#[Max     = {self.max / scale:12.3f}, Total count    = {self.total:12d}]")
+        lines.append(f"#[Buckets = {len(self.counts):12d}, SubBuckets     = {2 ** self.sub_bucket_bits:12d}]")
+        return "\n".join(lines) + "\n"
+
+
+# =========================
+# Minimal HTTP/1.1 over asyncio streams
+# =========================
+async def _read_headers(reader):
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            return headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+async def _read_body(reader, headers):
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await reader.readline()
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+    length = int(headers.get("content-length", 0))
+    return await reader.readexactly(length) if length else b""
+
+
+def _format_head(first_line, headers):
+    return (first_line + "\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n").encode("latin-1")
+
+
+class HttpConnectionPool:
+    """
+    Keep-alive connection pool for one host. At most `size` requests are in
+    flight; idle connections are reused and a stale one is retried once on
+    a fresh connection.
+    """
+
+    def __init__(self, url, size=16, insecure=False, timeout=None):
+        parts = urlsplit(url)
+        self.timeout = timeout
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.ssl = None
+        if parts.scheme == "https":
+            self.ssl = ssl.create_default_context()
+            if insecure:
+                self.ssl.check_hostname = False
+                self.ssl.verify_mode = ssl.CERT_NONE
+        self.host_header = parts.netloc
+        self._slots = asyncio.Semaphore(size)
+        self._idle = []
+        self.connections_opened = 0
+
+    async def _connect(self):
+        self.connections_opened += 1
+        return await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+
+    async def request(self, method, path, headers=None, body=b""):
+        """
+        Returns (status, headers, body, seconds_to_first_byte). Connecting and
+        the whole exchange are each bounded by `timeout` seconds; a timed-out
+        connection is closed and asyncio.TimeoutError raised.
+        """
+        head = {"Host": self.host_header, "Content-Length": str(len(body))}
+        head.update(headers or {})
+        request = _format_head(f"{method} {path} HTTP/1.1", head)
+        async with self._slots:
+            for attempt in range(2):
+                reused = bool(self._idle)
+                reader, writer = self._idle.pop() if reused else await asyncio.wait_for(self._connect(),
+                                                                                        self.timeout)
+                try:
+                    status_line, response_headers, response_body, first_byte = await asyncio.wait_for(
+                        self._exchange(reader, writer, request, body), self.timeout)
+                    status = int(status_line.split()[1])
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except BaseException:
+                    # Timeouts, cancellation, malformed responses: the
+                    # connection is in an unknown state, never reuse it
+                    writer.close()
+                    raise
+                if response_headers.get("connection", "").lower() == "close":
+                    writer.close()
+                else:
+                    self._idle.append((reader, writer))
+                return status, response_headers, response_body, first_byte
+
+    @staticmethod
+    async def _exchange(reader, writer, request, body):
+        started = time.perf_counter()
+        writer.write(request)
+        if body:
+            writer.write(body)
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed by server")
+        first_byte = time.perf_counter() - started
+        response_headers = await _read_headers(reader)
+        response_body = await _read_body(reader, response_headers)
+        return status_line, response_headers, response_body, first_byte
+
+    async def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+
+# =========================
+# Stub MQ REST server
+# =========================
+class StubMqServer:
+    """
+    Offline stand-in for the MQ REST gateway used by mq.jmx.
+
+    POST /mq/rest/message queues the body on `x-mq-queue-name`; messages on a
+    routed queue (inbound -> outbound by default) are moved to the target
+    queue after `delay_ms`, like the real flow would. GET pops the oldest
+    message of the queue (200, with x-message-id) or answers 204 when empty.
+    """
+
+    def __init__(self, routes=None, delay_ms=0.0):
+        self.routes = routes if routes is not None else {INBOUND_QUEUE: OUTBOUND_QUEUE}
+        self.delay_s = delay_ms / 1000.0
+        self.queues = collections.defaultdict(collections.deque)
+        self.received = 0
+        self.delivered = 0
+        self._server = None
+        self._connections = {}  # handler task -> writer
+
+    def _enqueue(self, queue, item):
+        self.queues[queue].append(item)
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = await _read_headers(reader)
+                body = await _read_body(reader, headers)
+                queue = headers.get("x-mq-queue-name", "default")
+                if urlsplit(target).path != MQ_PATH:
+                    status, response_headers, response_body = 404, {}, b"not found"
+                elif method == "POST":
+                    match = MESSAGE_ID_RE.search(body[:4096])
+                    message_id = headers.get("x-message-id") or (match.group(1).decode() if match else "")
+                    self.received += 1
+                    item = (message_id, body)
+                    target_queue = self.routes.get(queue)
+                    if target_queue is None:
+                        self._enqueue(queue, item)
+                    elif self.delay_s:
+                        loop.call_later(self.delay_s, self._enqueue, target_queue, item)
+                    else:
+                        self._enqueue(target_queue, item)
+                    status, response_headers = 201, {"Content-Type": "application/json"}
+                    response_body = json.dumps({"messageId": message_id, "queue": queue}).encode("utf-8")
+                elif method == "GET" and self.queues[queue]:
+                    message_id, response_body = self.queues[queue].popleft()
+                    self.delivered += 1
+                    status, response_headers = 200, {"Content-Type": "application/xml", "x-message-id": message_id}
+                else:
+                    status, response_headers, response_body = 204, {}, b""
+                response_headers["Content-Length"] = str(len(response_body))
+                writer.write(_format_head(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", response_headers))
+                writer.write(response_body)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._connections.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._server = await asyncio.start_server(self._handle, host, port, limit=1 << 20)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}"
+
+    async def stop(self):
+        # Closing the transports ends each handler with EOF instead of a cancellation at loop shutdown
+        self._server.close()
+        handlers = list(self._connections)
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        await self._server.wait_closed()
+
+
+# =========================
+# Record sources
+# =========================
+def _read_csv_record(row, base_dir="."):
+    """
+    Load the XML a generator CSV row points at: a local file, or a slice of
+    an uncompressed archive shard (shard/offset/length columns).
+    """
+    filepath = row["filepath"]
+    if filepath.startswith(("s3://", "http://", "https://")):
+        raise ValueError(f"{filepath}: only local records can be replayed; download them first")
+    candidates = [os.path.join(base_dir, filepath), os.path.join(generator.OUTPUT_DIR, row.get("shard") or row["filename"])]
+    path = next((p for p in candidates if os.path.isfile(p)), None)
+    if path is None:
+        raise FileNotFoundError(filepath)
+    with open(path, "rb") as f:
+        if not row.get("shard"):
+            return f.read()
+        if not path.endswith((".tar", ".zip")):
+            raise ValueError(f"{path}: compressed shards cannot be replayed by offset")
+        f.seek(int(row["offset"]))
+        return f.read(int(row["length"]))
+
+
+async def csv_source(csv_path, limit=0, base_dir="."):
+    """
+    Yield (message_id, lrn, xml_bytes) for the rows of a generator CSV.
+    """
+    loop = asyncio.get_running_loop()
+    with open(csv_path, newline="") as f:
+        for n, row in enumerate(csv.DictReader(f)):
+            if limit and n >= limit:
+                break
+            body = await loop.run_in_executor(None, _read_csv_record, row, base_dir)
+            yield row["messageId"], row["lrn"], body
+
+
+async def generated_source(count, gen_kwargs, workers):
+    """
+    Yield (message_id, lrn, xml_bytes) for `count` records generated on a
+    warm worker pool, keeping 2 x workers records in flight.
+    """
+    generator._warm_imports(gen_kwargs.get("pdf_backend", "direct"))
+    with ProcessPoolExecutor(max_workers=workers, initializer=generator._init_worker,
+                             initargs=(generator.VERBOSITY, gen_kwargs)) as executor:
+        worker = partial(generator._generate_payload, **gen_kwargs)
+        pending = collections.deque()
+        next_index = 0
+        while next_index < count or pending:
+            while next_index < count and len(pending) < 2 * workers:
+                pending.append(asyncio.wrap_future(executor.submit(worker, next_index)))
+                next_index += 1
+            row, body, _ = await pending.popleft()
+            yield row[2], row[3], body
+
+
+def tag_message(body, message_id, send_time_ms):
+    """
+    Add the tracking comment mq.jmx's "Prepare Message" step injects, right
+    after the XML declaration, so receivers can correlate on the body alone.
+    """
+    comment = f"<!-- MessageId: {message_id} SendTime: {send_time_ms} -->".encode("utf-8")
+    if body.startswith(b"<?xml"):
+        end = body.find(b"?>") + 2
+        return body[:end] + b"\n" + comment + body[end:]
+    return comment + b"\n" + body
+
+
+# =========================
+# Load driver
+# =========================
+class LoadDriver:
+    """
+    POSTs records to the inbound queue at a fixed concurrency (closed loop) or
+    a target rate (open loop, latency measured from the intended send time so
+    a slow server cannot hide queueing), while receivers poll the outbound
+    queue and match messages back by messageId for end-to-end latency.
+    """
+
+    def __init__(self, url, inbound_queue=INBOUND_QUEUE, outbound_queue=OUTBOUND_QUEUE, concurrency=16,
+                 rate=0.0, receivers=4, pool_size=None, insecure=False, jtl_writer=None, timeout=30.0):
+        self.url = url.rstrip("/")
+        self.inbound_queue = inbound_queue
+        self.outbound_queue = outbound_queue
+        self.concurrency = concurrency
+        self.rate = rate
+        self.receivers = receivers
+        self.send_pool = HttpConnectionPool(url, pool_size or concurrency, insecure, timeout)
+        self.poll_pool = HttpConnectionPool(url, max(receivers, 1), insecure, timeout)
+        self.jtl_writer = jtl_writer
+        self.send_latency = LatencyHistogram()
+        self.e2e_latency = LatencyHistogram()
+        self.poll_latency = LatencyHistogram()
+        self.in_flight = {}  # messageId -> monotonic send time
+        self.sent = 0
+        self.send_errors = 0
+        self.bytes_sent = 0
+        self.received = 0
+        self.unmatched = 0
+        self.sending_done = asyncio.Event()
+
+    def _jtl(self, label, started_wall, elapsed_s, status, ok, nbytes, sent_bytes, first_byte_s, message_id,
+             thread, error=""):
+        if self.jtl_writer is None:
+            return
+        self.jtl_writer.writerow([
+            int(started_wall * 1000), int(elapsed_s * 1000), label, status, "OK" if ok else "ERROR", thread,
+            "text", "true" if ok else "false", error, nbytes, sent_bytes, self.concurrency, self.concurrency,
+            self.url + MQ_PATH, int(first_byte_s * 1000), 0, 0, message_id,
+        ])
+
+    async def _send(self, message_id, body, thread, intended=None):
+        send_time = time.time()
+        started = time.monotonic()
+        payload = tag_message(body, message_id, int(send_time * 1000))
+        headers = {"Content-Type": "application/xml", "Accept": "application/xml",
+                   "x-mq-queue-name": self.inbound_queue, "x-message-id": message_id}
+        # A receiver may pop the message while the POST is still awaited
+        sent_at = intended if intended is not None else started
+        self.in_flight[message_id] = sent_at
+        try:
+            status, _, response, first_byte = await self.send_pool.request("POST", MQ_PATH, headers, payload)
+            error = ""
+        except asyncio.TimeoutError:
+            status, response, first_byte, error = 0, b"", 0.0, "request timed out"
+        except (OSError, asyncio.IncompleteReadError) as e:
+            status, response, first_byte, error = 0, b"", 0.0, str(e)
+        elapsed = time.monotonic() - started
+        ok = status in (200, 201, 202)
+        self.send_latency.record((time.monotonic() - sent_at) * 1e6)
+        self.sent += 1
+        self.bytes_sent += len(payload)
+        if not ok:
+            self.send_errors += 1
+            self.in_flight.pop(message_id, None)
+        self._jtl(SEND_LABEL, send_time, elapsed, status, ok, len(response), len(payload), first_byte,
+                  message_id, thread, error)
+
+    async def _sender(self, queue, number):
+        thread = f"{SEND_LABEL} 1-{number}"
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            message_id, _, body = item
+            await self._send(message_id, body, thread)
+
+    async def _paced(self, source):
+        """
+        Open loop: start one send every 1/rate seconds, up to `concurrency`
+        outstanding; latency counts from the scheduled start.
+        """
+        interval = 1.0 / self.rate
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        start = time.monotonic()
+        n = 0
+
+        async def run(message_id, body, intended, number):
+            try:
+                await self._send(message_id, body, f"{SEND_LABEL} 1-{number % self.concurrency + 1}", intended)
+            finally:
+                slots.release()
+
+        async for message_id, _, body in source:
+            intended = start + n * interval
+            delay = intended - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await slots.acquire()
+            task = asyncio.create_task(run(message_id, body, intended, n))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            n += 1
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _closed_loop(self, source):
+        queue = asyncio.Queue(maxsize=2 * self.concurrency)
+        senders = [asyncio.create_task(self._sender(queue, k + 1)) for k in range(self.concurrency)]
+        async for item in source:
+            await queue.put(item)
+        for _ in senders:
+            await queue.put(None)
+        await asyncio.gather(*senders)
+
+    async def _receiver(self, number, drain_timeout):
+        thread = f"{POLL_LABEL} 1-{number}"
+        headers = {"Accept": "application/xml", "x-mq-queue-name": self.outbound_queue}
+        idle_since = None
+        while True:
+            if self.sending_done.is_set():
+                if not self.in_flight:
+                    return
+                idle_since = idle_since or time.monotonic()
+                if time.monotonic() - idle_since > drain_timeout:
+                    return
+            started_wall = time.time()
+            started = time.monotonic()
+            try:
+                status, response_headers, body, first_byte = await self.poll_pool.request("GET", MQ_PATH, headers)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                self._jtl(POLL_LABEL, started_wall, time.monotonic() - started, 0, False, 0, 0, 0.0, "", thread,
+                          str(e) or "request timed out")
+                await asyncio.sleep(POLL_INTERVAL_S)
+                continue
+            received_at = time.monotonic()
+            self.poll_latency.record((received_at - started) * 1e6)
+            if status != 200 or not body:
+                await asyncio.sleep(POLL_INTERVAL_S)
+                continue
+            idle_since = None
+            message_id = response_headers.get("x-message-id")
+            if not message_id:
+                match = MESSAGE_ID_RE.search(body[:4096])
+                message_id = match.group(1).decode() if match else ""
+            sent_at = self.in_flight.pop(message_id, None)
+            if sent_at is None:
+                self.unmatched += 1
+            else:
+                self.received += 1
+                self.e2e_latency.record((received_at - sent_at) * 1e6)
+            self._jtl(POLL_LABEL, started_wall, received_at - started, status, True, len(body), 0, first_byte,
+                      message_id, thread)
+
+    async def run(self, source, drain_timeout=30.0):
+        started = time.monotonic()
+        receivers = [asyncio.create_task(self._receiver(k + 1, drain_timeout)) for k in range(self.receivers)]
+        if self.rate:
+            await self._paced(source)
+        else:
+            await self._closed_loop(source)
+        send_seconds = time.monotonic() - started
+        self.sending_done.set()
+        await asyncio.gather(*receivers)
+        await self.send_pool.close()
+        await self.poll_pool.close()
+        return self.results(send_seconds, time.monotonic() - started)
+
+    def results(self, send_seconds, total_seconds):
+        return {
+            "sent": self.sent,
+            "send_errors": self.send_errors,
+            "received": self.received,
+            "missing": len(self.in_flight) if self.receivers else None,
+            "unmatched": self.unmatched,
+            "send_seconds": send_seconds,
+            "total_seconds": total_seconds,
+            "send_rate": self.sent / send_seconds if send_seconds else 0.0,
+            "send_mb_s": self.bytes_sent / (1024 * 1024) / send_seconds if send_seconds else 0.0,
+            "connections": self.send_pool.connections_opened + self.poll_pool.connections_opened,
+            "send_latency_ms": self.send_latency.summary_ms(),
+            "e2e_latency_ms": self.e2e_latency.summary_ms(),
+            "poll_latency_ms": self.poll_latency.summary_ms(),
+        }
+
+
+def _print_results(results):
+    print(f"Sent {results['sent']} messages ({results['send_errors']} errors) in {results['send_seconds']:.1f}s: "
+          f"{results['send_rate']:.1f} msg/s, {results['send_mb_s']:.1f} MB/s over {results['connections']} connections")
+    if results["missing"] is not None:
+        print(f"Received {results['received']} of {results['sent'] - results['send_errors']} "
+              f"({results['missing']} missing, {results['unmatched']} unmatched)")
+    for name in ("send_latency_ms", "e2e_latency_ms"):
+        h = results[name]
+        if h["count"]:
+            print(f"{name[:-3].replace('_', ' ')} (ms): p50 {h['p50']:.1f}  p90 {h['p90']:.1f}  p99 {h['p99']:.1f}  "
+                  f"p99.9 {h['p99.9']:.1f}  max {h['max']:.1f}")
+
+
+async def run_driver(args):
+    stub = None
+    url = args.url
+    if args.stub:
+        stub = StubMqServer({args.inbound_queue: args.outbound_queue}, args.stub_delay_ms)
+        url = await stub.start()
+        print(f"Stub MQ server on {url}")
+
+    if args.csv:
+        source = csv_source(args.csv, args.num)
+    else:
+        gen_kwargs = dict(
+            base_xml=args.base_xml, alt_base_xml=None, alt_base_percent=0,
+            attachments_total_mb=args.attachments_total_mb, attachment_max_mb=args.attachment_max_mb,
+            image_pool_size=16, seed=args.seed,
+            fixed_time=generator.SEED_EPOCH if args.seed is not None else None,
+        )
+        source = generated_source(args.num, gen_kwargs, args.workers)
+
+    jtl_file = open(args.jtl, "w", newline="") if args.jtl else None
+    jtl_writer = None
+    if jtl_file:
+        jtl_writer = csv.writer(jtl_file)
+        jtl_writer.writerow(JTL_HEADER)
+    try:
+        driver = LoadDriver(url, args.inbound_queue, args.outbound_queue, args.concurrency, args.rate,
+                            0 if args.no_receive else args.receivers, insecure=args.insecure,
+                            jtl_writer=jtl_writer, timeout=args.timeout or None)
+        results = await driver.run(source, args.drain_timeout)
+    finally:
+        if jtl_file:
+            jtl_file.close()
+        if stub:
+            await stub.stop()
+
+    _print_results(results)
+    if args.results_json:
+        with open(args.results_json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved: {args.results_json}")
+    if args.hgrm:
+        for name, histogram in (("send", driver.send_latency), ("e2e", driver.e2e_latency)):
+            path = f"{args.hgrm}.{name}.hgrm"
+            with open(path, "w") as f:
+                f.write(histogram.percentile_distribution())
+            print(f"Histogram saved: {path}")
+    return results
+
+
+async def run_stub_server(host, port, inbound_queue, outbound_queue, delay_ms):
+    stub = StubMqServer({inbound_queue: outbound_queue}, delay_ms)
+    url = await stub.start(host, port)
+    print(f"Stub MQ server on {url}{MQ_PATH} (Ctrl+C to stop)")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asyncio load driver for the MQ REST endpoint used by mq.jmx.")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:9000",
+                        help="MQ REST base URL (mq.jmx: https://${mqHost}:${mqPort})")
+    parser.add_argument("--insecure", action="store_true", help="Skip TLS certificate verification")
+    parser.add_argument("--timeout", type=float, default=30.0,
+                        help="Seconds allowed to connect and for each request/response (0 = no limit; "
+                             "mq.jmx uses 30 s responses)")
+    parser.add_argument("--inbound-queue", type=str, default=INBOUND_QUEUE)
+    parser.add_argument("--outbound-queue", type=str, default=OUTBOUND_QUEUE)
+    # Records
+    parser.add_argument("--csv", type=str, default=None,
+                        help="Replay records listed in a generator CSV instead of generating them")
+    parser.add_argument("--num", type=int, default=100, help="Messages to send (0 = every CSV row, with --csv only)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Generator worker processes when records are generated on the fly")
+    parser.add_argument("--base-xml", type=str, default="IE3F32.xml")
+    parser.add_argument("--attachments-total-mb", type=float, default=2.0)
+    parser.add_argument("--attachment-max-mb", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=None)
+    # Load shape
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="Concurrent senders (closed loop), or the cap on outstanding sends with --rate")
+    parser.add_argument("--rate", type=float, default=0.0, help="Target messages per second (open loop)")
+    parser.add_argument("--receivers", type=int, default=4, help="Outbound queue pollers (mq.jmx receiverThreads)")
+    parser.add_argument("--no-receive", action="store_true", help="Only send; skip outbound correlation")
+    parser.add_argument("--drain-timeout", type=float, default=30.0,
+                        help="Seconds to keep polling for missing messages after the last send")
+    # Output
+    parser.add_argument("--jtl", type=str, default=None, help="Write every sample as a JMeter-style CSV JTL")
+    parser.add_argument("--results-json", type=str, default=None, help="Write the summary and percentiles as JSON")
+    parser.add_argument("--hgrm", type=str, default=None, metavar="PREFIX",
+                        help="Write send and end-to-end latency distributions to PREFIX.{send,e2e}.hgrm")
+    # Stub
+    parser.add_argument("--stub", action="store_true", help="Run against an in-process stub MQ server (offline)")
+    parser.add_argument("--stub-server", type=int, default=None, metavar="PORT",
+                        help="Only run the stub MQ server on PORT until interrupted")
+    parser.add_argument("--stub-delay-ms", type=float, default=0.0,
+                        help="Stub delay before an inbound message appears on the outbound queue")
+    args = parser.parse_args()
+
+    if args.concurrency < 1 or args.rate < 0 or args.receivers < 0:
+        raise ValueError("--concurrency must be >= 1, --rate and --receivers >= 0")
+    if args.num < 0 or (args.num == 0 and not args.csv and args.stub_server is None):
+        raise ValueError("--num must be >= 1 (0 replays every row and needs --csv)")
+
+    try:
+        if args.stub_server is not None:
+            asyncio.run(run_stub_server("127.0.0.1", args.stub_server, args.inbound_queue, args.outbound_queue,
+                                        args.stub_delay_ms))
+        else:
+            asyncio.run(run_driver(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
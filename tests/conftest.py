@@ -0,0 +1,95 @@
+import os
+import shutil
+import sys
+import threading
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import generator  # noqa: E402
+
+BASE_XML = os.path.join(REPO, "tests", "data", "IE3F32.xml")
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    """
+    Point generator.OUTPUT_DIR at a fresh directory for the test.
+    """
+    out = tmp_path / "test_xmls"
+    out.mkdir()
+    monkeypatch.setattr(generator, "OUTPUT_DIR", str(out) + "/")
+    monkeypatch.setattr(generator, "VERBOSITY", 0)
+    return out
+
+
+@pytest.fixture
+def base_xml(tmp_path):
+    path = tmp_path / "IE3F32.xml"
+    shutil.copy(BASE_XML, path)
+    return str(path)
+
+
+class StubS3:
+    """
+    In-memory S3 client with the calls the upload, sync and cleanup paths
+    make. Keys in `fail_once` are reported in a delete's Errors the first
+    time, keys in `fail_always` every time.
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.objects = {}  # key -> (etag, size)
+        self.puts = []
+        self.delete_batches = []
+        self.fail_once = set()
+        self.fail_always = set()
+        self.page_size = 1000
+        self._lock = threading.Lock()
+
+    def upload_file(self, file_path, bucket, key, Config=None):
+        assert bucket == self.bucket
+        threshold = Config.multipart_threshold if Config else 8 * 1024 * 1024
+        chunksize = Config.multipart_chunksize if Config else 8 * 1024 * 1024
+        with self._lock:
+            self.objects[key] = (generator._s3_etag(file_path, threshold, chunksize), os.path.getsize(file_path))
+            self.puts.append(key)
+
+    def delete_objects(self, Bucket, Delete):
+        assert Bucket == self.bucket
+        keys = [obj["Key"] for obj in Delete["Objects"]]
+        assert len(keys) <= 1000
+        errors = []
+        with self._lock:
+            self.delete_batches.append(len(keys))
+            for key in keys:
+                if key in self.fail_always or key in self.fail_once:
+                    self.fail_once.discard(key)
+                    errors.append({"Key": key, "Code": "SlowDown", "Message": "Please reduce your request rate."})
+                else:
+                    self.objects.pop(key, None)
+        return {"Errors": errors} if errors else {}
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        assert Bucket == self.bucket
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        for start in range(0, len(keys), self.page_size):
+            yield {"Contents": [{"Key": key, "ETag": f'"{self.objects[key][0]}"', "Size": self.objects[key][1]}
+                                for key in keys[start:start + self.page_size]]}
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """
+    A StubS3 installed as the process's S3 client, for bucket "test-bucket".
+    """
+    client = StubS3("test-bucket")
+    monkeypatch.setattr(generator, "_S3_CLIENT", client)
+    monkeypatch.setattr(generator.time, "sleep", lambda seconds: None)
+    return client
@@ -0,0 +1,41 @@
+import analyze_results
+
+
+def test_missing_id_column_warns_on_stderr(tmp_path, capsys):
+    meta = tmp_path / "meta.csv"
+    meta.write_text("filename,filepath,messageId,lrn,timestamp,hasAttachments,attachmentCount,attachmentsTotalMB,baseXml\n"
+                    "a.xml,test_xmls/a.xml,M1,L1,0,true,1,0.7,IE3F32.xml\n")
+    jtl = tmp_path / "results.jtl"
+    jtl.write_text("timeStamp,elapsed,label,success,bytes\n1000,12,send,true,10\n1500,20,send,false,10\n")
+
+    metadata = analyze_results.RecordMetadata([str(meta)], [0.5, 1])
+    analyzer = analyze_results.ResultsAnalyzer(metadata).analyze(str(jtl))
+
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert captured.err.startswith("WARNING: No messageId column in the JTL")
+    assert (analyzer.samples, analyzer.matched) == (2, 0)
+
+
+def test_size_buckets_include_their_upper_edge(tmp_path):
+    meta = tmp_path / "meta.csv"
+    meta.write_text("filename,filepath,messageId,lrn,timestamp,hasAttachments,attachmentCount,attachmentsTotalMB,baseXml\n"
+                    "a.xml,,M1,L1,0,true,1,0.5,IE3F32.xml\n"
+                    "b.xml,,M2,L2,0,true,1,2.0,IE3F32.xml\n"
+                    "c.xml,,M3,L3,0,true,3,2.1,IE3F32.xml\n"
+                    "d.xml,,M4,L4,0,false,0,0,IE3F32.xml\n")
+    metadata = analyze_results.RecordMetadata([str(meta)], [0.5, 1, 2])
+    names = [metadata.groups["size"][code] for code in metadata.codes["size"][:4]]
+    assert names == ["<=0.5MB", "1-2MB", ">2MB", "none"]
+
+
+def test_malformed_rows_are_counted(tmp_path, capsys):
+    jtl = tmp_path / "results.jtl"
+    jtl.write_text("timeStamp,elapsed,label,success,messageId\n1000,12,send,true,M1\n"
+                   "1100,oops\n1500,20,send,false,M2,extra\n2000,8,send,true,M3\n")
+    metadata = analyze_results.RecordMetadata([], [1])
+    analyzer = analyze_results.ResultsAnalyzer(metadata).analyze(str(jtl), chunk_rows=2)
+
+    report = analyzer.report()
+    assert (report["samples"], report["skipped_rows"]) == (2, 2)
+    assert "Skipped 2 row(s)" in capsys.readouterr().err
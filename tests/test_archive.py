@@ -0,0 +1,87 @@
+import csv
+import gzip
+import hashlib
+import json
+import os
+import sys
+import zlib
+
+import pytest
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import generator
+
+FORMATS = [("tar", "none"), ("tar", "gzip"), ("tar", "zstd"), ("zip", "none"), ("zip", "gzip")]
+
+
+def shard_bytes(path, index):
+    """Bytes the index offsets refer to: the file, or the decompressed tar stream."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if index["offsets"] == "file":
+        return data
+    if index["compression"] == "gzip":
+        return gzip.decompress(data)
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+def member_data(data, index, member):
+    chunk = data[member["offset"]:member["offset"] + member["length"]]
+    if index["format"] == "zip" and index["compression"] == "gzip":
+        return zlib.decompress(chunk, -15)
+    return chunk
+
+
+@pytest.mark.parametrize("archive_format,compression", FORMATS)
+def test_index_offsets_point_at_member_data(output_dir, archive_format, compression):
+    if compression == "zstd" and zstandard is None:
+        pytest.skip("zstandard is not installed")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    writer = generator.ShardedArchiveWriter("run", archive_format, compression, shard_size_mb=0.05)
+    originals, shards = {}, []
+    for idx in range(7):
+        path = output_dir / f"record_{idx}.xml"
+        content = os.urandom(700 + idx * 3001) + b"A" * 9000
+        path.write_bytes(content)
+        originals[path.name] = content
+        finished = writer.add(str(path), sha256=hashlib.sha256(content).hexdigest())
+        if finished:
+            shards.append(finished)
+        assert not path.exists()
+    shards.append(writer.close())
+    shards = [shard for shard in shards if shard]
+    assert len(shards) > 1
+
+    seen = {}
+    for shard_path, index_path, members in shards:
+        with open(index_path) as f:
+            index = json.load(f)
+        assert index["members"] == [member for _, member in members]
+        data = shard_bytes(shard_path, index)
+        for member in index["members"]:
+            seen[member["name"]] = member_data(data, index, member)
+            assert hashlib.sha256(seen[member["name"]]).hexdigest() == member["sha256"]
+    assert seen == originals
+
+    # A new writer continues numbering after the finished shards
+    assert generator.ShardedArchiveWriter("run", archive_format, compression).number == len(shards)
+
+
+def test_csv_offsets_match_shards(output_dir, base_xml, tmp_path, monkeypatch):
+    csv_path = tmp_path / "archived.csv"
+    monkeypatch.setattr(sys, "argv", ["generator.py", "-q", "--num", "4", "--seed", "2", "--workers", "1",
+                                      "--attachments-total-mb", "0.3", "--archive", "tar",
+                                      "--base-xml", base_xml, "--csv-name", str(csv_path)])
+    generator.main()
+    with open(csv_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 4
+    for row in rows:
+        with open(output_dir / row["shard"], "rb") as f:
+            f.seek(int(row["offset"]))
+            data = f.read(int(row["length"]))
+        assert data.startswith(b"<?xml") and row["messageId"].encode() in data
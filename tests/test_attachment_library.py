@@ -0,0 +1,33 @@
+import base64
+from datetime import datetime, timezone
+
+import generator
+
+RECORD = dict(seed=3, fixed_time=datetime(2026, 10, 18, tzinfo=timezone.utc), attachments_total_mb=0.3,
+              attachment_max_mb=0.3, no_attachments_percent=0)
+
+
+def write_library(path, size_mb, count):
+    blobs = [base64.b64encode(b"library pdf %d " % k * 100) for k in range(count)]
+    generator.AttachmentLibrary.write(path, [(size_mb, len(blob) * 3 // 4, blob) for blob in blobs])
+    return blobs
+
+
+def test_library_blobs_are_spliced_into_records(output_dir, base_xml, tmp_path):
+    path = str(tmp_path / "lib.attlib")
+    blobs = write_library(path, 0.3, 3)
+    _, buffer, *_ = generator.generate_and_update(0, base_xml, None, 0, attachment_library=path, **RECORD)
+    xml = buffer.getvalue()
+    assert sum(blob in xml for blob in blobs) == 1
+
+
+def test_library_size_miss_warns_once(output_dir, base_xml, tmp_path, capsys):
+    path = str(tmp_path / "lib.attlib")
+    blobs = write_library(path, 0.5, 2)
+    for i in range(2):
+        _, buffer, *_ = generator.generate_and_update(i, base_xml, None, 0, attachment_library=path,
+                                                      pdf_backend="direct", **RECORD)
+        assert not any(blob in buffer.getvalue() for blob in blobs)
+    warnings = [line for line in capsys.readouterr().out.splitlines() if line.startswith("WARNING:")]
+    assert len(warnings) == 1
+    assert "no 0.3 MB PDFs" in warnings[0]
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import sys
+
+import pytest
+
+import generator
+
+
+def run_main(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["generator.py", "-q", *argv])
+    generator.main()
+
+
+def corpus_digest(output_dir):
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(output_dir)):
+        if name.endswith(".xml"):
+            digest.update(name.encode())
+            digest.update((output_dir / name).read_bytes())
+    return digest.hexdigest()
+
+
+MODES = [
+    ["--workers", "1", "--executor", "process"],
+    ["--workers", "2", "--executor", "process", "--split-attachments", "on"],
+    ["--workers", "2", "--executor", "thread"],
+    ["--workers", "2", "--executor", "thread", "--split-attachments", "on", "--attachment-threads", "2"],
+    ["--workers", "2", "--executor", "auto", "--split-attachments", "off"],
+]
+
+
+@pytest.mark.parametrize("backend", ["direct", "raw"])
+def test_same_seed_same_bytes_in_every_mode(output_dir, base_xml, tmp_path, monkeypatch, backend):
+    digests = []
+    for n, mode in enumerate(MODES):
+        for name in os.listdir(output_dir):
+            os.remove(output_dir / name)
+        run_main(monkeypatch, "--num", "3", "--seed", "11", "--base-xml", base_xml, "--pdf-backend", backend,
+                 "--attachments-total-mb", "1.5", "--attachment-max-mb", "0.6", "--no-attachments-percent", "30",
+                 "--image-pool-size", "2", "--csv-name", str(tmp_path / f"run{n}.csv"), *mode)
+        assert len([name for name in os.listdir(output_dir) if name.endswith(".xml")]) == 3
+        digests.append(corpus_digest(output_dir))
+    assert len(set(digests)) == 1
+
+
+def test_auto_executor_keeps_its_calibration_records(output_dir, base_xml, tmp_path, monkeypatch):
+    calibrated = []
+    calibrate = generator._calibrate_executor
+
+    def spy(*args):
+        result = calibrate(*args)
+        calibrated.extend(result[2])
+        return result
+
+    monkeypatch.setattr(generator, "_calibrate_executor", spy)
+    digests = []
+    for executor in ("thread", "auto"):
+        for name in os.listdir(output_dir):
+            os.remove(output_dir / name)
+        csv_path = tmp_path / f"{executor}.csv"
+        run_main(monkeypatch, "--num", "8", "--seed", "5", "--base-xml", base_xml, "--pdf-backend", "raw",
+                 "--attachments-total-mb", "0.2", "--workers", "1", "--executor", executor,
+                 "--split-attachments", "off", "--csv-name", str(csv_path))
+        rows = csv_path.read_text().splitlines()[1:]
+        assert len(rows) == len(set(rows)) == 8
+        digests.append(corpus_digest(output_dir))
+    assert digests[0] == digests[1]
+    assert len(calibrated) == 6
+
+
+def _segment_exists(name):
+    try:
+        generator.shared_memory.SharedMemory(name=name).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def test_unused_prebuilt_blobs_are_freed(output_dir, base_xml):
+    handles = [generator.SharedBytes.share(b"A" * generator.SHM_MIN_BYTES) for _ in range(2)]
+    result = generator.generate_and_update(0, base_xml, None, 0, no_attachments_percent=100, pdf_backend="raw",
+                                           prebuilt_blobs=handles)
+    assert result[6] == 0  # attachment_count
+    assert not any(_segment_exists(h.name) for h in handles)
+
+
+def test_unshared_all_unlinks_the_rest_on_failure():
+    good = generator.SharedBytes.share(b"x" * 10)
+    gone = generator.SharedBytes("psm_does_not_exist", 10)
+    rest = generator.SharedBytes.share(b"y" * 10)
+    with pytest.raises(FileNotFoundError):
+        generator._unshared_all([good, gone, rest])
+    assert not _segment_exists(good.name) and not _segment_exists(rest.name)
+
+
+def test_small_results_are_not_shared():
+    assert generator._shared(b"small") == b"small"
+    handle = generator._shared(b"z" * generator.SHM_MIN_BYTES)
+    assert isinstance(handle, generator.SharedBytes)
+    assert generator._unshared(handle) == b"z" * generator.SHM_MIN_BYTES
+
+
+def test_seeded_image_pool_dirs_are_identical(output_dir, base_xml, tmp_path, monkeypatch):
+    pools = [tmp_path / "pool_a", tmp_path / "pool_b"]
+    for pool in pools:
+        run_main(monkeypatch, "--num", "1", "--seed", "11", "--base-xml", base_xml, "--no-attachments-percent", "100",
+                 "--image-pool-size", "2", "--image-pool-dir", str(pool), "--csv-name", str(tmp_path / "run.csv"))
+    assert sorted(os.listdir(pools[0])) == ["page_0000.jpg", "page_0001.jpg"]
+    for name in os.listdir(pools[0]):
+        assert (pools[0] / name).read_bytes() == (pools[1] / name).read_bytes()
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+import generator
+
+MB = 1 << 20
+GEN_KWARGS = dict(attachments_total_mb=4, attachment_max_mb=2)
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    """Fake RSS source: pid -> bytes, read by both RSS helpers."""
+    values = {os.getpid(): 100 * MB}
+    monkeypatch.setattr(generator, "_current_rss_bytes", lambda pid: values.get(pid))
+    monkeypatch.setattr(generator, "_max_rss_bytes", lambda: values[os.getpid()])
+    return values
+
+
+def test_estimate_by_output_mode():
+    memory = generator.MemoryBudget(1 << 30, dict(GEN_KWARGS), 0, 1)
+    assert memory.estimate([]) == MB
+    assert memory.estimate([2, 2]) == 2 * MB + 16 * MB
+    streamed = generator.MemoryBudget(1 << 30, dict(GEN_KWARGS, stream_output=True, stream_chunk_bytes=4096), 0, 1)
+    assert streamed.estimate([2, 2]) == int(2 * MB * 7 / 3) + 8192
+    threaded = generator.MemoryBudget(1 << 30, dict(GEN_KWARGS, stream_output=True, stream_chunk_bytes=4096,
+                                                    attachment_threads=2), 0, 1)
+    assert threaded.estimate([2, 2]) == int(4 * MB * 7 / 3) + 8192
+
+
+def test_plan_workers_reserves_a_baseline_per_process(rss):
+    budget = generator.MemoryBudget.plan_workers(1000 * MB, GEN_KWARGS, 16, "process")
+    per_record = budget.max_cost()
+    assert budget.worker_baseline == 100 * MB
+    assert budget.workers == (900 * MB) // (100 * MB + per_record)
+    assert budget.available == 1000 * MB - 100 * MB * (budget.workers + 1)
+
+
+def test_plan_workers_shares_one_baseline_between_threads(rss):
+    budget = generator.MemoryBudget.plan_workers(1000 * MB, GEN_KWARGS, 64, "thread")
+    assert budget.workers == (900 * MB) // budget.max_cost()
+    assert budget.available == 900 * MB
+
+
+def test_observe_scales_by_the_worker_process_peak(rss):
+    budget = generator.MemoryBudget(1000 * MB, GEN_KWARGS, 100 * MB, 2, "process")
+    budget.reserve(50 * MB)
+    budget.reserve(50 * MB)
+    rss[4242] = 150 * MB
+    budget.observe(4242, {"max_rss_bytes": 200 * MB})
+    assert budget.scale == 2.0
+    assert budget.measured_rss() == 250 * MB
+
+
+def test_observe_scales_threads_by_all_records_in_flight(rss):
+    budget = generator.MemoryBudget(1000 * MB, GEN_KWARGS, 100 * MB, 2, "thread")
+    budget.reserve(50 * MB)
+    budget.reserve(50 * MB)
+    budget.observe(os.getpid(), {"max_rss_bytes": 250 * MB})
+    assert budget.scale == 1.5
+    assert budget.measured_rss() == 100 * MB
+    assert budget.fits(0)
+    rss[os.getpid()] = 1000 * MB
+    assert not budget.fits(0)
@@ -0,0 +1,65 @@
+import json
+import re
+import sys
+import time
+
+import generator
+
+SAMPLE_RE = re.compile(r'^xmlgen_(\w+)(?:\{stage="(\w+)"\})? (\S+)$')
+
+
+def parse_prometheus(text):
+    """{name: value} and {(name, stage): value}, checking every family has HELP and TYPE."""
+    samples, declared = {}, set()
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            declared.add(line.split()[2])
+        elif line.startswith("# TYPE "):
+            _, _, name, kind = line.split()
+            assert name in declared and kind in ("counter", "gauge")
+        else:
+            name, stage, value = SAMPLE_RE.match(line).groups()
+            assert f"xmlgen_{name}" in declared
+            samples[(name, stage) if stage else name] = float(value)
+    return samples
+
+
+def test_nested_stages_are_timed_exclusively():
+    metrics = generator.StageMetrics()
+    with metrics.stage("pdf"):
+        time.sleep(0.02)
+        with metrics.stage("image"):
+            time.sleep(0.05)
+    metrics.add_bytes("pdf", 10)
+    snapshot = metrics.snapshot()
+    assert 0.02 <= snapshot["seconds"]["pdf"] < 0.05
+    assert snapshot["seconds"]["image"] >= 0.05
+    assert snapshot["calls"]["pdf"] == snapshot["calls"]["image"] == 1
+    assert snapshot["bytes"]["pdf"] == 10
+
+
+def test_run_summary_json_and_prometheus(output_dir, base_xml, tmp_path, monkeypatch):
+    metrics_json, metrics_prom = tmp_path / "metrics.json", tmp_path / "metrics.prom"
+    monkeypatch.setattr(generator, "METRICS", generator.StageMetrics())
+    monkeypatch.setattr(sys, "argv", ["generator.py", "-q", "--num", "4", "--seed", "1", "--workers", "2",
+                                      "--attachments-total-mb", "0.3", "--base-xml", base_xml,
+                                      "--csv-name", str(tmp_path / "run.csv"), "--metrics-json", str(metrics_json),
+                                      "--metrics-prom", str(metrics_prom)])
+    generator.main()
+
+    summary = json.loads(metrics_json.read_text())
+    written = sum(path.stat().st_size for path in output_dir.iterdir())
+    assert summary["records"] == 4
+    assert summary["output_bytes"] == summary["stages"]["write"]["bytes"] == written
+    assert set(summary["stages"]) == set(generator.StageMetrics.STAGES)
+    assert summary["stages"]["pdf"]["calls"] >= 4 and summary["stages"]["csv"]["calls"] >= 4
+    assert sum(p["records"] for p in summary["processes"].values()) == 4
+
+    samples = parse_prometheus(metrics_prom.read_text())
+    assert samples["records_total"] == 4
+    assert samples["output_bytes_total"] == written
+    for name in generator.StageMetrics.STAGES:
+        assert samples[("stage_bytes_total", name)] == summary["stages"][name]["bytes"]
+        assert samples[("stage_calls_total", name)] == summary["stages"][name]["calls"]
+    assert samples["peak_rss_bytes"] == summary["peak_rss_bytes_total"] > 0
+    assert not (tmp_path / "metrics.prom.tmp").exists()
@@ -0,0 +1,114 @@
+import asyncio
+import sys
+
+import pytest
+
+import mq_driver
+
+
+def test_request_times_out_on_stalled_server():
+    async def scenario():
+        async def stall(reader, writer):
+            await reader.readline()
+            await asyncio.sleep(10)
+
+        server = await asyncio.start_server(stall, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = mq_driver.HttpConnectionPool(f"http://127.0.0.1:{port}", timeout=0.2)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.request("GET", mq_driver.MQ_PATH)
+            assert pool._idle == []
+        finally:
+            server.close()
+
+    asyncio.run(scenario())
+
+
+def test_send_survives_receiver_popping_the_message():
+    async def scenario():
+        driver = mq_driver.LoadDriver("http://127.0.0.1:1", receivers=1)
+
+        class FastConsumerPool:
+            async def request(self, method, path, headers, body):
+                # The reply is consumed before the POST returns
+                driver.in_flight.pop(headers["x-message-id"])
+                return 202, {}, b"", 0.001
+
+        driver.send_pool = FastConsumerPool()
+        await driver._send("TEST-MSG-ID1", b"<?xml version='1.0'?><a/>", "sender")
+        assert driver.sent == 1 and driver.send_errors == 0
+        assert driver.send_latency.summary_ms([50])["count"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_stub_round_trip():
+    async def scenario():
+        stub = mq_driver.StubMqServer()
+        url = await stub.start()
+        pool = mq_driver.HttpConnectionPool(url, timeout=5)
+        headers = {"x-mq-queue-name": mq_driver.INBOUND_QUEUE, "x-message-id": "m1"}
+        status, _, _, _ = await pool.request("POST", mq_driver.MQ_PATH, headers, b"<a/>")
+        assert status in (200, 201, 202)
+        status, response_headers, body, _ = await pool.request(
+            "GET", mq_driver.MQ_PATH, {"x-mq-queue-name": mq_driver.OUTBOUND_QUEUE})
+        assert (status, response_headers.get("x-message-id"), body) == (200, "m1", b"<a/>")
+        await pool.close()
+        await stub.stop()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("value", [1, 127, 1000, 65_537, 1_234_567, 987_654_321])
+def test_histogram_relative_error_is_under_one_percent(value):
+    histogram = mq_driver.LatencyHistogram()
+    histogram.record(value)
+    histogram.record(10 ** 12)
+    assert abs(histogram.percentile(50) - value) / value < 0.01
+
+
+def test_request_closes_the_connection_on_a_malformed_response():
+    async def scenario():
+        closed = asyncio.Event()
+
+        async def garbage(reader, writer):
+            await reader.readline()
+            writer.write(b"HTTP/1.1 OK\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+            await reader.read()
+            closed.set()
+
+        server = await asyncio.start_server(garbage, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = mq_driver.HttpConnectionPool(f"http://127.0.0.1:{port}", timeout=5)
+        try:
+            with pytest.raises(ValueError):
+                await pool.request("GET", mq_driver.MQ_PATH)
+            assert pool._idle == []
+            await asyncio.wait_for(closed.wait(), 5)
+        finally:
+            server.close()
+
+    asyncio.run(scenario())
+
+
+def test_stub_answers_an_empty_poll_with_no_content():
+    async def scenario():
+        stub = mq_driver.StubMqServer()
+        await stub.start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", stub.port)
+        writer.write(f"GET {mq_driver.MQ_PATH} HTTP/1.1\r\nHost: stub\r\n"
+                     f"x-mq-queue-name: {mq_driver.OUTBOUND_QUEUE}\r\n\r\n".encode())
+        status_line = await reader.readline()
+        writer.close()
+        await stub.stop()
+        return status_line
+
+    assert asyncio.run(scenario()) == b"HTTP/1.1 204 No Content\r\n"
+
+
+def test_generated_runs_reject_num_zero(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["mq_driver.py", "--stub", "--num", "0"])
+    with pytest.raises(ValueError, match="--num"):
+        mq_driver.main()
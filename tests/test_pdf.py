@@ -0,0 +1,80 @@
+import base64
+import io
+import re
+
+import numpy as np
+import pytest
+from PyPDF2 import PdfReader
+
+import generator
+
+
+def assert_valid_xref(data):
+    """Every xref entry points at its 'N 0 obj' and startxref points at the table."""
+    startxref = int(re.search(rb"startxref\s+(\d+)\s+%%EOF\s*$", data).group(1))
+    assert data[startxref:startxref + 4] == b"xref"
+    first, count = map(int, re.match(rb"xref\s+(\d+) (\d+)\s+", data[startxref:]).groups())
+    table = data[startxref:].split(b"\n", 2)[2]
+    for num, entry in zip(range(first, first + count), table.split(b"\n")[:count]):
+        offset, _, kind = entry.split()[:3]
+        if kind == b"n":
+            assert data[int(offset):].startswith(b"%d 0 obj" % num), num
+    assert len(PdfReader(io.BytesIO(data)).pages) >= 1
+
+
+@pytest.mark.parametrize("size_mb", [0.05, 0.6, 1.5])
+@pytest.mark.parametrize("pooled", [True, False])
+def test_direct_pdf_is_exact_and_indexed(size_mb, pooled):
+    pool = generator.JpegPool.build(2, seed=1) if pooled else None
+    data = generator.generate_pdf_of_size(size_mb, backend="direct", image_pool=pool,
+                                          rng=np.random.default_rng(2)).getvalue()
+    assert len(data) == generator._target_bytes_with_safety(size_mb)
+    assert data.startswith(b"%PDF-")
+    assert_valid_xref(data)
+
+
+def test_image_pool_refreshes_per_epoch_of_records():
+    pool = generator.JpegPool.build(1, refresh=3, seed=4)
+    first = pool.next(record_index=0)
+    assert pool.next(record_index=2) is first
+    second = pool.next(record_index=3)
+    assert second[0] != first[0]
+    assert pool.next(record_index=5) is second
+    assert pool.next(record_index=0)[0] == first[0]
+
+
+@pytest.mark.parametrize("size_mb", [0.01, 0.5, 1.3])
+def test_raw_pdf_is_exact_and_indexed(size_mb):
+    data = generator.generate_pdf_of_size(size_mb, backend="raw", rng=np.random.default_rng(3)).getvalue()
+    assert len(data) == generator._target_bytes_with_safety(size_mb)
+    assert data.startswith(b"%PDF-")
+    assert_valid_xref(data)
+
+
+@pytest.mark.parametrize("size_mb", [0.01, 0.7])
+def test_raw_pdf_base64_matches_plain_encoding(size_mb):
+    data = generator.generate_pdf_of_size(size_mb, backend="raw", rng=np.random.default_rng(9)).getvalue()
+    assert generator._raw_pdf_base64(size_mb, rng=np.random.default_rng(9)) == base64.b64encode(data)
+
+
+@pytest.mark.parametrize("mode,components,color_space", [("L", 1, b"/DeviceGray"), ("RGB", 3, b"/DeviceRGB"),
+                                                         ("CMYK", 4, b"/DeviceCMYK")])
+def test_loaded_pool_images_keep_their_color_space(tmp_path, mode, components, color_space):
+    from PIL import Image
+    Image.new(mode, (64, 48)).save(tmp_path / "page.jpg", "JPEG")
+    pool = generator.JpegPool.load(str(tmp_path))
+    assert generator._jpeg_components(pool.entries[0][0]) == components
+
+    data = generator.generate_pdf_of_size(0.05, backend="direct", image_pool=pool).getvalue()
+    assert len(data) == generator._target_bytes_with_safety(0.05)
+    assert b"/ColorSpace " + color_space in data
+    assert_valid_xref(data)
+
+
+@pytest.mark.parametrize("gap", [-1, 3])
+def test_unreachable_target_size_is_an_error(gap):
+    writer = generator.DirectPdfWriter()
+    writer.add_blank_page()
+    size = writer._final_size(writer.offset, len(writer.offsets), writer.page_nums)
+    with pytest.raises(ValueError, match="cannot bring the PDF"):
+        writer.finish(size + gap)
@@ -0,0 +1,49 @@
+import csv
+import json
+import os
+import sys
+
+import generator
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["generator.py", "-q", *args])
+    generator.main()
+
+
+def read_rows(csv_path):
+    with open(csv_path, newline="") as f:
+        return sorted(csv.DictReader(f), key=lambda row: row["filename"])
+
+
+def test_resume_keeps_finished_records_and_rebuilds_csv(output_dir, base_xml, tmp_path, monkeypatch):
+    csv_path = tmp_path / "run.csv"
+    args = ["--num", "5", "--seed", "3", "--workers", "1", "--attachments-total-mb", "0.3",
+            "--base-xml", base_xml, "--csv-name", str(csv_path)]
+    run_main(monkeypatch, *args)
+    complete = read_rows(csv_path)
+    manifest_path = tmp_path / "run.csv.manifest.jsonl"
+    header, *entries = manifest_path.read_text().splitlines()
+    assert json.loads(header)["type"] == "run" and len(entries) == 5
+
+    # Interrupt after three records: the third XML never made it to disk,
+    # a torn checkpoint line and a torn CSV row were left behind
+    kept = [json.loads(line) for line in entries[:3]]
+    manifest_path.write_text("\n".join([header] + entries[:3]) + '\n{"index": 4, "filen')
+    (output_dir / kept[2]["filename"]).unlink()
+    done = {entry["filename"] for entry in kept[:2]}
+    for name in os.listdir(output_dir):
+        if name not in done:
+            (output_dir / name).unlink(missing_ok=True)
+    mtimes = {name: os.stat(output_dir / name).st_mtime_ns for name in done}
+    with open(csv_path, "a") as f:
+        f.write("torn,row")
+
+    run_main(monkeypatch, *args, "--resume")
+
+    assert read_rows(csv_path) == complete
+    assert sorted(os.listdir(output_dir)) == sorted(row["filename"] for row in complete)
+    assert {name: os.stat(output_dir / name).st_mtime_ns for name in done} == mtimes
+    resumed = [json.loads(line) for line in manifest_path.read_text().splitlines()[1:]]
+    assert sorted(entry["index"] for entry in resumed) == list(range(5))
+    assert {e["index"]: e["sha256"] for e in resumed} == {json.loads(e)["index"]: json.loads(e)["sha256"] for e in entries}
@@ -0,0 +1,53 @@
+import csv
+
+import generator
+
+BUCKET = "test-bucket"
+
+
+def fill(s3, count, prefix="test_xmls/"):
+    keys = [f"{prefix}record_{i:05d}.xml" for i in range(count)]
+    for key in keys:
+        s3.objects[key] = ("0" * 32, 1)
+    return keys
+
+
+def test_keys_are_deleted_in_batches_of_1000(s3):
+    keys = fill(s3, 2500)
+    deleted, errors = generator.delete_s3_keys(BUCKET, iter(keys), concurrency=3)
+    assert (deleted, errors) == (2500, [])
+    assert sorted(s3.delete_batches) == [500, 1000, 1000]
+    assert not s3.objects
+
+
+def test_failed_keys_are_retried_and_persistent_failures_reported(s3, capsys):
+    keys = fill(s3, 1200)
+    s3.fail_once = set(keys[::100])
+    s3.fail_always = {keys[7]}
+    deleted, errors = generator.delete_s3_keys(BUCKET, keys)
+    assert deleted == 1199
+    assert [err["Key"] for err in errors] == [keys[7]]
+    assert list(s3.objects) == [keys[7]]
+    # One call per batch, then retries of only the failed keys: 11 then the
+    # persistent one until S3_DELETE_RETRIES runs out, and 2 for the second batch
+    assert sorted(s3.delete_batches) == sorted([1000, 11] + [1] * (generator.S3_DELETE_RETRIES - 1) + [200, 2])
+    assert f"could not delete s3://{BUCKET}/{keys[7]}: SlowDown" in capsys.readouterr().out
+
+
+def test_cleanup_by_prefix_and_from_csv(s3, tmp_path):
+    fill(s3, 1500)
+    kept = fill(s3, 3, prefix="other/")
+    generator.cleanup_s3_by_prefix(BUCKET, "test_xmls/", concurrency=2)
+    assert sorted(s3.objects) == kept
+
+    shard_rows = [{"filename": f"r{i}.xml", "shard": "run-00000.tar"} for i in range(3)]
+    loose_rows = [{"filename": "loose.xml", "shard": ""}]
+    for key in ("test_xmls/run-00000.tar", "test_xmls/run-00000.tar.index.json", "test_xmls/loose.xml"):
+        s3.objects[key] = ("0" * 32, 1)
+    csv_path = tmp_path / "run.csv"
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["filename", "shard"])
+        writer.writeheader()
+        writer.writerows(shard_rows + loose_rows)
+    generator.cleanup_s3_from_csv(BUCKET, str(csv_path))
+    assert sorted(s3.objects) == kept
@@ -0,0 +1,54 @@
+import csv
+import os
+import sys
+
+import generator
+
+BUCKET = "test-bucket"
+
+
+def sync_run(monkeypatch, base_xml, csv_path, seed="4"):
+    if csv_path.exists():
+        csv_path.unlink()
+    monkeypatch.setattr(sys, "argv", ["generator.py", "-q", "--num", "5", "--seed", seed, "--workers", "1",
+                                      "--pdf-backend", "raw", "--attachments-total-mb", "0.3", "--base-xml", base_xml,
+                                      "--csv-name", str(csv_path), "--upload-s3", "--s3-bucket", BUCKET, "--s3-sync"])
+    generator.main()
+    with open(csv_path, newline="") as f:
+        return sorted(csv.DictReader(f), key=lambda row: row["filename"])
+
+
+def record_puts(s3):
+    puts = [key for key in s3.puts if key.startswith("test_xmls/")]
+    s3.puts.clear()
+    return puts
+
+
+def test_sync_uploads_only_what_changed(output_dir, base_xml, tmp_path, monkeypatch, s3):
+    s3.page_size = 2  # several listing pages
+    csv_path = tmp_path / "sync.csv"
+    rows = sync_run(monkeypatch, base_xml, csv_path)
+    assert len(record_puts(s3)) == 5
+    manifest = tmp_path / f".s3sync-{BUCKET}.jsonl"
+    assert len(manifest.read_text().splitlines()) == 5
+
+    # Same command again: every record is reused from the bucket, nothing is generated or PUT
+    assert sync_run(monkeypatch, base_xml, csv_path) == rows
+    assert record_puts(s3) == []
+    assert not os.listdir(output_dir)
+
+    # An object changed in the bucket is regenerated and uploaded again
+    changed = f"test_xmls/{rows[1]['filename']}"
+    s3.objects[changed] = ("0" * 32, s3.objects[changed][1])
+    assert sync_run(monkeypatch, base_xml, csv_path) == rows
+    assert record_puts(s3) == [changed]
+
+    # Without the manifest files are generated but matched by ETag, so none is PUT
+    manifest.unlink()
+    assert sync_run(monkeypatch, base_xml, csv_path) == rows
+    assert record_puts(s3) == []
+    assert len(manifest.read_text().splitlines()) == 5
+
+    # A different seed is different content: all of it goes up
+    sync_run(monkeypatch, base_xml, csv_path, seed="5")
+    assert len(record_puts(s3)) == 5
@@ -0,0 +1,87 @@
+import csv
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import pytest
+
+import generator
+
+
+def test_ring_hands_out_each_payload_once_in_order():
+    ring = generator.PayloadRing(2)
+    assert ring.put("a") and ring.put("b")
+    blocked = threading.Thread(target=ring.put, args=("c",))
+    blocked.start()
+    time.sleep(0.05)
+    assert blocked.is_alive() and len(ring) == 2
+    assert ring.take() == "a"
+    blocked.join(1)
+    assert [ring.take(), ring.take()] == ["b", "c"]
+    assert ring.take(timeout=0.01) is None
+    ring.close()
+    assert ring.put("d") is False
+
+
+@pytest.fixture
+def payload_server(output_dir, base_xml, tmp_path, monkeypatch):
+    servers = []
+
+    class RecordingServer(generator.PayloadServer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            servers.append(self)
+
+    monkeypatch.setattr(generator, "PayloadServer", RecordingServer)
+    csv_path = tmp_path / "served.csv"
+    worker = partial(generator._generate_payload, base_xml=base_xml, alt_base_xml=None, alt_base_percent=0,
+                     seed=3, attachments_total_mb=0.2)
+    executor = ThreadPoolExecutor(max_workers=2)
+    thread = threading.Thread(target=generator.serve_payloads, daemon=True,
+                              args=("127.0.0.1", 0, 3, executor, worker, 2, str(csv_path),
+                                    generator.RunMonitor(interval=0)),
+                              kwargs={"wait_timeout": 5.0, "limit": 6})
+    thread.start()
+    while not servers:
+        time.sleep(0.01)
+    yield servers[0], csv_path, thread
+    thread.join(10)
+    executor.shutdown(cancel_futures=True)
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_server_serves_and_refills_the_ring(payload_server, output_dir):
+    server, csv_path, thread = payload_server
+    ring = server.ring
+    wait_until(lambda: len(ring) == ring.capacity)
+
+    served = []
+    for _ in range(6):
+        with urllib.request.urlopen(server.payload_url) as response:
+            body = response.read()
+            served.append((response.headers["X-Message-Id"], body))
+        assert response.headers["X-Message-Id"].encode() in body
+        if len(served) == 3:
+            # Drained by three requests, the ring fills up again
+            wait_until(lambda: len(ring) == ring.capacity)
+
+    ids = [message_id for message_id, _ in served]
+    assert len(set(ids)) == 6
+    assert all(body.startswith(b"<?xml") for _, body in served)
+    # The sixth payload hits --serve-limit and stops the server
+    thread.join(10)
+    assert not thread.is_alive()
+    with open(csv_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    # A row is appended once its response is sent, so rows can trail the responses
+    assert sorted(row["messageId"] for row in rows) == sorted(ids)
+    assert {row["filepath"] for row in rows} == {server.payload_url}
+    assert not list(output_dir.iterdir())
@@ -0,0 +1,77 @@
+import csv
+import sys
+
+import pytest
+
+import generator
+
+
+@pytest.mark.parametrize("num", [0, 1, 7, 10, 101])
+@pytest.mark.parametrize("n", [1, 3, 4, 16])
+def test_shards_cover_every_index_once(num, n):
+    covered = [i for k in range(n) for i in generator._shard_range(num, k, n)]
+    assert covered == list(range(num))
+
+
+@pytest.mark.parametrize("text", ["3/3", "-1/2", "1/0", "a/b", "1"])
+def test_bad_shard_specs_are_rejected(text):
+    with pytest.raises(ValueError):
+        generator._parse_shard(text)
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(generator.CSV_HEADER)
+        writer.writerows(rows)
+
+
+def row(i):
+    return [f"IE3F32_updated_no_attachments_20260101000000_{i}.xml", f"test_xmls/x_{i}.xml", f"M{i}", f"L{i}",
+            "2026-01-01T00:00:00Z", "false", "0", "0.0", "IE3F32.xml"]
+
+
+def test_merge_sorts_by_index_with_one_header(tmp_path):
+    inputs = []
+    for k, indices in enumerate([[9, 1, 4, 12], [0, 11, 3], [7, 2, 10, 5, 8, 6]]):
+        path = tmp_path / f"shard{k}.csv"
+        write_csv(path, [row(i) for i in indices])
+        inputs.append(str(path))
+    output = tmp_path / "merged.csv"
+    # Two rows per run forces several sorted runs per input
+    assert generator.merge_csvs(inputs, str(output), run_rows=2) == 13
+    with open(output, newline="") as f:
+        merged = list(csv.reader(f))
+    assert merged[0] == generator.CSV_HEADER
+    assert merged[1:] == [row(i) for i in range(13)]
+
+
+def test_merge_rejects_mismatched_headers(tmp_path):
+    write_csv(tmp_path / "a.csv", [row(0)])
+    (tmp_path / "b.csv").write_text("filename,other\n")
+    with pytest.raises(ValueError):
+        generator.merge_csvs([str(tmp_path / "a.csv"), str(tmp_path / "b.csv")], str(tmp_path / "out.csv"))
+
+
+def test_sharded_runs_merge_into_the_single_node_csv(output_dir, base_xml, tmp_path, monkeypatch):
+    def run(*args):
+        monkeypatch.setattr(sys, "argv", ["generator.py", "-q", "--seed", "8", "--workers", "1",
+                                          "--no-attachments-percent", "100", "--base-xml", base_xml, *args])
+        generator.main()
+
+    run("--num", "7", "--csv-name", str(tmp_path / "single.csv"))
+    shards = [str(tmp_path / f"shard{k}.csv") for k in range(3)]
+    for k, path in enumerate(shards):
+        run("--num", "7", "--shard", f"{k}/3", "--csv-name", path)
+    run("--merge-csvs", *reversed(shards), "--csv-name", str(tmp_path / "merged.csv"))
+
+    def rows(name):
+        with open(tmp_path / name, newline="") as f:
+            return list(csv.reader(f))
+
+    single, merged = rows("single.csv"), rows("merged.csv")
+    # The single-node CSV is in completion order; the merge is in index order
+    index = generator._merge_key("index", single[0])
+    assert merged[0] == single[0]
+    assert merged[1:] == sorted(single[1:], key=index)
+    assert [index(row) for row in merged[1:]] == list(range(7))
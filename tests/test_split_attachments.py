@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import generator
+
+PLAN = dict(attachments_total_mb=5.0, attachment_max_mb=2.0)
+
+
+def test_split_only_when_plan_is_certain():
+    assert generator._split_attachment_sizes(0, **PLAN) == [2.0, 2.0, 1.0]
+    assert generator._split_attachment_sizes(0, seed=7, no_attachments_percent=50, **PLAN) == \
+        generator._planned_attachment_sizes(0, seed=7, no_attachments_percent=50, **PLAN)
+    # Unseeded records may roll no attachments; library reuse is decided inside the record
+    assert generator._split_attachment_sizes(0, no_attachments_percent=50, **PLAN) == []
+    assert generator._split_attachment_sizes(0, seed=7, attachment_library="lib.bin", **PLAN) == []
+    assert generator._split_attachment_sizes(0, seed=7, attachment_library="lib.bin", library_reuse_percent=0,
+                                             **PLAN) == [2.0, 2.0, 1.0]
+
+
+def test_imap_split_runs_unplanned_records_whole():
+    built, records = [], {}
+
+    def attachment_fn(job):
+        built.append(job[:2])
+        return job[:2], f"blob{job[1]}", (0, None)
+
+    def record_fn(i, prebuilt_blobs=None):
+        records[i] = prebuilt_blobs
+        return i
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        done = list(generator._imap_split(executor, record_fn, attachment_fn, [0, 1, 2],
+                                          lambda i: [2.0, 1.0] if i == 1 else [], 4))
+    assert sorted(done) == [0, 1, 2]
+    assert sorted(built) == [(1, 1), (1, 2)]
+    assert records == {0: None, 1: ["blob1", "blob2"], 2: None}
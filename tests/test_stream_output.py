@@ -0,0 +1,69 @@
+import base64
+import io
+import tracemalloc
+from datetime import datetime, timezone
+
+import pytest
+
+import generator
+
+RECORD = dict(seed=6, fixed_time=datetime(2026, 10, 18, tzinfo=timezone.utc), attachments_total_mb=6,
+              attachment_max_mb=2, no_attachments_percent=0, image_pool_size=4)
+
+
+def test_base64_stream_writer_matches_b64encode():
+    data = bytes(range(256)) * 300
+    out = io.BytesIO()
+    encoder = generator.Base64StreamWriter(out, chunk_size=1000)
+    for start, size in ((0, 1), (1, 2), (3, 4097), (4100, len(data))):
+        encoder.write(data[start:start + size])
+    encoder.close()
+    assert out.getvalue() == base64.b64encode(data)
+
+
+def test_stream_xml_splices_base64_between_fragments():
+    fragments = [b"<r><a>", b"</a><a>", b"</a><a>", b"</a></r>"]
+    pdf = bytes(range(256)) * 50 + b"x"
+
+    def write_pdf(sink):
+        for start in range(0, len(pdf), 777):
+            sink.write(pdf[start:start + 777])
+
+    out = io.BytesIO()
+    ready = base64.b64encode(b"ready-made")
+    generator.stream_xml_with_attachments(out, fragments, [write_pdf, ready, write_pdf], chunk_size=1000)
+    encoded = base64.b64encode(pdf)
+    assert out.getvalue() == b"".join([fragments[0], encoded, fragments[1], ready, fragments[2], encoded,
+                                       fragments[3]])
+
+
+@pytest.mark.parametrize("backend", ["direct", "raw"])
+@pytest.mark.parametrize("chunk_bytes", [4096, generator.STREAM_CHUNK_BYTES])
+def test_streamed_xml_is_byte_identical(output_dir, base_xml, chunk_bytes, backend):
+    in_memory = generator.generate_and_update(2, base_xml, None, 0, pdf_backend=backend, **RECORD)
+    streamed = generator.generate_and_update(2, base_xml, None, 0, stream_output=True, pdf_backend=backend,
+                                             stream_chunk_bytes=chunk_bytes, **RECORD)
+    assert streamed[1] is None
+    assert streamed[0] == in_memory[0]
+    assert (output_dir / streamed[0]).read_bytes() == in_memory[1].getvalue()
+
+
+@pytest.mark.parametrize("backend", ["direct", "raw"])
+def test_stream_output_memory_is_bounded(output_dir, base_xml, backend):
+    # Warm the image pool and template caches so only the record itself is measured
+    generator.generate_and_update(0, base_xml, None, 0, stream_output=True, pdf_backend=backend, **RECORD)
+    tracemalloc.start()
+    try:
+        result = generator.generate_and_update(1, base_xml, None, 0, stream_output=True, pdf_backend=backend,
+                                               **RECORD)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert (output_dir / result[0]).stat().st_size > 5 * 1024 * 1024
+    assert peak < 1024 * 1024
+
+
+def test_raw_stream_estimate_does_not_grow_with_attachments():
+    gen_kwargs = dict(stream_output=True, pdf_backend="raw", stream_chunk_bytes=4096)
+    budget = generator.MemoryBudget(1 << 30, gen_kwargs, 0, 1)
+    assert budget.estimate([2, 2, 2]) == budget.estimate([0.1]) < 1024 * 1024
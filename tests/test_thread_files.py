@@ -0,0 +1,66 @@
+import base64
+import csv
+import os
+
+import generator
+
+
+def _corpus(output_dir, tmp_path, sizes):
+    """
+    Write one fake XML per size into OUTPUT_DIR and a jmeter_data CSV listing them.
+    """
+    csv_path = tmp_path / "jmeter_data.csv"
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(generator.CSV_HEADER)
+        for i, size in enumerate(sizes):
+            name = f"IE3F32_updated_{i}.xml"
+            (output_dir / name).write_bytes(b"<a>" + b"x, y" * (size // 4) + b"</a>")
+            writer.writerow([name, f"test_xmls/{name}", f"TEST-MSG-ID{i}", f"{i}LRN", "2024-01-01T00:00:00Z",
+                             "true", 1, 1.0, "IE3F32.xml"])
+    return str(csv_path)
+
+
+def _jmeter_rows(path):
+    # mq.jmx: quotedData=false, delimiter ",", no header
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\r\n").split(",") for line in f]
+
+
+def test_rows_parse_as_five_unquoted_columns(output_dir, tmp_path):
+    csv_path = _corpus(output_dir, tmp_path, [1000, 200000, 3000, 400000, 500])
+    thread_dir, _, counts = generator.write_thread_files(csv_path, 2, inline_max_bytes=64 * 1024)
+
+    inlined = 0
+    for t in (1, 2):
+        for fields in _jmeter_rows(os.path.join(thread_dir, f"thread_{t}.csv")):
+            assert len(fields) == len(generator.THREAD_FILE_COLUMNS)
+            filename, filepath, message_id = fields[:3]
+            assert message_id.startswith("TEST-MSG-ID")
+            if filepath.startswith(generator.INLINE_PAYLOAD_PREFIX):
+                inlined += 1
+                payload = base64.b64decode(filepath[len(generator.INLINE_PAYLOAD_PREFIX):])
+                assert payload == (output_dir / filename).read_bytes()
+            else:
+                assert filepath == f"test_xmls/{filename}"
+    assert inlined == 3
+    assert sorted(counts) == [2, 3]
+
+
+def test_threads_get_even_size_mix_and_properties(output_dir, tmp_path):
+    csv_path = _corpus(output_dir, tmp_path, [10000 * (i + 1) for i in range(8)])
+    thread_dir, properties, counts = generator.write_thread_files(csv_path, 4)
+
+    assert counts == [2, 2, 2, 2]
+    totals = []
+    for t in range(1, 5):
+        rows = _jmeter_rows(os.path.join(thread_dir, f"thread_{t}.csv"))
+        totals.append(sum(os.path.getsize(output_dir / fields[0]) for fields in rows))
+    assert max(totals) - min(totals) <= 10000
+
+    with open(properties) as f:
+        props = dict(line.strip().split("=", 1) for line in f if "=" in line and not line.startswith("#"))
+    assert props["senderThreads"] == "4"
+    assert props["totalMessages"] == "8"
+    assert props["dataShareMode"] == "shareMode.thread"
+    assert props["dataFile"].endswith("thread_${__threadNum}.csv")
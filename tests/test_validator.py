@@ -0,0 +1,111 @@
+import base64
+import csv
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import generator
+
+
+@pytest.fixture
+def corpus(output_dir, base_xml, tmp_path, monkeypatch):
+    csv_path = tmp_path / "jmeter_data.csv"
+    monkeypatch.setattr(sys, "argv", ["generator.py", "-q", "--num", "4", "--seed", "5", "--workers", "1",
+                                      "--pdf-backend", "raw", "--attachments-total-mb", "1", "--attachment-max-mb",
+                                      "0.5", "--base-xml", base_xml, "--csv-name", str(csv_path)])
+    generator.main()
+    return str(csv_path)
+
+
+def validate(csv_path):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        return generator.validate_corpus(csv_path, executor, 4)
+
+
+def rows(csv_path):
+    with open(csv_path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def rewrite(csv_path, rows_):
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows_[0]))
+        writer.writeheader()
+        writer.writerows(rows_)
+
+
+def problems_of(violations, filename):
+    return [problem for name, problem in violations if name == filename]
+
+
+def test_clean_corpus_passes_and_ignores_other_runs(corpus, output_dir):
+    (output_dir / "left_by_another_run.xml").write_text("<a/>")
+    checked, violations, skipped, nbytes = validate(corpus)
+    assert (checked, violations, skipped) == (4, [], 0)
+    assert nbytes > 4 * 1024 * 1024
+    assert generator.unlisted_xmls(corpus) == ["left_by_another_run.xml"]
+
+
+def test_truncated_and_corrupted_files(corpus, output_dir):
+    first, second = [row["filename"] for row in rows(corpus)[:2]]
+    data = (output_dir / first).read_bytes()
+    (output_dir / first).write_bytes(data[:len(data) // 2])
+    data = bytearray((output_dir / second).read_bytes())
+    pos = data.index(b"<content>") + len(b"<content>") + 1000
+    data[pos:pos + 4] = b"!!!!"
+    (output_dir / second).write_bytes(bytes(data))
+
+    _, violations, _, _ = validate(corpus)
+    assert any(p.startswith("malformed XML") for p in problems_of(violations, first))
+    assert any(p.endswith("invalid base64") for p in problems_of(violations, second))
+
+
+def test_csv_disagreements(corpus, output_dir):
+    rows_ = rows(corpus)
+    rows_[0]["messageId"] = "TEST-MSG-IDwrong"
+    rows_[1]["attachmentCount"] = "7"
+    rows_[2]["messageId"] = rows_[3]["messageId"]
+    (output_dir / rows_[3]["filename"]).unlink()
+    rewrite(corpus, rows_)
+
+    _, violations, _, _ = validate(corpus)
+    assert any("does not match CSV" in p for p in problems_of(violations, rows_[0]["filename"]))
+    assert any("CSV says 7" in p for p in problems_of(violations, rows_[1]["filename"]))
+    assert any(p.startswith("duplicate messageId") for _, p in violations)
+    assert "file missing" in problems_of(violations, rows_[3]["filename"])
+
+
+def _record(content, filename="a.pdf"):
+    return (b"<?xml version='1.0'?><CC3F32 xmlns='urn:x'><Header><MessageId>M</MessageId></Header>"
+            b"<Declaration><LRN>L</LRN><Attachments><filename>" + filename.encode() + b"</filename>"
+            b"<content>" + base64.b64encode(content) + b"</content></Attachments></Declaration></CC3F32>")
+
+
+def _check(data):
+    validator = generator.StreamingRecordValidator(generator._bytes_from_mb(generator.MAX_PER_ATTACHMENT_MB))
+    for pos in range(0, len(data), 4096):
+        validator.feed(data[pos:pos + 4096])
+    validator.feed(b"", final=True)
+    row = {"messageId": "M", "lrn": "L", "attachmentCount": "1", "hasAttachments": "true",
+           "attachmentsTotalMB": "10"}
+    return validator.check_row(row, generator._bytes_from_mb(generator.MAX_TOTAL_ATTACHMENTS_MB))
+
+
+def test_attachment_framing_and_caps():
+    assert _check(_record(b"%PDF-1.4\n" + b"0" * 5000 + b"\n%%EOF\n")) == []
+    assert _check(_record(b"GIF89a" + b"0" * 100)) == ["a.pdf: not a PDF (no %PDF- header)"]
+    assert _check(_record(b"%PDF-1.4\n" + b"0" * 5000)) == ["a.pdf: PDF has no %%EOF trailer"]
+    oversized = b"%PDF-1.4\n" + b"0" * generator._bytes_from_mb(2.5) + b"\n%%EOF\n"
+    assert any("exceeds the 2 MB cap" in p for p in _check(_record(oversized)))
+
+
+def test_archive_shards_are_streamed(output_dir, base_xml, tmp_path, monkeypatch):
+    csv_path = tmp_path / "archived.csv"
+    monkeypatch.setattr(sys, "argv", ["generator.py", "-q", "--num", "3", "--seed", "5", "--workers", "1",
+                                      "--pdf-backend", "raw", "--attachments-total-mb", "1", "--archive", "tar",
+                                      "--archive-compression", "gzip", "--base-xml", base_xml,
+                                      "--csv-name", str(csv_path)])
+    generator.main()
+    checked, violations, _, _ = validate(str(csv_path))
+    assert (checked, violations) == (3, [])
@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import generator
+
+ODD_XML = """<?xml version="1.0"?>
+<!-- comment -->
+<root xmlns="urn:x:y" xmlns:o="urn:other"><o:Ext a="1">t</o:Ext><MessageId/><Atts><Attachments><filename>x</filename>\
+<content/><extra>keep &lt;me&gt;</extra></Attachments></Atts><Other><Attachments><filename>y</filename>\
+<content>Z</content></Attachments></Other><LRN>é</LRN></root>
+"""
+
+FIELDS = {
+    "descriptionOfGoods": "Goods & <more> \"quoted\"",
+    "MessageId": "TEST-MSG-ID1234",
+    "LRN": "LRN-é-42",
+    "Timestamp": "2026-10-18T10:00:00",
+    "documentIssueDate": "2026-10-18",
+}
+
+FIXED_TIME = datetime(2026, 10, 18, tzinfo=timezone.utc)
+
+
+@pytest.fixture(params=["sample", "odd"])
+def xml_path(request, base_xml, tmp_path):
+    if request.param == "sample":
+        return base_xml
+    path = tmp_path / "odd.xml"
+    path.write_text(ODD_XML, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("filenames", [[], ["a.pdf"], ["a&b.pdf", "c<d>.pdf", "e.pdf"]])
+def test_template_matches_etree(xml_path, filenames):
+    generator._XML_TEMPLATES.clear()
+    expected = generator._render_fragments_etree(xml_path, FIELDS, filenames)
+    assert generator._render_fragments_template(xml_path, FIELDS, filenames) == expected
+    assert len(expected) == len(filenames) + 1
+
+
+def test_template_records_match_etree_records(base_xml):
+    records = {}
+    for backend in sorted(generator.XML_BACKENDS):
+        result = generator.generate_and_update(3, base_xml, None, 0, seed=7, fixed_time=FIXED_TIME, xml_backend=backend,
+                                               no_attachments_percent=0, attachments_total_mb=0.3,
+                                               attachment_max_mb=0.2)
+        assert result[6] >= 1  # attachment_count
+        records[backend] = result[1].getvalue()
+    assert records["template"] == records["etree"]